@@ -2,11 +2,20 @@ from datetime import datetime
 
 
 class KeyWord:
+    __slots__ = ('id', 'keyword', 'type', 'created_at')
+
     def __init__(self, keyword: str, type: str = 'keyword'):
         self.id = None
         self.keyword = keyword
         self.type = type
         self.created_at = datetime.now()
 
+    def __setstate__(self, state):
+        # 旧版 pickle 里的 KeyWord 带 __dict__，状态是普通字典
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __repr__(self):
         return f"KeyWord(id={self.id}, keyword='{self.keyword}', type='{self.type}', created_at={self.created_at})"
\ No newline at end of file
@@ -222,6 +222,17 @@ class MySQLKeywordDBPool:
                         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
                     ''')
                     
+                    # 关键词变更日志：seq 单调递增，运行中的匹配器按序号增量同步
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS keyword_changes (
+                            seq BIGINT AUTO_INCREMENT PRIMARY KEY,
+                            op VARCHAR(10) NOT NULL,
+                            keyword VARCHAR(255) NULL,
+                            type VARCHAR(50) NOT NULL DEFAULT 'keyword',
+                            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+                    ''')
+
                     # 创建检测记录表
                     cursor.execute('''
                         CREATE TABLE IF NOT EXISTS detection_records (
@@ -308,6 +319,14 @@ class MySQLKeywordDBPool:
             print(f"连接测试失败: {e}")
         return False
 
+    @staticmethod
+    def _log_change(cursor, op: str, keyword: str = None, keyword_type: str = 'keyword'):
+        """在同一事务中写入一条变更日志（op: add / remove / clear）"""
+        cursor.execute(
+            "INSERT INTO keyword_changes (op, keyword, type) VALUES (%s, %s, %s)",
+            (op, keyword, keyword_type)
+        )
+
     def add_keyword(self, keyword: str, keyword_type: str = 'keyword') -> bool:
         """
         添加一个违规关键词
@@ -325,8 +344,11 @@ class MySQLKeywordDBPool:
                         "INSERT IGNORE INTO keywords (keyword, type) VALUES (%s, %s)",
                         (keyword, keyword_type)
                     )
+                    added = cursor.rowcount > 0
+                    if added:
+                        self._log_change(cursor, 'add', keyword, keyword_type)
                     conn.commit()
-                    return cursor.rowcount > 0
+                    return added
         except Exception as e:
             print(f"添加关键词失败: {e}")
             return False
@@ -350,6 +372,7 @@ class MySQLKeywordDBPool:
                             (keyword, keyword_type)
                         )
                         if cursor.rowcount > 0:
+                            self._log_change(cursor, 'add', keyword, keyword_type)
                             count += 1
                     conn.commit()
         except Exception as e:
@@ -369,8 +392,11 @@ class MySQLKeywordDBPool:
             with self.connection_pool.get_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute("DELETE FROM keywords WHERE keyword = %s", (keyword,))
+                    removed = cursor.rowcount > 0
+                    if removed:
+                        self._log_change(cursor, 'remove', keyword)
                     conn.commit()
-                    return cursor.rowcount > 0
+                    return removed
         except Exception as e:
             print(f"删除关键词失败: {e}")
             return False
@@ -445,12 +471,57 @@ class MySQLKeywordDBPool:
             with self.connection_pool.get_connection() as conn:
                 with conn.cursor() as cursor:
                     cursor.execute("DELETE FROM keywords")
+                    self._log_change(cursor, 'clear')
                     conn.commit()
                     return True
         except Exception as e:
             print(f"清空关键词失败: {e}")
             return False
 
+    def get_keyword_changes(self, after_seq: int = 0, limit: int = 1000) -> List[Tuple[int, str, str, str]]:
+        """
+        获取指定序号之后的关键词变更
+        :param after_seq: 已应用到的序号
+        :param limit: 单次最多返回的条数
+        :return: [(seq, op, keyword, type), ...]，按 seq 升序
+        """
+        try:
+            if not self.connection_pool:
+                return []
+
+            with self.connection_pool.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT seq, op, keyword, type FROM keyword_changes WHERE seq > %s ORDER BY seq LIMIT %s",
+                        (after_seq, limit)
+                    )
+                    rows = cursor.fetchall()
+                    # 结束只读事务，下次轮询才能看到新提交的变更
+                    conn.commit()
+                    return rows
+        except Exception as e:
+            print(f"查询关键词变更失败: {e}")
+            return []
+
+    def get_latest_change_seq(self) -> int:
+        """
+        获取当前最新的变更序号（全量加载前记下，加载期间的变更之后增量补上）
+        :return: 最新序号，没有变更时为 0
+        """
+        try:
+            if not self.connection_pool:
+                return 0
+
+            with self.connection_pool.get_connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM keyword_changes")
+                    seq = cursor.fetchone()[0]
+                    conn.commit()
+                    return seq
+        except Exception as e:
+            print(f"查询最新变更序号失败: {e}")
+            return 0
+
     def add_detection_record(self, user_name: str, message: str, matched_keywords: List[Dict]) -> bool:
         """
         添加检测记录
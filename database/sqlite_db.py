@@ -33,6 +33,16 @@ class KeywordDB:
                     created_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
                 )
             ''')
+            # 关键词变更日志：seq 单调递增，运行中的匹配器按序号增量同步
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS keyword_changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op TEXT NOT NULL,
+                    keyword TEXT,
+                    type TEXT NOT NULL DEFAULT 'keyword',
+                    changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+                )
+            ''')
             conn.commit()
 
     def _get_conn(self) -> sqlite3.Connection:
@@ -41,6 +51,11 @@ class KeywordDB:
         # 但我们在单例中不共享连接，每次操作都新建或使用线程局部连接
         return sqlite3.connect(self.db_path, check_same_thread=False)
 
+    @staticmethod
+    def _log_change(cursor, op: str, keyword: Optional[str] = None):
+        """在同一事务中写入一条变更日志（op: add / remove / clear）"""
+        cursor.execute("INSERT INTO keyword_changes (op, keyword) VALUES (?, ?)", (op, keyword))
+
     def add_keyword(self, keyword: str) -> bool:
         """
         添加一个违规关键词。
@@ -51,7 +66,10 @@ class KeywordDB:
             with self._get_conn() as conn:
                 cursor = conn.cursor()
                 cursor.execute("INSERT OR IGNORE INTO keywords (keyword) VALUES (?)", (keyword,))
-                return cursor.rowcount > 0
+                if cursor.rowcount > 0:
+                    self._log_change(cursor, 'add', keyword)
+                    return True
+                return False
         except Exception as e:
             print(f"添加关键词失败: {e}")
             return False
@@ -69,6 +87,7 @@ class KeywordDB:
                 for kw in keywords:
                     cursor.execute("INSERT OR IGNORE INTO keywords (keyword) VALUES (?)", (kw,))
                     if cursor.rowcount > 0:
+                        self._log_change(cursor, 'add', kw)
                         count += 1
                 conn.commit()
         except Exception as e:
@@ -85,7 +104,10 @@ class KeywordDB:
             with self._get_conn() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM keywords WHERE keyword = ?", (keyword,))
-                return cursor.rowcount > 0
+                if cursor.rowcount > 0:
+                    self._log_change(cursor, 'remove', keyword)
+                    return True
+                return False
         except Exception as e:
             print(f"删除关键词失败: {e}")
             return False
@@ -145,11 +167,44 @@ class KeywordDB:
             with self._get_conn() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM keywords")
+                self._log_change(cursor, 'clear')
                 return True
         except Exception as e:
             print(f"清空关键词失败: {e}")
             return False
 
+    def get_keyword_changes(self, after_seq: int = 0, limit: int = 1000) -> List[Tuple[int, str, Optional[str], str]]:
+        """
+        获取指定序号之后的关键词变更。
+        :param after_seq: 已应用到的序号
+        :param limit: 单次最多返回的条数
+        :return: [(seq, op, keyword, type), ...]，按 seq 升序
+        """
+        try:
+            with self._get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT seq, op, keyword, type FROM keyword_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                    (after_seq, limit))
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"查询关键词变更失败: {e}")
+            return []
+
+    def get_latest_change_seq(self) -> int:
+        """
+        获取当前最新的变更序号（全量加载前记下，加载期间的变更之后增量补上）。
+        :return: 最新序号，没有变更时为 0
+        """
+        try:
+            with self._get_conn() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM keyword_changes")
+                return cursor.fetchone()[0]
+        except Exception as e:
+            print(f"查询最新变更序号失败: {e}")
+            return 0
+
     def close(self):
         """
         关闭数据库连接（可选，SQLite 通常不需要显式关闭）
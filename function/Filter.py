@@ -1,20 +1,76 @@
 import ahocorasick
+import json
+import os
+from bisect import bisect_right
 import pickle
 import re
+import sys
+import threading
+from array import array
 from datetime import datetime
-from typing import List, Generator, Optional, Tuple, Union, Dict, Any
+from time import perf_counter
+from typing import List, Generator, NamedTuple, Optional, Tuple, Union, Dict, Any
 from dataclasses import dataclass
-# 导入RapidFuzz库
-from rapidfuzz import fuzz, process
+from itertools import accumulate
+from cachetools import LRUCache
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from function.combo_rules import TERM_ID_BASE, CombinationRule, ComboIndex
+from function.fuzzy_index import FuzzyIndex
+from function.layered_automaton import LayeredAutomaton
+from function.match_stats import MatchStats
+from function.matcher_artifact import Artifact, ArtifactError, is_artifact, write_artifact
+from function.pinyin_index import PinyinIndex
+from function.regex_guard import REGEX_TIME_BUDGET, RegexGuard, has_nested_quantifier
+from function.regex_prefilter import RegexPrefilter
+from function.text_normalizer import NormalizedText, TextNormalizer
+
+# 批量搜索时拼接消息用的分隔符，不会出现在关键词中
+MESSAGE_SEPARATOR = '\x00'
+
+# search_many 结果缓存的默认条数
+MATCH_CACHE_SIZE = 50000
+
+# 批量搜索的消息条数不少于该值时，模糊匹配改用批量打分（FuzzyIndex.search_many）
+FUZZY_BATCH_MIN_MESSAGES = 256
+
+# apply_changes 增量叠加的关键词增删累计超过该值时整体重建自动机
+LAYER_MAX_CHANGES = 2000
+
+
+# 紧凑结果中的命中类型
+KIND_EXACT = 0
+KIND_REGEX = 1
+KIND_FUZZY = 2
+KIND_PINYIN = 3
+KIND_COMBO = 4
+
+# 豁免短语在自动机中的值标记（代替关键词ID）；组合规则词项的标记见 combo_rules.TERM_ID_BASE
+EXEMPT_ID = -1
+
+
+def iter_hits(automaton: ahocorasick.Automaton, text: str):
+    """自动机在 text 上的全部命中；没有任何词时自动机处于未构建状态，iter 会抛异常，这里返回空"""
+    return automaton.iter(text) if automaton.kind == ahocorasick.AHOCORASICK else ()
+
 
 # 保持你原有的 KeyWord 类
 class KeyWord:
+    __slots__ = ('id', 'keyword', 'type', 'created_at')
+
     def __init__(self, keyword: str, type: str = 'keyword'):
         self.id = None
         self.keyword = keyword
         self.type = type
         self.created_at = datetime.now()
 
+    def __setstate__(self, state):
+        # 旧版 pickle 里的 KeyWord 带 __dict__，状态是普通字典
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def __repr__(self):
         return f"KeyWord(id={self.id}, keyword='{self.keyword}', type='{self.type}', created_at={self.created_at})"
 
@@ -22,16 +78,168 @@ class KeyWord:
 @dataclass
 class MatchResult:
     """统一的匹配结果结构"""
+    __slots__ = ('start', 'end', 'keyword', 'match_type')
     start: int
     end: int
     keyword: Union[KeyWord, str]  # KeyWord 或 正则 pattern 字符串
     match_type: str  # 'exact', 'regex', 'fuzzy'
 
 
+class Verdict(NamedTuple):
+    """verdict() 的结果：是否违规、最严重命中的类型、关键词ID（正则命中时为 None）"""
+    hit: bool
+    type: Optional[str] = None
+    keyword_id: Optional[int] = None
+
+
+NO_VIOLATION = Verdict(False)
+
+
+class _KeywordTable:
+    """
+    关键词表（列式存储），各列直接以关键词ID为下标，不需要 ID -> 行号的映射
+    关键词文本经过 sys.intern，与相同的匹配形式共用一个字符串对象；类型存为类型表的下标，
+    创建时间存为时间戳；删除只把该位置的文本置为 None（ID 不会复用）
+    KeyWord 对象只在需要时由 make() 创建
+    """
+    __slots__ = ('words', 'type_codes', 'created', 'types', '_type_code_of', '_count')
+
+    def __init__(self, words: Optional[List[Optional[str]]] = None, type_codes: Optional[array] = None,
+                 created: Optional[array] = None, types: Optional[List[str]] = None):
+        self.words: List[Optional[str]] = words if words is not None else []
+        self.type_codes = type_codes if type_codes is not None else array('H')
+        self.created = created if created is not None else array('d')
+        self.types: List[str] = types if types is not None else []
+        self._type_code_of = {kw_type: code for code, kw_type in enumerate(self.types)}
+        self._count = len(self.words) - self.words.count(None)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, keyword_id: int) -> bool:
+        return 0 <= keyword_id < len(self.words) and self.words[keyword_id] is not None
+
+    def add(self, keyword_id: int, word: str, kw_type: str, created: float):
+        """追加关键词，ID 必须大于已有的全部 ID"""
+        code = self._type_code_of.get(kw_type)
+        if code is None:
+            code = self._type_code_of[kw_type] = len(self.types)
+            self.types.append(kw_type)
+        gap = keyword_id - len(self.words)
+        if gap > 0:
+            # 加载的规则文件里末尾的关键词已被删除时，next_id 会超出表长
+            self.words.extend([None] * gap)
+            self.type_codes.extend([0] * gap)
+            self.created.extend([0.0] * gap)
+        self.words.append(sys.intern(word))
+        self.type_codes.append(code)
+        self.created.append(created)
+        self._count += 1
+
+    def remove(self, keyword_id: int):
+        self.words[keyword_id] = None
+        self._count -= 1
+
+    def ids(self) -> Generator[int, None, None]:
+        for keyword_id, word in enumerate(self.words):
+            if word is not None:
+                yield keyword_id
+
+    def items(self) -> Generator[Tuple[int, str], None, None]:
+        """(关键词ID, 关键词文本)，按 ID 顺序"""
+        for keyword_id, word in enumerate(self.words):
+            if word is not None:
+                yield keyword_id, word
+
+    def type_of(self, keyword_id: int) -> str:
+        return self.types[self.type_codes[keyword_id]]
+
+    def make(self, keyword_id: int) -> Optional[KeyWord]:
+        if keyword_id not in self:
+            return None
+        kw = KeyWord.__new__(KeyWord)  # 跳过 __init__ 中的 datetime.now()
+        kw.id = keyword_id
+        kw.keyword = self.words[keyword_id]
+        kw.type = self.types[self.type_codes[keyword_id]]
+        created = self.created[keyword_id]
+        kw.created_at = datetime.fromtimestamp(created) if created else None
+        return kw
+
+    def copy(self) -> '_KeywordTable':
+        return _KeywordTable(self.words[:], array('H', self.type_codes), array('d', self.created), self.types[:])
+
+
+class _LazyKeywordIndex(dict):
+    """ID -> KeyWord 映射，首次访问时才从关键词表创建对象"""
+
+    def __init__(self, table: _KeywordTable):
+        super().__init__()
+        self.table = table
+
+    def __missing__(self, keyword_id):
+        kw = self.table.make(keyword_id)
+        if kw is None:
+            raise KeyError(keyword_id)
+        self[keyword_id] = kw
+        return kw
+
+
+class _ExemptSpans:
+    """一条消息（或一个扫描缓冲区）里豁免短语命中的区间，判断一个命中是否被某个区间完整覆盖"""
+    __slots__ = ('starts', 'reach')
+
+    def __init__(self, spans: List[Tuple[int, int]]):
+        spans = sorted(spans)
+        self.starts = [start for start, _ in spans]
+        # 起点不超过第 i 个区间起点的所有区间里最远的终点
+        self.reach = list(accumulate((end for _, end in spans), max))
+
+    def covers(self, start: int, end: int) -> bool:
+        i = bisect_right(self.starts, start) - 1
+        return i >= 0 and self.reach[i] >= end
+
+
+class _MatcherSnapshot:
+    """
+    一次构建的只读结果，搜索全程只读同一个快照
+    编辑只改匹配器上的构建状态，build() 生成新快照后整体替换引用
+    """
+    __slots__ = ('version', 'automaton', 'keywords', 'id_to_keyword', 'normalizer',
+                 'regex_patterns', 'regex_prefilter', 'regex_guard', 'fuzzy_index', 'pinyin_index', 'max_distance',
+                 'type_masks', 'regex_masks', 'combos', 'combo_masks', 'tagged')
+
+    def __init__(self, version: int, automaton, id_to_keyword: _LazyKeywordIndex, normalizer: TextNormalizer,
+                 regex_patterns: Tuple[Tuple[re.Pattern, str], ...], regex_prefilter: RegexPrefilter,
+                 fuzzy_index: Optional[FuzzyIndex], pinyin_index: Optional[PinyinIndex], max_distance: int,
+                 categories: Dict[str, int], regex_guard: RegexGuard, exempt: bool = False,
+                 combos: Optional[ComboIndex] = None):
+        self.version = version
+        self.automaton = automaton
+        self.keywords = id_to_keyword.table
+        self.id_to_keyword = id_to_keyword
+        self.normalizer = normalizer
+        self.regex_patterns = regex_patterns
+        # 类别位掩码：关键词按类型下标（关键词表的 type_codes）取，正则按规则下标取
+        self.type_masks = tuple(categories.get(kw_type, 0) for kw_type in self.keywords.types)
+        self.regex_masks = tuple(categories.get(r_type, 0) for _, r_type in regex_patterns)
+        self.regex_prefilter = regex_prefilter
+        # 耗时统计和隔离状态不随快照复制，同一套规则的各个快照共用一个
+        self.regex_guard = regex_guard
+        self.fuzzy_index = fuzzy_index
+        self.pinyin_index = pinyin_index
+        self.max_distance = max_distance
+        self.combos = combos
+        self.combo_masks = tuple(categories.get(rule.type, 0) for rule in combos.rules) if combos else ()
+        # 自动机里是否有关键词以外的条目（豁免短语、组合规则词项），没有时扫描结果不需要区分
+        self.tagged = exempt or combos is not None
+
+
 class KeywordMatcher:
     """
     增强版单例关键词匹配器
     支持：精确匹配、正则、模糊匹配、持久化
+    增删关键词只修改构建状态，build()/build_async() 编译出新快照后原子替换，
+    监控线程正在进行的搜索继续使用旧快照
     """
     _instance = None
     _initialized = False
@@ -45,85 +253,493 @@ class KeywordMatcher:
         if self._initialized:
             return
 
-        self._keywords: List[KeyWord] = []
+        self._table = _KeywordTable()  # 关键词表（列式），KeyWord 对象按需创建
         self._keyword_to_id = {}
-        self._id_to_keyword = {}
+        self._id_to_keyword = _LazyKeywordIndex(self._table)
         self._next_id = 0
-        self._automaton = ahocorasick.Automaton()
+        self.change_seq = 0  # 已应用到的关键词变更日志序号，见 keyword_sync
         self._case_sensitive = False
+        # 文本归一化流水线（全角、繁简、零宽字符、分隔符、大小写），关键词与消息使用同一套
+        self._normalizer = TextNormalizer(lowercase=not self._case_sensitive)
 
         # 正则支持
         self._regex_patterns: List[Tuple[re.Pattern, str]] = []  # (compiled_pattern, type)
+        self._regex_prefilter = RegexPrefilter()  # 字面量预过滤，只运行可能命中的正则
+        self._regex_budget: Optional[float] = REGEX_TIME_BUDGET  # 单条正则单次匹配的时间预算（秒）
+        self._regex_guard = RegexGuard(self._regex_budget)  # 每条正则的耗时统计与隔离
 
         # 模糊匹配（编辑距离）
         self._enable_fuzzy = False
         self._fuzzy_keywords = []  # 用于模糊匹配的关键词列表
         self._max_distance = 1
+        self._fuzzy_index = FuzzyIndex(self._max_distance)
+
+        # 拼音/同音字匹配：关键词的拼音投影单独编一个自动机，随关键词一起重建
+        self._enable_pinyin = False
+        self._pinyin_initials = False
+        self._pinyin_index = PinyinIndex()
+
+        # 豁免短语：匹配形式 -> 原文，和关键词编进同一个自动机，完整覆盖某个命中时该命中不报告
+        self._exemptions: Dict[str, str] = {}
+
+        # 组合规则：词项和关键词编进同一个自动机，规则由词项命中求出，随自动机一起重建
+        self._combinations: List[CombinationRule] = []
+        self._combo_index: Optional[ComboIndex] = None
+
+        # 类别（即关键词/正则的类型）-> 位掩码，按首次出现的顺序分配，清空规则也不回收，
+        # 调用方算好的掩码一直有效
+        self._category_bits: Dict[str, int] = {}
+
+        # verdict 的严重程度：类型 -> 非负整数，越大越严重
+        self._type_severity: Dict[str, int] = {}
+        self._default_severity = 1
+        self._verdict_threshold = 1
+
+        # search_many 的消息级结果缓存：消息文本 -> 匹配结果，规则集版本变化时整体失效
+        self._match_cache: Optional[LRUCache] = LRUCache(maxsize=MATCH_CACHE_SIZE)
+        self._cache_lock = threading.Lock()
+        self._cache_version = -1
+        self._cache_generation = 0   # 缓存结果对应的正则隔离状态（RegexGuard.generation）
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+        # 命中计数与分阶段耗时（enable_stats 启用），关闭时为 None
+        self._stats: Optional[MatchStats] = None
+
+        # 快照与并发控制
+        self._edit_lock = threading.RLock()   # 保护构建状态，构建和发布快照也在锁内串行进行
+        self._version = 0                     # 构建状态的版本，每次编辑加一
+        self._keywords_changed = False        # 自上次发布以来关键词是否变化（否则复用自动机）
+        self._table_shared = False            # 关键词表是否已被快照引用（删除前需复制）
+        # apply_changes 的增量叠加：上次整体构建的自动机、当时的下一个ID、之后删掉的旧关键词ID
+        self._layer_base = None
+        self._layer_next_id = 0
+        self._layer_removed = set()
+        self._snapshot = self._empty_snapshot()
 
         self._initialized = True
 
+    def _empty_snapshot(self) -> _MatcherSnapshot:
+        return _MatcherSnapshot(0, ahocorasick.Automaton(), _LazyKeywordIndex(_KeywordTable()), self._normalizer,
+                                (), RegexPrefilter(), None, None, self._max_distance, {}, RegexGuard())
+
+    def _touch(self, keywords_changed: bool = False):
+        """记录一次编辑（调用方需持有 _edit_lock）"""
+        self._version += 1
+        if keywords_changed:
+            self._keywords_changed = True
+
+    @property
+    def _keywords(self) -> List[KeyWord]:
+        """全部关键词对象（按 ID 顺序，调试用；会实例化整张表）"""
+        return [self._id_to_keyword[keyword_id] for keyword_id in self._table.ids()]
+
+    def _category_bit(self, category: str) -> int:
+        bit = self._category_bits.get(category)
+        if bit is None:
+            bit = self._category_bits[category] = 1 << len(self._category_bits)
+        return bit
+
+    def category_mask(self, *categories: str) -> int:
+        """
+        把类别名（关键词/正则的类型）换算成 search(categories=...) 用的位掩码
+        尚未出现过的类别也会分配位，之后添加的该类规则同样受掩码控制
+        """
+        with self._edit_lock:
+            mask = 0
+            for category in categories:
+                mask |= self._category_bit(category)
+            return mask
+
+    def _new_table(self, table: _KeywordTable):
+        self._table = table
+        self._id_to_keyword = _LazyKeywordIndex(table)
+        self._table_shared = False
+
     # ==================== 精确匹配（原有功能） ====================
 
     def set_case_sensitive(self, case_sensitive: bool):
-        if self._case_sensitive != case_sensitive:
+        with self._edit_lock:
+            if self._case_sensitive == case_sensitive:
+                return
             self._case_sensitive = case_sensitive
+            # 换成新的归一化对象，正在使用旧快照的搜索不受影响
+            normalizer = TextNormalizer.from_config(self._normalizer.config())
+            normalizer.lowercase = not case_sensitive
+            self._normalizer = normalizer
             self._rebuild_automaton()
 
-    def add_keyword(self, keyword_obj: KeyWord) -> int:
-        kw = keyword_obj.keyword if self._case_sensitive else keyword_obj.keyword.lower()
-        if kw in self._keyword_to_id:
-            return self._keyword_to_id[kw]
+    def set_normalizer(self, normalizer: TextNormalizer):
+        """替换文本归一化流水线，并按新规则重建自动机"""
+        with self._edit_lock:
+            normalizer.lowercase = not self._case_sensitive
+            self._normalizer = normalizer
+            self._rebuild_automaton()
+
+    def _match_form(self, keyword: str) -> str:
+        """关键词进入自动机前的归一化形式"""
+        return self._normalizer.normalize_keyword(keyword)
 
-        keyword_obj.id = self._next_id
-        self._next_id += 1
+    def add_keyword(self, keyword_obj: KeyWord) -> int:
+        """添加关键词，调用 build()/build_async() 后生效"""
+        with self._edit_lock:
+            kw = sys.intern(self._match_form(keyword_obj.keyword))
+            if kw in self._keyword_to_id:
+                return self._keyword_to_id[kw]
 
-        self._keywords.append(keyword_obj)
-        self._keyword_to_id[kw] = keyword_obj.id
-        self._id_to_keyword[keyword_obj.id] = keyword_obj
+            keyword_obj.id = self._next_id
+            self._next_id += 1
+            self._category_bit(keyword_obj.type)
 
-        word_for_match = keyword_obj.keyword if self._case_sensitive else kw
-        self._automaton.add_word(word_for_match, keyword_obj.id)
+            # 只把各字段写入关键词表，不保留对象本身；正在使用旧快照的搜索不会查到新 ID
+            created = keyword_obj.created_at
+            self._table.add(keyword_obj.id, keyword_obj.keyword, keyword_obj.type,
+                            created.timestamp() if created else 0.0)
+            self._keyword_to_id[kw] = keyword_obj.id
 
-        # 如果启用模糊匹配，也加入模糊词库
-        if self._enable_fuzzy:
-            self._fuzzy_keywords.append(keyword_obj.keyword)
+            # 如果启用模糊匹配，也加入模糊词库
+            if self._enable_fuzzy:
+                self._fuzzy_keywords.append(keyword_obj.keyword)
+                self._fuzzy_index.add(keyword_obj.id, kw)
 
-        return keyword_obj.id
+            self._touch(keywords_changed=True)
+            return keyword_obj.id
 
     def add_keywords(self, keywords: List[KeyWord]) -> List[int]:
-        return [self.add_keyword(kw) for kw in keywords]
+        with self._edit_lock:
+            return [self.add_keyword(kw) for kw in keywords]
+
+    def remove_keyword(self, keyword: Union[int, str]) -> bool:
+        """
+        删除关键词（按 ID 或关键词文本），调用 build()/build_async() 后生效
+        只更新映射和模糊索引的增量，不需要从数据库重新加载
+        :return: 是否找到并删除
+        """
+        return self.remove_keywords([keyword]) > 0
+
+    def remove_keywords(self, keywords: List[Union[int, str]]) -> int:
+        """批量删除，关键词列表只过滤一遍；返回实际删除的数量"""
+        with self._edit_lock:
+            # 字符串按归一化后的匹配形式删除，和 add_keyword 的去重口径一致，异体写法也能删掉
+            forms = {self._match_form(keyword) for keyword in keywords if isinstance(keyword, str)}
+            removed = {keyword for keyword in keywords if not isinstance(keyword, str) and keyword in self._table}
+            removed.update(keyword_id for keyword_id in map(self._keyword_to_id.get, forms) if keyword_id is not None)
+            if forms and len(self._table) > len(self._keyword_to_id):
+                # 归一化规则变过之后同一匹配形式可能对应多条关键词，一并删掉免得留下残余
+                removed.update(keyword_id for keyword_id, word in self._table.items() if self._match_form(word) in forms)
+            if not removed:
+                return 0
+
+            if self._table_shared:
+                # 当前快照还在用这张表查命中的关键词，先复制再删
+                self._new_table(self._table.copy())
+            table = self._table
+            forms.update(self._match_form(table.words[keyword_id]) for keyword_id in removed)
+            for form in forms:
+                if self._keyword_to_id.get(form) in removed:
+                    del self._keyword_to_id[form]
+            for keyword_id in removed:
+                table.remove(keyword_id)
+                if keyword_id < self._layer_next_id:
+                    self._layer_removed.add(keyword_id)
+                self._id_to_keyword.pop(keyword_id, None)
+                if self._enable_fuzzy:
+                    self._fuzzy_index.remove(keyword_id)
+            if self._enable_fuzzy:
+                self._fuzzy_keywords = [word for _, word in table.items()]
+
+            self._touch(keywords_changed=True)
+            return len(removed)
+
+    def clear_keywords(self):
+        """删除全部关键词，保留正则规则和匹配设置；调用 build()/build_async() 后生效"""
+        with self._edit_lock:
+            self._new_table(_KeywordTable())
+            self._keyword_to_id = {}
+            self._fuzzy_keywords = []
+            self._fuzzy_index = FuzzyIndex(self._max_distance)
+            self._touch(keywords_changed=True)
+
+    def apply_changes(self, changes: List[Tuple[str, str, str]], change_seq: Optional[int] = None) -> bool:
+        """
+        整批应用关键词变更并发布一个新快照（不会发布只应用了一半的中间状态）
+        上次构建之后没有别的编辑时，少量增删不重建整个自动机：新增的词另编一个小自动机叠加在上面，
+        删除的词从原自动机的输出中过滤（见 LayeredAutomaton），累计超过 LAYER_MAX_CHANGES 条时再整体重建。
+        启用了拼音匹配或组合规则时它们的索引依赖全部关键词，仍然整体重建
+        :param changes: [(操作, 关键词, 类型), ...]，操作为 'add' / 'remove' / 'clear'
+        :param change_seq: 这批变更对应的变更日志序号
+        :return: 关键词是否有变化
+        """
+        with self._edit_lock:
+            version = self._version
+            layered = self._can_layer() and all(op != 'clear' for op, _, _ in changes)
+            for op, keyword, keyword_type in changes:
+                if op == 'add':
+                    self.add_keyword(KeyWord(keyword, keyword_type or 'keyword'))
+                elif op == 'remove':
+                    self.remove_keyword(keyword)
+                elif op == 'clear':
+                    self.clear_keywords()
+                else:
+                    print(f"未知的关键词变更操作: {op}")
+            if change_seq is not None:
+                self.change_seq = change_seq
+            changed = self._version != version
+            if changed:
+                if not (layered and self._build_layer()):
+                    self.build()
+            return changed
+
+    def _can_layer(self) -> bool:
+        """当前快照的自动机是否正好反映全部关键词，且可以在它上面叠加增量（调用方需持有 _edit_lock）"""
+        if self._keywords_changed or self._layer_base is None or self._enable_pinyin or self._combinations:
+            return False
+        automaton = self._snapshot.automaton
+        if isinstance(automaton, LayeredAutomaton):
+            automaton = automaton.base
+        return automaton is self._layer_base
+
+    def _build_layer(self) -> bool:
+        """
+        发布叠加了增量的快照（调用方需持有 _edit_lock）
+        :return: False 表示增量已超过 LAYER_MAX_CHANGES，应整体重建
+        """
+        if self._next_id - self._layer_next_id + len(self._layer_removed) > LAYER_MAX_CHANGES:
+            return False
+        table = self._table
+        delta = None
+        for keyword_id in range(self._layer_next_id, self._next_id):
+            if keyword_id not in table:
+                continue  # 同一批里加了又删
+            if delta is None:
+                delta = ahocorasick.Automaton()
+            form = self._match_form(table.words[keyword_id])
+            delta.add_word(form, (keyword_id, len(form)))
+        if delta is not None:
+            delta.make_automaton()
+        self._keywords_changed = False
+        self._snapshot = self._compose_snapshot(LayeredAutomaton(self._layer_base, delta, self._layer_removed))
+        return True
+
+    def _index_keywords(self):
+        """按当前归一化规则重新计算全部关键词的匹配形式"""
+        self._keyword_to_id = {}
+        for keyword_id, word in self._table.items():
+            # 归一化后重复的关键词只保留第一个
+            self._keyword_to_id.setdefault(sys.intern(self._match_form(word)), keyword_id)
+        self._exemptions = self._exemption_forms(self._exemptions.values())
+        self._touch(keywords_changed=True)
 
     def _rebuild_automaton(self):
-        self._automaton = ahocorasick.Automaton()
-        for kw in self._keywords:
-            word_for_match = kw.keyword if self._case_sensitive else kw.keyword.lower()
-            self._automaton.add_word(word_for_match, kw.id)
-        self._automaton.make_automaton()
+        self._index_keywords()
+        if self._enable_fuzzy:
+            self._build_fuzzy_index()
+        self.build()
 
     def build(self):
-        self._automaton.make_automaton()
-        if self._enable_fuzzy:
-            # 可以预处理模糊索引（这里简化为线性扫描）
-            pass
+        """
+        把当前构建状态编译成新快照并原子替换
+        关键词没变时直接复用上一个快照的自动机；构建期间搜索照常使用旧快照
+        """
+        with self._edit_lock:
+            if self._keywords_changed:
+                self._prepare_build()
+                automaton = ahocorasick.Automaton()
+                for word_for_match, value in self._automaton_words():
+                    # 自动机的值带上匹配串长度，命中时常数时间算出起点
+                    automaton.add_word(word_for_match, (value, len(word_for_match)))
+                automaton.make_automaton()
+                self._layer_base = automaton
+                self._layer_next_id = self._next_id
+                self._layer_removed = set()
+                self._keywords_changed = False
+            else:
+                automaton = self._snapshot.automaton
+            self._snapshot = self._compose_snapshot(automaton)
+
+    def _prepare_build(self):
+        """关键词、词项或豁免短语变动后重建组合规则索引和拼音索引（调用方需持有 _edit_lock）"""
+        self._combo_index = self._build_combo_index() if self._combinations else None
+        if self._enable_pinyin:
+            self._build_pinyin_index()
+
+    def _automaton_words(self) -> Generator[Tuple[str, int], None, None]:
+        """
+        精确匹配自动机的全部条目 (匹配形式, 关键词ID/标记)，按加入顺序给出，后出现的同一形式覆盖前面的
+        调用方需持有 _edit_lock 并先调用 _prepare_build()；分片匹配器按同样的条目分片
+        """
+        for word_for_match, keyword_id in self._keyword_to_id.items():
+            if word_for_match:
+                yield word_for_match, keyword_id
+        if self._combo_index is not None:
+            # 本身是关键词的词项直接用关键词的条目
+            yield from self._combo_index.automaton_words()
+        # 豁免短语最后加入，与关键词或词项相同时覆盖它们的条目
+        for form in self._exemptions:
+            yield form, EXEMPT_ID
+
+    def _compose_snapshot(self, automaton) -> _MatcherSnapshot:
+        """用当前构建状态和给定的精确匹配自动机生成快照（调用方需持有 _edit_lock）"""
+        self._table_shared = True
+        return _MatcherSnapshot(
+            self._version, automaton, self._id_to_keyword, self._normalizer, tuple(self._regex_patterns),
+            self._regex_prefilter.copy(), self._fuzzy_index.copy() if self._enable_fuzzy else None,
+            self._pinyin_index if self._enable_pinyin else None,
+            self._max_distance, self._category_bits, self._regex_guard, bool(self._exemptions),
+            self._combo_index)
+
+    def build_async(self, callback=None) -> threading.Thread:
+        """
+        在后台线程构建并替换快照，适合监控过程中编辑关键词
+        :param callback: 构建完成后调用，参数为是否成功
+        """
+        def worker():
+            try:
+                self.build()
+                ok = True
+            except Exception as e:
+                print(f"后台构建匹配器失败: {e}")
+                ok = False
+            if callback:
+                callback(ok)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        return thread
+
+    def has_pending_changes(self) -> bool:
+        """是否有尚未构建发布的编辑"""
+        return self._version != self._snapshot.version
+
+    # ==================== 豁免短语 ====================
+
+    def _exemption_forms(self, phrases) -> Dict[str, str]:
+        """豁免短语原文 -> {匹配形式: 原文}，归一化后为空或重复的只保留第一个"""
+        forms: Dict[str, str] = {}
+        for phrase in phrases:
+            form = self._match_form(phrase)
+            if form:
+                forms.setdefault(sys.intern(form), phrase)
+        return forms
+
+    def add_exemptions(self, phrases: List[str]) -> int:
+        """
+        添加豁免短语（"禁止赌博"、自家品牌名等），调用 build()/build_async() 后生效
+        豁免短语和关键词编进同一个自动机，一遍扫描同时找出两者；被某个豁免短语完整覆盖的命中
+        （精确、拼音、正则、模糊）不报告，部分重叠的照常报告
+        :return: 新增的条数
+        """
+        with self._edit_lock:
+            added = 0
+            for form, phrase in self._exemption_forms(phrases).items():
+                if form not in self._exemptions:
+                    self._exemptions[form] = phrase
+                    added += 1
+            if added:
+                self._touch(keywords_changed=True)
+            return added
+
+    def add_exemption(self, phrase: str) -> bool:
+        return self.add_exemptions([phrase]) > 0
+
+    def remove_exemption(self, phrase: str) -> bool:
+        """删除豁免短语，调用 build()/build_async() 后生效；返回是否找到"""
+        with self._edit_lock:
+            if self._exemptions.pop(self._match_form(phrase), None) is None:
+                return False
+            self._touch(keywords_changed=True)
+            return True
+
+    def exemptions(self) -> List[str]:
+        """当前的豁免短语（原文，按添加顺序）"""
+        return list(self._exemptions.values())
+
+    # ==================== 组合规则 ====================
+
+    def add_combination(self, terms: List[str], window: int, type: str = "combination",
+                        ordered: bool = False) -> Optional[int]:
+        """
+        添加组合规则：terms 里的词都出现、且整个组合不超过 window 个字符（归一化后的文本中计）；
+        ordered=True 时还要按给定顺序、互不重叠地出现（"加…信"）
+        代替 "微信.{0,8}转账" 这类回溯的正则：词项编进关键词自动机，规则由同一遍扫描的词项命中线性求出
+        调用 build()/build_async() 后生效
+        :return: 规则下标（用 get_combination 查），参数不合法时打印原因并返回 None
+        """
+        forms = [self._match_form(term) for term in terms]
+        if len(forms) < 2 or not all(forms):
+            print(f"组合规则至少需要两个非空词项: {terms}")
+            return None
+        if not ordered and len(set(forms)) != len(forms):
+            print(f"无序组合规则的词项不能重复: {terms}")
+            return None
+        if window < (sum(map(len, forms)) if ordered else max(map(len, forms))):
+            print(f"组合规则的窗口 {window} 放不下全部词项: {terms}")
+            return None
+        with self._edit_lock:
+            self._category_bit(type)
+            self._combinations.append(CombinationRule(tuple(terms), window, type, ordered))
+            self._touch(keywords_changed=True)
+            return len(self._combinations) - 1
+
+    def get_combination(self, index: int) -> CombinationRule:
+        """按规则下标取当前快照中的组合规则：(词项, 窗口, 类型, 是否有序)"""
+        return self._snapshot.combos.rules[index]
+
+    def _build_combo_index(self) -> ComboIndex:
+        """按当前关键词和归一化规则编号组合规则的词项（调用方需持有 _edit_lock）"""
+        forms = [tuple(sys.intern(self._match_form(term)) for term in rule.terms) for rule in self._combinations]
+        return ComboIndex(self._combinations, forms, self._keyword_to_id)
 
     # ==================== 新增：正则混合匹配 ====================
 
     def add_regex(self, pattern: str, type: str = "regex", flags: int = 0):
-        """添加正则表达式匹配规则"""
+        """添加正则表达式匹配规则，调用 build()/build_async() 后生效"""
         try:
             # 默认添加re.UNICODE标志以更好地支持中文
             compiled_flags = flags | re.UNICODE
             if not self._case_sensitive:
                 compiled_flags |= re.IGNORECASE
             compiled = re.compile(pattern, compiled_flags)
-            self._regex_patterns.append((compiled, type))
+            with self._edit_lock:
+                self._register_regex(compiled, type)
+                self._touch()
         except re.error as e:
             print(f"编译正则表达式失败 '{pattern}': {e}")
 
-    def _search_regex(self, text: str) -> Generator[MatchResult, None, None]:
-        for pattern, r_type in self._regex_patterns:
+    def _register_regex(self, compiled: re.Pattern, r_type: str):
+        """登记一条已编译的正则（调用方需持有 _edit_lock）"""
+        index = len(self._regex_patterns)
+        nested = has_nested_quantifier(compiled.pattern, compiled.flags)
+        if nested:
+            print(f"[正则检查] 规则 #{index} '{compiled.pattern}' 含嵌套量词，在不匹配的输入上可能灾难性回溯")
+        self._category_bit(r_type)
+        self._regex_guard.add_rule(nested)
+        self._prefilter_regex(index, compiled, nested)
+        self._regex_patterns.append((compiled, r_type))
+
+    def _prefilter_regex(self, index: int, compiled: re.Pattern, nested: bool):
+        """
+        把第 index 条正则登记到预过滤（调用方需持有 _edit_lock）
+        组合正则在 RegexGuard 之外运行，不计时也不受预算约束：设了预算时提取不出字面量的规则都单独运行，
+        可疑的规则任何时候都不并入
+        """
+        self._regex_prefilter.add(index, compiled, standalone=nested or self._regex_budget is not None)
+
+    def _search_regex(self, text: str, candidates: Optional[List[Tuple[int, int]]] = None,
+                      snapshot: Optional[_MatcherSnapshot] = None, categories: Optional[int] = None,
+                      stats: Optional[MatchStats] = None) -> Generator[MatchResult, None, None]:
+        if snapshot is None:
+            snapshot = self._snapshot
+        if candidates is None:
+            candidates = snapshot.regex_prefilter.candidates(text)
+        for index, pos in candidates:
+            if categories is not None and not snapshot.regex_masks[index] & categories:
+                continue  # 类别不在范围内的规则不运行
+            pattern, r_type = snapshot.regex_patterns[index]
             try:
-                for match in pattern.finditer(text):
+                for match in snapshot.regex_guard.finditer(index, pattern, text, pos):
+                    if stats is not None:
+                        stats.regex_hits[index] += 1
                     yield MatchResult(
                         start=match.start(),
                         end=match.end() - 1,
@@ -135,146 +751,1090 @@ class KeywordMatcher:
 
     # ==================== 新增：模糊匹配（编辑距离）====================
     def enable_fuzzy_match(self, max_distance: int = 1):
-        """启用模糊匹配功能"""
-        self._enable_fuzzy = True
-        self._max_distance = max_distance
-        # 将现有关键词加入模糊词库
-        self._fuzzy_keywords = [kw.keyword for kw in self._keywords]
-    
-    def _search_fuzzy(self, text: str) -> Generator[MatchResult, None, None]:
-        """使用RapidFuzz在文本中搜索模糊匹配"""
-        if not self._fuzzy_keywords:
+        """启用模糊匹配功能；不超过 max_distance 个字的关键词删字后为空，不参与模糊匹配，只做精确匹配"""
+        with self._edit_lock:
+            self._enable_fuzzy = True
+            self._max_distance = max_distance
+            # 将现有关键词加入模糊词库
+            self._fuzzy_keywords = [word for _, word in self._table.items()]
+            self._build_fuzzy_index()
+            self._touch()
+        self.build()
+
+    def _build_fuzzy_index(self):
+        """按当前关键词重建模糊删除索引"""
+        self._fuzzy_index = FuzzyIndex(self._max_distance)
+        self._fuzzy_index.build([(keyword_id, self._match_form(word)) for keyword_id, word in self._table.items()])
+
+    def _search_fuzzy(self, text: str, normalized: Optional[NormalizedText] = None,
+                      snapshot: Optional[_MatcherSnapshot] = None, categories: Optional[int] = None,
+                      stats: Optional[MatchStats] = None) -> Generator[MatchResult, None, None]:
+        """使用删除索引生成候选窗口，再用RapidFuzz确认相似度"""
+        if snapshot is None:
+            snapshot = self._snapshot
+        if not snapshot.fuzzy_index:
+            return
+
+        if normalized is None:
+            normalized = self._normalize(text, snapshot)
+        score_cutoff = 100 - snapshot.max_distance * 20  # 简单的相似度阈值
+        hits = snapshot.fuzzy_index.search(normalized.text, score_cutoff)
+        yield from self._fuzzy_results(normalized, hits, snapshot, categories, stats)
+
+    @staticmethod
+    def _fuzzy_hits_many(normalized_texts: List[NormalizedText],
+                         snapshot: _MatcherSnapshot) -> List[List[Tuple[int, int, int, float]]]:
+        """批量模糊匹配：消息够多时整批交给 FuzzyIndex.search_many 向量化打分，结果与逐条相同"""
+        score_cutoff = 100 - snapshot.max_distance * 20
+        if len(normalized_texts) >= FUZZY_BATCH_MIN_MESSAGES:
+            return snapshot.fuzzy_index.search_many([normalized.text for normalized in normalized_texts],
+                                                    score_cutoff)
+        return [snapshot.fuzzy_index.search(normalized.text, score_cutoff) for normalized in normalized_texts]
+
+    def _fuzzy_results(self, normalized: NormalizedText, hits: List[Tuple[int, int, int, float]],
+                       snapshot: _MatcherSnapshot, categories: Optional[int] = None,
+                       stats: Optional[MatchStats] = None) -> Generator[MatchResult, None, None]:
+        type_masks = snapshot.type_masks
+        type_codes = snapshot.keywords.type_codes
+        for start, end, keyword_id, score in hits:
+            if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                continue
+            if stats is not None:
+                stats.keyword_hits[keyword_id] += 1
+            start, end = normalized.span(start, end)
+            yield MatchResult(
+                start=start,
+                end=end,
+                keyword=snapshot.keywords.words[keyword_id],
+                match_type='fuzzy'
+            )
+
+    # ==================== 拼音/同音字匹配 ====================
+    def enable_pinyin_match(self, initials: bool = False):
+        """
+        启用拼音/同音字匹配：关键词的拼音投影编进第二个自动机，每条消息多扫描一遍
+        :param initials: 同时匹配消息中直接打出的首字母缩写（至少 3 个字的关键词）
+        """
+        with self._edit_lock:
+            self._enable_pinyin = True
+            self._pinyin_initials = initials
+            self._build_pinyin_index()
+            self._touch()
+        self.build()
+
+    def _build_pinyin_index(self):
+        """按当前关键词的匹配形式重建拼音自动机（调用方需持有 _edit_lock）"""
+        index = PinyinIndex(self._pinyin_initials)
+        index.build((keyword_id, form) for form, keyword_id in self._keyword_to_id.items())
+        self._pinyin_index = index
+
+    def _pinyin_hits(self, normalized: NormalizedText, snapshot: _MatcherSnapshot, categories: Optional[int] = None,
+                     stats: Optional[MatchStats] = None) -> Generator[Tuple[int, int, int], None, None]:
+        """拼音命中 (起点, 终点, 关键词ID)，位置在归一化文本中；原样出现的关键词已由精确匹配报告，这里跳过"""
+        hits = snapshot.pinyin_index.search(normalized.text)
+        if not hits:
             return
-        
-        # 将文本分割成单词进行模糊匹配
-        words = text.split()
-        for i, word in enumerate(words):
-            for keyword in self._fuzzy_keywords:
-                # 计算编辑距离
-                distance = fuzz.ratio(word, keyword)
-                if distance >= (100 - self._max_distance * 20):  # 简单的相似度阈值
-                    # 找到在原文中的位置
-                    start_pos = text.find(word)
-                    if start_pos != -1:
-                        yield MatchResult(
-                            start=start_pos,
-                            end=start_pos + len(word) - 1,
-                            keyword=keyword,
-                            match_type='fuzzy'
-                        )
+        type_masks = snapshot.type_masks
+        keywords = snapshot.keywords
+        normalize_keyword = snapshot.normalizer.normalize_keyword
+        for start, end, keyword_id in hits:
+            if categories is not None and not type_masks[keywords.type_codes[keyword_id]] & categories:
+                continue
+            if normalized.text[start:end + 1] == normalize_keyword(keywords.words[keyword_id]):
+                continue
+            if stats is not None:
+                stats.keyword_hits[keyword_id] += 1
+            yield start, end, keyword_id
+
+    def _search_pinyin(self, normalized: NormalizedText, snapshot: _MatcherSnapshot, categories: Optional[int] = None,
+                       stats: Optional[MatchStats] = None) -> Generator[MatchResult, None, None]:
+        for start, end, keyword_id in self._pinyin_hits(normalized, snapshot, categories, stats):
+            start, end = normalized.span(start, end)
+            yield MatchResult(
+                start=start,
+                end=end,
+                keyword=snapshot.id_to_keyword[keyword_id],
+                match_type='pinyin'
+            )
+
+    # ==================== 违规判定 ====================
+
+    def set_severity(self, severity: Dict[str, int], default: int = 1, threshold: Optional[int] = None):
+        """
+        设置各类型的严重程度（非负整数，越大越严重）
+        :param severity: 类型 -> 严重程度，关键词类型与正则类型共用
+        :param default: 未列出类型的严重程度
+        :param threshold: verdict() 遇到不低于该值的命中立即返回
+        """
+        self._type_severity = dict(severity)
+        self._default_severity = default
+        if threshold is not None:
+            self._verdict_threshold = threshold
+
+    def verdict(self, text: str, min_severity: Optional[int] = None, categories: Optional[int] = None) -> Verdict:
+        """
+        只判断是否违规，不收集全部命中
+        按开销从低到高执行 精确（含组合规则）→ 拼音 → 正则（字面量预过滤）→ 模糊，遇到严重程度达到阈值的命中立即返回；
+        都没达到阈值时返回最严重的命中
+        :param min_severity: 本次使用的阈值，默认用 set_severity 设置的值
+        :param categories: 只考虑这些类别（category_mask 的结果），默认全部
+        """
+        snapshot = self._snapshot
+        severity = self._type_severity
+        default = self._default_severity
+        threshold = self._verdict_threshold if min_severity is None else min_severity
+        top_level = max([default, *severity.values()])  # 达到它就不可能更严重了
+        best = NO_VIOLATION
+        best_level = -1
+
+        # 1. 精确匹配：类型直接从关键词表的列里取，不创建 KeyWord 对象
+        normalized = snapshot.normalizer.normalize(text)
+        types = snapshot.keywords.types
+        type_codes = snapshot.keywords.type_codes
+        type_masks = snapshot.type_masks
+        exact_hits = iter_hits(snapshot.automaton, normalized.text)
+        exempt = None
+        combo_hits = ()
+        if snapshot.tagged:
+            exact_hits, spans, combo_hits = self._split_hits(exact_hits, snapshot)
+            if spans:
+                exempt = self._exempt_by_message(spans, [0], [normalized])[0]
+        for _, (keyword_id, _) in exact_hits:
+            code = type_codes[keyword_id]
+            if categories is not None and not type_masks[code] & categories:
+                continue
+            kw_type = types[code]
+            level = severity.get(kw_type, default)
+            if level >= threshold:
+                return Verdict(True, kw_type, keyword_id)
+            if level > best_level:
+                best, best_level = Verdict(True, kw_type, keyword_id), level
+        # 组合规则：词项已在上面同一遍扫描里求值，没有关键词ID
+        for _, _, rule_index in combo_hits:
+            if categories is not None and not snapshot.combo_masks[rule_index] & categories:
+                continue
+            r_type = snapshot.combos.rules[rule_index].type
+            level = severity.get(r_type, default)
+            if level >= threshold:
+                return Verdict(True, r_type, None)
+            if level > best_level:
+                best, best_level = Verdict(True, r_type, None), level
+        if best_level >= top_level:
+            return best
+
+        # 拼音/同音字：又一遍线性扫描，命中同样按关键词类型定级
+        if snapshot.pinyin_index is not None:
+            for start, end, keyword_id in self._pinyin_hits(normalized, snapshot, categories):
+                if exempt is not None and exempt.covers(*normalized.span(start, end)):
+                    continue
+                kw_type = types[type_codes[keyword_id]]
+                level = severity.get(kw_type, default)
+                if level >= threshold:
+                    return Verdict(True, kw_type, keyword_id)
+                if level > best_level:
+                    best, best_level = Verdict(True, kw_type, keyword_id), level
+            if best_level >= top_level:
+                return best
+
+        # 2. 正则：只运行预过滤选出的规则，严重的类型先跑
+        candidates = snapshot.regex_prefilter.candidates(text)
+        if candidates:
+            patterns = snapshot.regex_patterns
+            candidates.sort(key=lambda c: -severity.get(patterns[c[0]][1], default))
+            for index, pos in candidates:
+                if categories is not None and not snapshot.regex_masks[index] & categories:
+                    continue
+                pattern, r_type = patterns[index]
+                level = severity.get(r_type, default)
+                if level <= best_level:
+                    break  # 剩下的规则都不会比已有命中更严重
+                try:
+                    if exempt is None:
+                        found = snapshot.regex_guard.search(index, pattern, text, pos)
+                    else:
+                        found = next((match for match in snapshot.regex_guard.finditer(index, pattern, text, pos)
+                                      if not exempt.covers(match.start(), match.end() - 1)), None)
+                except Exception as e:
+                    print(f"正则 {pattern.pattern} 匹配出错: {e}")
+                    continue
+                if found:
+                    if level >= threshold:
+                        return Verdict(True, r_type, None)
+                    best, best_level = Verdict(True, r_type, None), level
+                    break
+        if best_level >= top_level:
+            return best
+
+        # 3. 模糊匹配（最慢，放在最后）
+        if snapshot.fuzzy_index is not None:
+            score_cutoff = 100 - snapshot.max_distance * 20
+            for start, end, keyword_id, _ in snapshot.fuzzy_index.iter_hits(normalized.text, score_cutoff):
+                code = type_codes[keyword_id]
+                if categories is not None and not type_masks[code] & categories:
+                    continue
+                if exempt is not None and exempt.covers(*normalized.span(start, end)):
+                    continue
+                kw_type = types[code]
+                level = severity.get(kw_type, default)
+                if level >= threshold:
+                    return Verdict(True, kw_type, keyword_id)
+                if level > best_level:
+                    best, best_level = Verdict(True, kw_type, keyword_id), level
+        return best
 
     # ==================== 新增：持久化 ====================
 
     def save(self, filepath: str):
-        """保存整个 matcher 状态到文件"""
-        state = {
-            'keywords': self._keywords,
-            'keyword_to_id': self._keyword_to_id,
-            'id_to_keyword': self._id_to_keyword,
+        """
+        保存为编译后的规则文件：带版本号和内容哈希的文件头、紧凑的关键词表、已构建好的自动机
+        加载时直接反序列化自动机，不再逐个 add_word + make_automaton
+        """
+        with self._edit_lock:
+            if isinstance(self._snapshot.automaton, LayeredAutomaton):
+                # 叠加的增量不能直接序列化，先整体重建
+                self._keywords_changed = True
+                self.build()
+            elif self.has_pending_changes():
+                self.build()
+            self._save_compiled(filepath, self._snapshot.automaton)
+
+    def _save_compiled(self, filepath: str, automaton):
+        table = self._table
+        ids = array('i')
+        type_codes = array('H')
+        created = array('d')
+        offsets = array('I', [0])
+        match_offsets = array('I', [0])
+        words: List[str] = []
+        match_words: List[str] = []
+        pos = match_pos = 0
+        for keyword_id, word in table.items():
+            ids.append(keyword_id)
+            type_codes.append(table.type_codes[keyword_id])
+            created.append(table.created[keyword_id])
+            words.append(word)
+            pos += len(word)
+            offsets.append(pos)
+            match_form = self._match_form(word)
+            match_words.append(match_form)
+            match_pos += len(match_form)
+            match_offsets.append(match_pos)
+
+        meta = {
+            'byteorder': sys.byteorder,
             'next_id': self._next_id,
+            'change_seq': self.change_seq,
             'case_sensitive': self._case_sensitive,
+            'normalizer': self._normalizer.config(),
             'regex_patterns': [(p.pattern, t, p.flags) for p, t in self._regex_patterns],
             'enable_fuzzy': self._enable_fuzzy,
             'max_distance': self._max_distance,
+            'enable_pinyin': self._enable_pinyin,
+            'pinyin_initials': self._pinyin_initials,
+            'exemptions': list(self._exemptions.values()),
+            'combinations': [list(rule) for rule in self._combinations],
+            'severity': {
+                'types': self._type_severity,
+                'default': self._default_severity,
+                'threshold': self._verdict_threshold,
+            },
+            'types': table.types,
+            'categories': list(self._category_bits),
         }
-        with open(filepath, 'wb') as f:
-            pickle.dump(state, f)
+        write_artifact(filepath, len(table), {
+            'meta': json.dumps(meta, ensure_ascii=False).encode('utf-8'),
+            'ids': ids,
+            'type_codes': type_codes,
+            'created_at': created,
+            # 关键词原文/归一化形式各拼成一个串，偏移以字符计，整串解码一次后切片
+            'kw_offsets': offsets,
+            'kw_text': ''.join(words).encode('utf-8'),
+            'match_offsets': match_offsets,
+            'match_text': ''.join(match_words).encode('utf-8'),
+            'automaton': pickle.dumps(automaton, protocol=pickle.HIGHEST_PROTOCOL),
+        })
 
     def load(self, filepath: str):
-        """从文件加载 matcher 状态"""
+        """从文件加载 matcher 状态（自动识别编译后的规则文件和旧版 pickle）"""
+        with self._edit_lock:
+            if is_artifact(filepath):
+                self._load_compiled(filepath)
+            else:
+                self._load_pickle(filepath)
+
+    def _load_compiled(self, filepath: str):
+        with Artifact(filepath) as artifact:
+            meta = json.loads(bytes(artifact.section('meta')).decode('utf-8'))
+            if meta['byteorder'] != sys.byteorder:
+                raise ArtifactError("规则文件由不同字节序的机器生成，请重新编译")
+            ids = artifact.array('ids', 'i').tolist()
+            type_codes = array('H', artifact.array('type_codes', 'H'))
+            created = array('d', artifact.array('created_at', 'd'))
+            offsets = artifact.array('kw_offsets', 'I').tolist()
+            match_offsets = artifact.array('match_offsets', 'I').tolist()
+            text = str(artifact.section('kw_text'), 'utf-8')
+            match_text = str(artifact.section('match_text'), 'utf-8')
+            automaton = pickle.loads(artifact.section('automaton'))
+
+        intern = sys.intern
+        words = [intern(text[a:b]) for a, b in zip(offsets, offsets[1:])]
+        match_words = [intern(match_text[a:b]) for a, b in zip(match_offsets, match_offsets[1:])]
+        if ids == list(range(len(ids))):
+            # ID 连续（没有删除过关键词，最常见）：各列直接作为按 ID 下标的列
+            table = _KeywordTable(words, type_codes, created, meta['types'])
+        else:
+            table = _KeywordTable(types=meta['types'])
+            for row, keyword_id in enumerate(ids):
+                table.add(keyword_id, words[row], meta['types'][type_codes[row]], created[row])
+
+        # 关键词对象按需创建，加载只需要反序列化自动机和几个数组
+        self._new_table(table)
+        for category in meta.get('categories', []) + meta['types']:
+            self._category_bit(category)
+        # 反向 zip 让归一化后重复的关键词保留第一个，与 _index_keywords 一致
+        self._keyword_to_id = dict(zip(reversed(match_words), reversed(ids)))
+        self._next_id = meta['next_id']
+        self.change_seq = meta.get('change_seq', 0)
+        self._case_sensitive = meta['case_sensitive']
+        self._normalizer = TextNormalizer.from_config(meta['normalizer'])
+        self._normalizer.lowercase = not self._case_sensitive
+        self._enable_fuzzy = meta['enable_fuzzy']
+        self._max_distance = meta['max_distance']
+        self._enable_pinyin = meta.get('enable_pinyin', False)
+        self._pinyin_initials = meta.get('pinyin_initials', False)
+        # 豁免短语已在自动机里，这里只恢复构建状态
+        self._exemptions = self._exemption_forms(meta.get('exemptions', []))
+        # 词项编号由规则和关键词确定性地算出，与存进规则文件的自动机一致
+        self._combinations = [CombinationRule(tuple(terms), window, r_type, ordered)
+                              for terms, window, r_type, ordered in meta.get('combinations', [])]
+        self._combo_index = self._build_combo_index() if self._combinations else None
+        severity = meta.get('severity', {})
+        self._type_severity = severity.get('types', {})
+        self._default_severity = severity.get('default', 1)
+        self._verdict_threshold = severity.get('threshold', 1)
+
+        self._restore_regex(meta['regex_patterns'])
+        self._fuzzy_index = FuzzyIndex(self._max_distance)
+        if self._enable_fuzzy:
+            self._fuzzy_keywords = words[:]
+            self._fuzzy_index.build(list(zip(ids, match_words)))
+        if self._enable_pinyin:
+            # 拼音自动机不存进规则文件，按归一化形式现场重建
+            self._build_pinyin_index()
+
+        # 自动机已是构建好的状态，放进占位快照让 build() 直接复用，不再重建
+        self._snapshot = _MatcherSnapshot(-1, automaton, self._id_to_keyword, self._normalizer, (), RegexPrefilter(),
+                                          None, None, self._max_distance, {}, RegexGuard())
+        self._keywords_changed = False
+        self._touch()
+        self.build()
+
+    def _restore_regex(self, patterns):
+        self._regex_patterns = []
+        self._regex_prefilter.clear()
+        self._regex_guard = RegexGuard(self._regex_budget)
+        for pattern_str, r_type, flags in patterns:
+            self._register_regex(re.compile(pattern_str, flags), r_type)
+
+    def _load_pickle(self, filepath: str):
+        """旧版 pickle 格式：关键词对象列表，加载后重建自动机"""
         with open(filepath, 'rb') as f:
             state = pickle.load(f)
 
-        self._keywords = state['keywords']
-        self._keyword_to_id = state['keyword_to_id']
-        self._id_to_keyword = state['id_to_keyword']
+        table = _KeywordTable()
+        for kw in sorted(state['keywords'], key=lambda kw: kw.id):
+            table.add(kw.id, kw.keyword, kw.type, kw.created_at.timestamp() if kw.created_at else 0.0)
+            self._category_bit(kw.type)
+        self._new_table(table)
         self._next_id = state['next_id']
+        self.change_seq = 0  # 旧版文件没有变更日志序号，轮询时从头回放（增删都是幂等的）
         self._case_sensitive = state['case_sensitive']
         self._enable_fuzzy = state['enable_fuzzy']
         self._max_distance = state['max_distance']
+        self._enable_pinyin = False
+        self._exemptions = {}
+        self._combinations = []
+        # 旧版本文件没有归一化配置，使用默认流水线
+        self._normalizer = TextNormalizer.from_config(state.get('normalizer', {}))
+        self._normalizer.lowercase = not self._case_sensitive
 
         # 重建自动机
-        self._automaton = ahocorasick.Automaton()
-        for kw in self._keywords:
-            word_for_match = kw.keyword if self._case_sensitive else kw.keyword.lower()
-            self._automaton.add_word(word_for_match, kw.id)
+        self._index_keywords()
 
         # 恢复正则
-        self._regex_patterns = []
-        for pattern_str, r_type, flags in state['regex_patterns']:
-            compiled = re.compile(pattern_str, flags)
-            self._regex_patterns.append((compiled, r_type))
+        self._restore_regex(state['regex_patterns'])
 
         # 恢复模糊匹配词库
         if self._enable_fuzzy:
-            self._fuzzy_keywords = [kw.keyword for kw in self._keywords]
+            self._fuzzy_keywords = [word for _, word in table.items()]
+            self._build_fuzzy_index()
 
         self.build()
 
     # ==================== 统一搜索接口 ====================
 
-    def search(self, text: str) -> Generator[MatchResult, None, None]:
-        """统一搜索：精确 + 正则 + 模糊"""
-        # 1. 精确匹配
-        search_text = text if self._case_sensitive else text.lower()
-        try:
-            for end_index, keyword_id in self._automaton.iter(search_text):
-                keyword_obj = self._id_to_keyword[keyword_id]
-                # 计算实际文本中的起始位置
-                # 注意：这里在不区分大小写时需要特殊处理，因为search_text是小写的
-                if not self._case_sensitive:
-                    # 找到原始文本中对应的位置
-                    keyword_lower = keyword_obj.keyword.lower()
-                    # 从end_index - len(keyword_lower) + 1位置开始向前找
-                    start_pos = end_index - len(keyword_lower) + 1
-                    # 确保在原始文本中正确匹配
-                    while start_pos >= 0:
-                        if text[start_pos:end_index+1].lower() == keyword_lower:
-                            start_index = start_pos
-                            break
-                        start_pos -= 1
-                else:
-                    start_index = end_index - len(keyword_obj.keyword) + 1
+    def search(self, text: str, categories: Optional[int] = None) -> Generator[MatchResult, None, None]:
+        """
+        统一搜索：精确 + 拼音（启用时）+ 正则 + 模糊
+        :param categories: 只返回这些类别的命中（category_mask 的结果），在同一遍扫描里过滤；默认全部
+        """
+        # 整个搜索只读开始时的快照，期间发布的新快照从下一次搜索开始生效
+        snapshot = self._snapshot
+        stats = self._stats
+        started = perf_counter() if stats is not None else 0.0
+        normalized = self._normalize(text, snapshot)
+        if stats is not None:
+            stats.messages += 1
+            started = stats.lap('normalize', started)
 
-                yield MatchResult(
+        exact_hits = None
+        combo_hits = ()
+        exempt = None
+        if snapshot.tagged:
+            # 豁免短语、组合规则词项和关键词在同一遍扫描里命中，要整条扫完：被豁免短语完整覆盖的命中直接丢弃，
+            # 豁免区间再用来过滤后面各阶段的命中
+            exact_hits, spans, combo_hits = self._split_hits(iter_hits(snapshot.automaton, normalized.text), snapshot)
+            if spans:
+                exempt = self._exempt_by_message(spans, [0], [normalized])[0]
+
+        # 1. 精确匹配 2. 组合规则（有命中时）3. 拼音/同音字匹配（可选）4. 正则匹配 5. 模糊匹配（较慢，可选）
+        stages = [('exact', '精确匹配', self._search_exact(normalized, snapshot, categories, stats, exact_hits))]
+        if combo_hits:
+            stages.append(('combination', '组合规则匹配',
+                           self._combo_results(combo_hits, normalized, snapshot, categories, stats)))
+        if snapshot.pinyin_index is not None:
+            stages.append(('pinyin', '拼音匹配', self._search_pinyin(normalized, snapshot, categories, stats)))
+        stages.append(('regex', '正则匹配', self._search_regex(text, snapshot=snapshot, categories=categories,
+                                                            stats=stats)))
+        if snapshot.fuzzy_index is not None:
+            stages.append(('fuzzy', '模糊匹配', self._search_fuzzy(text, normalized, snapshot, categories, stats)))
+
+        if stats is None:
+            for _, label, matches in stages:
+                try:
+                    if exempt is None:
+                        yield from matches
+                    else:
+                        for match in matches:
+                            if not exempt.covers(match.start, match.end):
+                                yield match
+                except Exception as e:
+                    print(f"{label}出错: {e}")
+            return
+
+        # 统计开启时每个阶段先跑完再产出，计时不包含调用方处理结果的时间
+        for stage, label, matches in stages:
+            try:
+                found = list(matches)
+            except Exception as e:
+                print(f"{label}出错: {e}")
+                found = []
+            started = stats.lap(stage, started)
+            if exempt is not None:
+                found = [match for match in found if not exempt.covers(match.start, match.end)]
+            if found:
+                yield from found
+                started = perf_counter()
+
+    def _search_exact(self, normalized: NormalizedText, snapshot: _MatcherSnapshot, categories: Optional[int] = None,
+                      stats: Optional[MatchStats] = None,
+                      hits: Optional[List[Tuple[int, Tuple[int, int]]]] = None) -> Generator[MatchResult, None, None]:
+        """:param hits: 已经扫描好的自动机输出（去掉豁免后的），默认现场扫描"""
+        type_masks = snapshot.type_masks
+        type_codes = snapshot.keywords.type_codes
+        if hits is None:
+            hits = iter_hits(snapshot.automaton, normalized.text)
+        for end_index, (keyword_id, length) in hits:
+            if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                continue
+            if stats is not None:
+                stats.keyword_hits[keyword_id] += 1
+            start_index, end_index = normalized.span(end_index - length + 1, end_index)
+            yield MatchResult(
+                start=start_index,
+                end=end_index,
+                keyword=snapshot.id_to_keyword[keyword_id],
+                match_type='exact'
+            )
+
+    def _combo_results(self, hits: List[Tuple[int, int, int]], normalized: NormalizedText, snapshot: _MatcherSnapshot,
+                       categories: Optional[int] = None,
+                       stats: Optional[MatchStats] = None) -> Generator[MatchResult, None, None]:
+        """组合规则命中 (起点, 终点, 规则编号)（归一化文本中的位置）-> MatchResult，keyword 为规则的 label"""
+        rules = snapshot.combos.rules
+        for start, end, rule_index in hits:
+            if categories is not None and not snapshot.combo_masks[rule_index] & categories:
+                continue
+            if stats is not None:
+                stats.combo_hits[rule_index] += 1
+            start, end = normalized.span(start, end)
+            yield MatchResult(
+                start=start,
+                end=end,
+                keyword=rules[rule_index].label,
+                match_type='combination'
+            )
+
+    def _normalize(self, text: str, snapshot: Optional[_MatcherSnapshot] = None) -> NormalizedText:
+        """精确/模糊匹配前的文本归一化，整段只做一次"""
+        return (snapshot or self._snapshot).normalizer.normalize(text)
+
+    @staticmethod
+    def _split_hits(hits, snapshot: _MatcherSnapshot, starts: Optional[List[int]] = None
+                    ) -> Tuple[List[Tuple[int, Tuple[int, int]]], List[Tuple[int, int]], List[Tuple[int, int, int]]]:
+        """
+        把一遍自动机扫描的输出拆成 (关键词命中, 豁免区间, 组合规则命中)，位置都在扫描的文本中
+        被豁免短语完整覆盖的关键词命中和组合规则词项在这里丢弃，不会为它们创建结果；只在 snapshot.tagged 时调用
+        :param starts: 扫描的是拼接缓冲区时各消息的起点，组合规则不跨消息
+        """
+        found = []
+        spans = []
+        terms = []
+        combos = snapshot.combos
+        term_of_keyword = combos.term_of_keyword if combos is not None else {}
+        for hit in hits:
+            end_index, (keyword_id, length) = hit
+            if keyword_id >= 0:
+                found.append(hit)
+                term = term_of_keyword.get(keyword_id)
+                if term is not None:
+                    terms.append((end_index - length + 1, end_index, term))
+            elif keyword_id == EXEMPT_ID:
+                spans.append((end_index - length + 1, end_index))
+            else:
+                terms.append((end_index - length + 1, end_index, TERM_ID_BASE - keyword_id))
+        if spans:
+            exempt = _ExemptSpans(spans)
+            found = [hit for hit in found if not exempt.covers(hit[0] - hit[1][1] + 1, hit[0])]
+            terms = [term for term in terms if not exempt.covers(term[0], term[1])]
+        if not terms:
+            return found, spans, []
+        if starts is None or len(starts) == 1:
+            return found, spans, combos.match(terms)
+        # 词项命中按终点排列，所属消息单调不减，逐段交给规则求值
+        matched = []
+        group_start = 0
+        group_message = bisect_right(starts, terms[0][1]) - 1
+        for i in range(1, len(terms) + 1):
+            msg_index = bisect_right(starts, terms[i][1]) - 1 if i < len(terms) else -1
+            if msg_index != group_message:
+                matched.extend(combos.match(terms[group_start:i]))
+                group_start, group_message = i, msg_index
+        return found, spans, matched
+
+    @staticmethod
+    def _exempt_by_message(spans: List[Tuple[int, int]], starts: List[int],
+                           normalized_texts: List[NormalizedText]) -> Dict[int, _ExemptSpans]:
+        """扫描缓冲区里的豁免区间按消息分组并换算成原文位置，用来过滤其余阶段的命中"""
+        grouped: Dict[int, List[Tuple[int, int]]] = {}
+        for start, end in spans:
+            msg_index = bisect_right(starts, end) - 1
+            offset = starts[msg_index]
+            grouped.setdefault(msg_index, []).append(normalized_texts[msg_index].span(start - offset, end - offset))
+        return {msg_index: _ExemptSpans(found) for msg_index, found in grouped.items()}
+
+    def search_many(self, texts: List[str], categories: Optional[int] = None) -> List[List[MatchResult]]:
+        """
+        批量搜索：整段对话拼接后只跑一遍自动机，结果按消息分组
+        之前扫描过的消息直接从缓存取结果（同一规则集版本内），只有新消息参与匹配
+        :param texts: 消息列表
+        :param categories: 只返回这些类别的命中，同 search
+        :return: 与 texts 一一对应的匹配结果列表（每条消息内的顺序与 search 相同；
+                 MatchResult 对象可能与之前的调用共享，不要修改）
+        """
+        snapshot = self._snapshot
+        cache = self._match_cache
+        if cache is None or not texts:
+            return self._search_many(texts, snapshot, categories)
+
+        # 限定类别时结果不同，缓存键带上掩码
+        keys = texts if categories is None else [(categories, text) for text in texts]
+        guard = snapshot.regex_guard
+        state = (snapshot.version, guard.generation)
+        with self._cache_lock:
+            if state > (self._cache_version, self._cache_generation):
+                # 规则集变了，或有正则被隔离/解除隔离，旧结果全部作废
+                cache.clear()
+                self._cache_version, self._cache_generation = state
+            usable = state == (self._cache_version, self._cache_generation)
+            cached = [cache.get(key) for key in keys] if usable else [None] * len(texts)
+
+        missing = [i for i, found in enumerate(cached) if found is None]
+        if missing:
+            fresh = self._search_many([texts[i] for i in missing], snapshot, categories)
+            for i, matches in zip(missing, fresh):
+                cached[i] = tuple(matches)
+
+        with self._cache_lock:
+            self._cache_hits += len(texts) - len(missing)
+            self._cache_misses += len(missing)
+            # 扫描途中有正则被隔离时，这批结果里可能还有它的命中，不缓存
+            if usable and (snapshot.version, guard.generation) == (self._cache_version, self._cache_generation):
+                for i in missing:
+                    cache[keys[i]] = cached[i]
+        return [list(matches) for matches in cached]
+
+    def _search_many(self, texts: List[str], snapshot: _MatcherSnapshot,
+                     categories: Optional[int] = None) -> List[List[MatchResult]]:
+        results: List[List[MatchResult]] = [[] for _ in texts]
+        if not texts:
+            return results
+        stats = self._stats
+        count = len(texts)
+        if stats is not None:
+            stats.messages += count
+            lap = perf_counter()
+
+        # 1. 精确匹配：拼接成一个缓冲区，用偏移表 + 二分把命中映射回消息
+        normalizer = snapshot.normalizer
+        normalized_texts = [normalizer.normalize(text) for text in texts]
+        if stats is not None:
+            lap = stats.lap('normalize', lap, count)
+        starts = []
+        pos = 0
+        for normalized in normalized_texts:
+            starts.append(pos)
+            pos += len(normalized.text) + len(MESSAGE_SEPARATOR)
+        spans = ()
+        combo_hits = ()
+        try:
+            id_to_keyword = snapshot.id_to_keyword
+            type_masks = snapshot.type_masks
+            type_codes = snapshot.keywords.type_codes
+            buffer = MESSAGE_SEPARATOR.join(normalized.text for normalized in normalized_texts)
+            exact_hits = iter_hits(snapshot.automaton, buffer)
+            if snapshot.tagged:
+                exact_hits, spans, combo_hits = self._split_hits(exact_hits, snapshot, starts)
+            for end_index, (keyword_id, length) in exact_hits:
+                if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                    continue
+                if stats is not None:
+                    stats.keyword_hits[keyword_id] += 1
+                msg_index = bisect_right(starts, end_index) - 1
+                local_end = end_index - starts[msg_index]
+                start_index, local_end = normalized_texts[msg_index].span(local_end - length + 1, local_end)
+                results[msg_index].append(MatchResult(
                     start=start_index,
-                    end=end_index,
-                    keyword=keyword_obj,
+                    end=local_end,
+                    keyword=id_to_keyword[keyword_id],
                     match_type='exact'
-                )
+                ))
         except Exception as e:
             print(f"精确匹配出错: {e}")
+        if stats is not None:
+            lap = stats.lap('exact', lap, count)
 
-        # 2. 正则匹配
+        # 组合规则：命中已在精确匹配的同一遍扫描里求出，只需映射回消息
+        if combo_hits:
+            for start_index, end_index, rule_index in combo_hits:
+                msg_index = bisect_right(starts, end_index) - 1
+                offset = starts[msg_index]
+                results[msg_index].extend(self._combo_results(
+                    [(start_index - offset, end_index - offset, rule_index)],
+                    normalized_texts[msg_index], snapshot, categories, stats))
+            if stats is not None:
+                lap = stats.lap('combination', lap, count)
+
+        # 2. 拼音/同音字匹配（可选）
+        if snapshot.pinyin_index is not None:
+            try:
+                for msg_results, normalized in zip(results, normalized_texts):
+                    msg_results.extend(self._search_pinyin(normalized, snapshot, categories, stats))
+            except Exception as e:
+                print(f"拼音匹配出错: {e}")
+            if stats is not None:
+                lap = stats.lap('pinyin', lap, count)
+
+        # 3. 正则匹配：字面量预过滤同样只扫描一遍
         try:
-            yield from self._search_regex(text)
+            all_candidates = snapshot.regex_prefilter.candidates_many(texts, MESSAGE_SEPARATOR)
+            for msg_results, text, candidates in zip(results, texts, all_candidates):
+                if candidates:
+                    msg_results.extend(self._search_regex(text, candidates, snapshot, categories, stats))
         except Exception as e:
             print(f"正则匹配出错: {e}")
+        if stats is not None:
+            lap = stats.lap('regex', lap, count)
 
-        # 3. 模糊匹配（较慢，可选）
-        if self._enable_fuzzy:
+        # 4. 模糊匹配（较慢，可选）
+        if snapshot.fuzzy_index is not None:
+            try:
+                all_hits = self._fuzzy_hits_many(normalized_texts, snapshot)
+                for msg_results, normalized, hits in zip(results, normalized_texts, all_hits):
+                    msg_results.extend(self._fuzzy_results(normalized, hits, snapshot, categories, stats))
+            except Exception as e:
+                print(f"模糊匹配出错: {e}")
+            if stats is not None:
+                stats.lap('fuzzy', lap, count)
+
+        if spans:
+            # 拼音、正则、模糊的命中同样不能落在豁免短语里
+            for msg_index, exempt in self._exempt_by_message(spans, starts, normalized_texts).items():
+                results[msg_index] = [match for match in results[msg_index]
+                                      if not exempt.covers(match.start, match.end)]
+        return results
+
+    def search_packed(self, text: str, categories: Optional[int] = None) -> array:
+        """
+        与 search 相同的命中，以紧凑数组返回，不创建任何结果对象
+        :return: array('i')，每 4 个整数一条命中：(起点, 终点, ID, 类型)，
+                 类型为 KIND_EXACT / KIND_PINYIN / KIND_REGEX / KIND_FUZZY / KIND_COMBO；
+                 精确、拼音和模糊命中的 ID 是关键词ID（用 get_keyword 查），
+                 正则命中的 ID 是规则下标（用 get_regex 查），组合规则命中的 ID 是规则编号（用 get_combination 查）
+        """
+        return self.search_many_packed([text], categories)[0]
+
+    def search_many_packed(self, texts: List[str], categories: Optional[int] = None) -> Tuple[array, array]:
+        """
+        search_many 的紧凑形式，适合批量处理或只统计命中的调用方
+        :return: (hits, offsets)：hits 同 search_packed，全部消息的命中依次排列；
+                 第 i 条消息的命中是 hits[offsets[i] * 4:offsets[i + 1] * 4]
+        """
+        if not texts:
+            return array('i'), array('i', [0])
+        snapshot = self._snapshot
+        stats = self._stats
+        count = len(texts)
+        if stats is not None:
+            stats.messages += count
+            lap = perf_counter()
+        # 先按阶段收集 (消息序号, 起点, 终点, ID, 类型)，最后按消息序号稳定地分组
+        rows = array('i')
+        normalized_texts = [snapshot.normalizer.normalize(text) for text in texts]
+        if stats is not None:
+            lap = stats.lap('normalize', lap, count)
+
+        # 1. 精确匹配
+        starts = []
+        pos = 0
+        for normalized in normalized_texts:
+            starts.append(pos)
+            pos += len(normalized.text) + len(MESSAGE_SEPARATOR)
+        type_masks = snapshot.type_masks
+        type_codes = snapshot.keywords.type_codes
+        spans = ()
+        combo_hits = ()
+        try:
+            buffer = MESSAGE_SEPARATOR.join(normalized.text for normalized in normalized_texts)
+            exact_hits = iter_hits(snapshot.automaton, buffer)
+            if snapshot.tagged:
+                exact_hits, spans, combo_hits = self._split_hits(exact_hits, snapshot, starts)
+            for end_index, (keyword_id, length) in exact_hits:
+                if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                    continue
+                if stats is not None:
+                    stats.keyword_hits[keyword_id] += 1
+                msg_index = bisect_right(starts, end_index) - 1
+                local_end = end_index - starts[msg_index]
+                start_index, local_end = normalized_texts[msg_index].span(local_end - length + 1, local_end)
+                rows.extend((msg_index, start_index, local_end, keyword_id, KIND_EXACT))
+        except Exception as e:
+            print(f"精确匹配出错: {e}")
+        if stats is not None:
+            lap = stats.lap('exact', lap, count)
+
+        # 组合规则
+        if combo_hits:
+            for start_index, end_index, rule_index in combo_hits:
+                if categories is not None and not snapshot.combo_masks[rule_index] & categories:
+                    continue
+                if stats is not None:
+                    stats.combo_hits[rule_index] += 1
+                msg_index = bisect_right(starts, end_index) - 1
+                offset = starts[msg_index]
+                start_index, end_index = normalized_texts[msg_index].span(start_index - offset, end_index - offset)
+                rows.extend((msg_index, start_index, end_index, rule_index, KIND_COMBO))
+            if stats is not None:
+                lap = stats.lap('combination', lap, count)
+
+        # 2. 拼音/同音字匹配
+        if snapshot.pinyin_index is not None:
             try:
-                yield from self._search_fuzzy(text)
+                for msg_index, normalized in enumerate(normalized_texts):
+                    for start_index, end_index, keyword_id in self._pinyin_hits(normalized, snapshot, categories,
+                                                                                 stats):
+                        start_index, end_index = normalized.span(start_index, end_index)
+                        rows.extend((msg_index, start_index, end_index, keyword_id, KIND_PINYIN))
+            except Exception as e:
+                print(f"拼音匹配出错: {e}")
+            if stats is not None:
+                lap = stats.lap('pinyin', lap, count)
+
+        # 3. 正则匹配
+        try:
+            all_candidates = snapshot.regex_prefilter.candidates_many(texts, MESSAGE_SEPARATOR)
+            for msg_index, (text, candidates) in enumerate(zip(texts, all_candidates)):
+                for index, pos in candidates:
+                    if categories is not None and not snapshot.regex_masks[index] & categories:
+                        continue
+                    pattern = snapshot.regex_patterns[index][0]
+                    try:
+                        for match in snapshot.regex_guard.finditer(index, pattern, text, pos):
+                            if stats is not None:
+                                stats.regex_hits[index] += 1
+                            rows.extend((msg_index, match.start(), match.end() - 1, index, KIND_REGEX))
+                    except Exception as e:
+                        print(f"正则 {pattern.pattern} 匹配出错: {e}")
+        except Exception as e:
+            print(f"正则匹配出错: {e}")
+        if stats is not None:
+            lap = stats.lap('regex', lap, count)
+
+        # 4. 模糊匹配
+        if snapshot.fuzzy_index is not None:
+            try:
+                all_hits = self._fuzzy_hits_many(normalized_texts, snapshot)
+                for msg_index, (normalized, hits) in enumerate(zip(normalized_texts, all_hits)):
+                    for start_index, end_index, keyword_id, _ in hits:
+                        if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                            continue
+                        if stats is not None:
+                            stats.keyword_hits[keyword_id] += 1
+                        start_index, end_index = normalized.span(start_index, end_index)
+                        rows.extend((msg_index, start_index, end_index, keyword_id, KIND_FUZZY))
             except Exception as e:
                 print(f"模糊匹配出错: {e}")
+            if stats is not None:
+                stats.lap('fuzzy', lap, count)
+
+        if spans:
+            # 去掉落在豁免短语里的拼音、正则、模糊命中
+            by_message = self._exempt_by_message(spans, starts, normalized_texts)
+            kept = array('i')
+            for row in range(0, len(rows), 5):
+                exempt = by_message.get(rows[row])
+                if exempt is None or not exempt.covers(rows[row + 1], rows[row + 2]):
+                    kept.extend(rows[row:row + 5])
+            rows = kept
+
+        # 计数排序：每条消息内保持 精确 → 组合规则 → 拼音 → 正则 → 模糊 的顺序
+        offsets = array('i', [0]) * (len(texts) + 1)
+        for msg_index in rows[::5]:
+            offsets[msg_index + 1] += 1
+        for i in range(len(texts)):
+            offsets[i + 1] += offsets[i]
+        hits = array('i', [0]) * (offsets[-1] * 4)
+        fill = offsets.tolist()
+        for row in range(0, len(rows), 5):
+            slot = fill[rows[row]] * 4
+            fill[rows[row]] += 1
+            hits[slot:slot + 4] = rows[row + 1:row + 5]
+        return hits, offsets
 
-    def contains_any(self, text: str) -> bool:
+    def get_keyword(self, keyword_id: int) -> Optional[KeyWord]:
+        """按 ID 取当前快照中的关键词，已删除时返回 None"""
         try:
-            next(self.search(text))
-            return True
-        except StopIteration:
-            return False
+            return self._snapshot.id_to_keyword[keyword_id]
+        except KeyError:
+            return None
+
+    def get_regex(self, index: int) -> Tuple[str, str]:
+        """按规则下标取当前快照中的正则：(pattern, 类型)"""
+        pattern, r_type = self._snapshot.regex_patterns[index]
+        return pattern.pattern, r_type
+
+    # ==================== 正则耗时统计与隔离 ====================
+
+    def set_regex_budget(self, seconds: Optional[float]):
+        """
+        设置单条正则单次匹配的时间预算，超过的规则被隔离（之后不再运行）并打印报告
+        re 无法在匹配途中打断，超预算的那一次仍会跑完
+        :param seconds: 秒数，None 表示只统计不隔离
+        """
+        with self._edit_lock:
+            regroup = (self._regex_budget is None) != (seconds is None)
+            self._regex_budget = seconds
+            self._regex_guard.budget = seconds
+            if regroup:
+                # 有没有预算决定规则能否并入预过滤的组合正则，按新的预算重新登记（统计保留）
+                self._regex_prefilter.clear()
+                for index, (compiled, _) in enumerate(self._regex_patterns):
+                    self._prefilter_regex(index, compiled, self._regex_guard.nested[index])
+                self._touch()
+        if regroup:
+            self.build()
+
+    def regex_stats(self) -> List[Dict[str, Any]]:
+        """每条正则的调用次数和耗时，按累计耗时从高到低排列"""
+        snapshot = self._snapshot
+        guard = snapshot.regex_guard
+        stats = []
+        for index, (pattern, r_type) in enumerate(snapshot.regex_patterns):
+            calls = guard.calls[index]
+            total = guard.total[index]
+            stats.append({
+                'index': index,
+                'pattern': pattern.pattern,
+                'type': r_type,
+                'calls': calls,
+                'total_ms': total * 1000,
+                'avg_us': total / calls * 1e6 if calls else 0.0,
+                'max_ms': guard.worst[index] * 1000,
+                'nested_quantifier': guard.nested[index],
+                'quarantined': index in guard.quarantined,
+                'reason': guard.quarantined.get(index, ''),
+            })
+        stats.sort(key=lambda item: -item['total_ms'])
+        return stats
+
+    def release_regex(self, index: int) -> bool:
+        """解除第 index 条正则的隔离，返回它之前是否被隔离"""
+        return self._regex_guard.release(index)
+
+    # ==================== 命中统计 ====================
+
+    def enable_stats(self, enabled: bool = True):
+        """
+        开启/关闭命中计数和分阶段耗时统计，开启时从零开始
+        只统计 search / search_many / search_many_packed；verdict、search_longest / replace 不计入，
+        search_many 从结果缓存取到的消息也不重复计数
+        """
+        self._stats = MatchStats() if enabled else None
 
-    def replace(self, text: str, replacement: str = "[***]") -> str:
-        """替换所有匹配项（精确 + 正则 + 模糊）"""
-        matches = list(self.search(text))
-        matches.sort(key=lambda x: x.start)  # 按位置排序
+    def reset_stats(self):
+        """统计清零（未开启时什么都不做）"""
+        if self._stats is not None:
+            self._stats = MatchStats()
 
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        """
+        统计快照，可直接 json.dump
+        top_keywords 为命中最多的 top 个关键词，regex、combinations 为每条正则、组合规则的命中次数，stages 为各阶段的耗时直方图，
+        unused_keywords 为从开启统计以来一次都没命中的关键词数（明细用 unused_keywords() 取）
+        """
+        stats = self._stats
+        if stats is None:
+            return {'enabled': False}
+        snapshot = self._snapshot
+        keywords = snapshot.keywords
+        keyword_hits, regex_hits = stats.hit_counts()
+        keyword_hits = {keyword_id: hits for keyword_id, hits in keyword_hits.items() if keyword_id in keywords}
+        top_keywords = [{
+            'id': keyword_id,
+            'keyword': keywords.words[keyword_id],
+            'type': keywords.type_of(keyword_id),
+            'hits': hits,
+        } for keyword_id, hits in sorted(keyword_hits.items(), key=lambda item: -item[1])[:top]]
+        regex = [{
+            'index': index,
+            'pattern': pattern.pattern,
+            'type': r_type,
+            'hits': regex_hits.get(index, 0),
+        } for index, (pattern, r_type) in enumerate(snapshot.regex_patterns)]
+        combo_hits = dict(stats.combo_hits)
+        combinations = [{
+            'index': index,
+            'rule': rule.label,
+            'type': rule.type,
+            'hits': combo_hits.get(index, 0),
+        } for index, rule in enumerate(snapshot.combos.rules)] if snapshot.combos is not None else []
+        return {
+            'enabled': True,
+            'since': datetime.fromtimestamp(stats.since).isoformat(timespec='seconds'),
+            'messages': stats.messages,
+            'keywords': len(keywords),
+            'keywords_hit': len(keyword_hits),
+            'unused_keywords': len(keywords) - len(keyword_hits),
+            'top_keywords': top_keywords,
+            'regex': regex,
+            'combinations': combinations,
+            'stages': stats.histograms(),
+        }
+
+    def unused_keywords(self) -> List[int]:
+        """从开启统计以来一次都没命中的关键词ID，可据此清理关键词、缩小自动机；统计未开启时返回空列表"""
+        stats = self._stats
+        if stats is None:
+            return []
+        keyword_hits = stats.hit_counts()[0]
+        return [keyword_id for keyword_id in self._snapshot.keywords.ids() if keyword_id not in keyword_hits]
+
+    def dump_stats(self, filepath: str, top: int = 20):
+        """把 stats() 的结果写成 JSON 文件"""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.stats(top), f, ensure_ascii=False, indent=2)
+
+    def contains_any(self, text: str, categories: Optional[int] = None) -> bool:
+        return self.verdict(text, min_severity=0, categories=categories).hit
+
+    def search_longest(self, text: str, categories: Optional[int] = None) -> Generator[MatchResult, None, None]:
+        """
+        最左最长、互不重叠的命中（精确 + 组合规则 + 拼音 + 正则 + 模糊），按位置顺序产出
+        嵌套关键词（"赌"、"赌博"、"网络赌博"）只产出最外层的一个；
+        自动机的命中只按起点保留最长的一个，最后只为选中的命中创建 MatchResult
+        （pyahocorasick 的 iter_long 在最长候选失配时会漏掉更短的命中，这里不使用）
+        """
+        snapshot = self._snapshot
+        normalized = self._normalize(text, snapshot)
+
+        # 起点 -> (终点, 匹配类型, 关键词ID 或 命中对象)，只保留每个起点最长的一个
+        longest: Dict[int, Tuple[int, str, Any]] = {}
+        type_masks = snapshot.type_masks
+        type_codes = snapshot.keywords.type_codes
+        exempt = None
+        combo_hits = ()
+        try:
+            exact: Dict[int, Tuple[int, int]] = {}
+            exact_hits = iter_hits(snapshot.automaton, normalized.text)
+            if snapshot.tagged:
+                exact_hits, spans, combo_hits = self._split_hits(exact_hits, snapshot)
+                if spans:
+                    exempt = self._exempt_by_message(spans, [0], [normalized])[0]
+            for end_index, (keyword_id, length) in exact_hits:
+                if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                    continue
+                start_index = end_index - length + 1
+                found = exact.get(start_index)
+                if found is None or end_index > found[0]:
+                    exact[start_index] = (end_index, keyword_id)
+            for start_index, (end_index, keyword_id) in exact.items():
+                start_index, end_index = normalized.span(start_index, end_index)
+                found = longest.get(start_index)
+                if found is None or end_index > found[0]:
+                    longest[start_index] = (end_index, 'exact', keyword_id)
+        except Exception as e:
+            print(f"精确匹配出错: {e}")
+
+        others = list(self._combo_results(combo_hits, normalized, snapshot, categories)) if combo_hits else []
+        if snapshot.pinyin_index is not None:
+            try:
+                others.extend(self._search_pinyin(normalized, snapshot, categories))
+            except Exception as e:
+                print(f"拼音匹配出错: {e}")
+        try:
+            others.extend(self._search_regex(text, snapshot=snapshot, categories=categories))
+        except Exception as e:
+            print(f"正则匹配出错: {e}")
+        if snapshot.fuzzy_index is not None:
+            try:
+                others.extend(self._search_fuzzy(text, normalized, snapshot, categories))
+            except Exception as e:
+                print(f"模糊匹配出错: {e}")
+        for match in others:
+            if exempt is not None and exempt.covers(match.start, match.end):
+                continue
+            # 同一起点同样长时精确命中优先
+            found = longest.get(match.start)
+            if found is None or match.end > found[0]:
+                longest[match.start] = (match.end, match.match_type, match)
+
+        last_end = -1
+        for start_index in sorted(longest):
+            if start_index <= last_end:
+                continue  # 与已选中的命中重叠
+            end_index, match_type, found = longest[start_index]
+            last_end = end_index
+            if match_type == 'exact':
+                yield MatchResult(start=start_index, end=end_index,
+                                  keyword=snapshot.id_to_keyword[found], match_type='exact')
+            else:
+                yield found
+
+    def replace(self, text: str, replacement: str = "[***]", categories: Optional[int] = None) -> str:
+        """替换所有匹配项（精确 + 拼音 + 正则 + 模糊），重叠时取最左最长的命中，一遍拼接完成"""
         result = []
         last_end = 0
-        for match in matches:
-            if match.start < last_end:
-                continue  # 重叠跳过
+        for match in self.search_longest(text, categories):
             result.append(text[last_end:match.start])
             result.append(replacement)
             last_end = match.end + 1
@@ -282,17 +1842,56 @@ class KeywordMatcher:
         return ''.join(result)
 
     def clear(self):
-        self._keywords.clear()
-        self._keyword_to_id.clear()
-        self._id_to_keyword.clear()
-        self._next_id = 0
-        self._automaton = ahocorasick.Automaton()
-        self._regex_patterns.clear()
-        self._fuzzy_keywords.clear()
-        self._enable_fuzzy = False
+        """清空全部规则并立即发布空快照"""
+        with self._edit_lock:
+            self._new_table(_KeywordTable())
+            self._keyword_to_id = {}
+            self._next_id = 0
+            self.change_seq = 0
+            self._regex_patterns = []
+            self._regex_prefilter.clear()
+            self._regex_guard = RegexGuard(self._regex_budget)
+            self._fuzzy_keywords = []
+            self._fuzzy_index.clear()
+            self._enable_fuzzy = False
+            self._enable_pinyin = False
+            self._pinyin_index = PinyinIndex()
+            self._exemptions = {}
+            self._combinations = []
+            if self._stats is not None:
+                self._stats = MatchStats()  # 关键词ID从零重新分配，旧计数作废
+            self._touch(keywords_changed=True)
+        self.build()
+
+    def set_cache_size(self, maxsize: int):
+        """设置 search_many 结果缓存的条数，0 表示关闭缓存"""
+        with self._cache_lock:
+            self._match_cache = LRUCache(maxsize=maxsize) if maxsize > 0 else None
+            self._cache_hits = 0
+            self._cache_misses = 0
+
+    def clear_cache(self):
+        with self._cache_lock:
+            if self._match_cache is not None:
+                self._match_cache.clear()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """结果缓存统计：命中/未命中次数、命中率、当前条数、规则集版本"""
+        with self._cache_lock:
+            cache = self._match_cache
+            lookups = self._cache_hits + self._cache_misses
+            return {
+                'enabled': cache is not None,
+                'hits': self._cache_hits,
+                'misses': self._cache_misses,
+                'hit_rate': self._cache_hits / lookups if lookups else 0.0,
+                'size': len(cache) if cache is not None else 0,
+                'maxsize': cache.maxsize if cache is not None else 0,
+                'ruleset_version': self._cache_version,
+            }
 
     def size(self) -> int:
-        return len(self._keywords)
+        return len(self._table)
 
 if __name__ == "__main__":
     matcher = KeywordMatcher()
@@ -1,8 +1,39 @@
 from re import S
 from time import sleep
 import time
+from datetime import datetime
+from typing import NamedTuple, Optional
 from DrissionPage import Chromium
-from cachetools import Cache
+from cachetools import LRUCache
+
+# 保留会话状态的用户数，超过后淘汰最久没有访问的用户
+USER_STATE_CACHE_SIZE = 10000
+# 会话指纹覆盖的末尾消息元素个数
+FINGERPRINT_TAIL = 3
+# 用户列表项中的未读角标
+UNREAD_BADGE_XPATH = 'xpath=.//*[contains(@class, "badge") or contains(@class, "unread")]'
+
+
+class UserState:
+    """一个用户会话的增量检测状态：上次看到的消息元素个数和末尾几条消息的指纹"""
+    __slots__ = ('count', 'fingerprint', 'pending', 'douyin_id', 'preview', 'last_visit')
+
+    def __init__(self):
+        self.count = 0
+        self.fingerprint = None  # 末尾至多 FINGERPRINT_TAIL 个消息元素的指纹，见 message_fingerprint
+        self.pending = None      # new_messages(commit=False) 算出、尚未确认的 (count, fingerprint)
+        self.douyin_id = ''
+        self.preview = None      # 上次点开时列表项的预览文本，见 UserEntry
+        self.last_visit = 0.0
+
+
+class UserEntry(NamedTuple):
+    """左侧用户列表的一项"""
+    name: str
+    unread: int      # 未读角标上的数字，没有角标为 0，只有红点时为 1
+    preview: str     # 列表项中除角标外的文本（最后一条消息预览、时间），有新消息时会变
+    element: object
+
 
 class GetDouyinMsg:
     _instance = None
@@ -19,7 +50,7 @@ class GetDouyinMsg:
             self.tab = None
             self._initialized = True
             self.url = None
-            self.user_list=Cache(maxsize=10000)
+            self.user_list = LRUCache(maxsize=USER_STATE_CACHE_SIZE)  # 用户名 -> UserState
 
     def _initialize_browser(self, url: str):
         """初始化浏览器"""
@@ -106,6 +137,81 @@ class GetDouyinMsg:
             print(f"获取用户列表失败: {e}")
             return []
 
+    def get_user_entries(self) -> list:
+        """解析左侧用户列表：用户名、未读数和预览文本，返回 UserEntry 列表"""
+        entries = []
+        for user in self._get_user_list():
+            try:
+                name = user.child().child().child().text
+                if not name:
+                    continue
+                text = user.text or ''
+                unread = 0
+                badge = user.ele(UNREAD_BADGE_XPATH, timeout=0)
+                if badge:
+                    badge_text = (badge.text or '').strip()
+                    digits = badge_text.rstrip('+')
+                    unread = int(digits) if digits.isdigit() else 1
+                    if badge_text:
+                        # 角标在列表项末尾，去掉后点开用户、角标消失时预览不算变化
+                        head, found, rest = text.rpartition(badge_text)
+                        if found:
+                            text = head + rest
+                entries.append(UserEntry(name, unread, ' '.join(text.split()), user))
+            except Exception as e:
+                print(f"解析用户列表项失败: {e}")
+                continue
+        return entries
+
+    def _user_list_holder(self):
+        """用户虚拟列表的滚动容器，找不到时返回 None"""
+        if not self.tab:
+            return None
+        return self.tab.ele('xpath=//div[contains(@class, "rc-virtual-list-holder") '
+                            'and not(contains(@class, "inner"))]', timeout=0) or None
+
+    def scroll_user_list(self) -> bool:
+        """用户列表向下滚动一屏，已到底部时回到顶部，让虚拟列表渲染出其余用户"""
+        try:
+            holder = self._user_list_holder()
+            if not holder:
+                return False
+            holder.run_js('const bottom = this.scrollTop + this.clientHeight >= this.scrollHeight - 2;'
+                          'this.scrollTop = bottom ? 0 : this.scrollTop + this.clientHeight;')
+            return True
+        except Exception as e:
+            print(f"滚动用户列表失败: {e}")
+            return False
+
+    def user_list_scroll_top(self) -> Optional[int]:
+        """用户列表当前的滚动位置，取不到时返回 None"""
+        try:
+            holder = self._user_list_holder()
+            return int(holder.run_js('return this.scrollTop;') or 0) if holder else None
+        except Exception as e:
+            print(f"读取用户列表滚动位置失败: {e}")
+            return None
+
+    def restore_user_list_scroll(self, scroll_top: Optional[int], attempts: int = 3) -> bool:
+        """
+        把用户列表滚回 scroll_top（刷新页面后列表会回到顶部）
+        列表是分段加载的，一次设不到位时等下一段加载出来再设
+        """
+        if not scroll_top:
+            return False
+        try:
+            for _ in range(attempts):
+                holder = self._user_list_holder()
+                if not holder:
+                    return False
+                if int(holder.run_js(f'this.scrollTop = {int(scroll_top)}; return this.scrollTop;') or 0) >= scroll_top - 2:
+                    return True
+                sleep(0.5)
+            return False
+        except Exception as e:
+            print(f"恢复用户列表滚动位置失败: {e}")
+            return False
+
     def _get_user_msgs(self):
         """获取用户的消息"""
         try:
@@ -117,6 +223,74 @@ class GetDouyinMsg:
             print(f"获取用户消息失败: {e}")
             return []
     
+    def get_user_state(self, user_name: str) -> UserState:
+        state = self.user_list.get(user_name)
+        if state is None:
+            state = self.user_list[user_name] = UserState()
+        return state
+
+    @staticmethod
+    def message_fingerprint(messages: list) -> tuple:
+        """
+        若干条解析后消息的指纹：发送方、文本和页面上显示的时间
+        同一内容重复发送时靠时间区分；页面没显示时间的消息时间为 None，只能按内容和位置区分
+        """
+        return tuple((msg['sender'], msg['message'], msg['timestamp']) if msg else None for msg in messages)
+
+    def new_messages(self, user_name: str, elements: list, parse, commit: bool = True) -> list:
+        """
+        只解析上次之后新增的消息元素，并更新该用户的状态
+        会话没变时只解析末尾 FINGERPRINT_TAIL 个元素、比较一次指纹；
+        指纹对不上（虚拟列表滚动、加载了更早的消息）时全部解析，从上次末尾那几条消息现在的位置之后算新消息，
+        找不到时整段都算新消息
+        :param elements: 当前会话的全部消息元素
+        :param parse: 消息元素 -> {'sender', 'message', 'timestamp'}，没有文本的元素返回 None；
+                      timestamp 是页面上显示的时间，没有时为 None，返回前补成抓取时刻
+        :param commit: False 时有新消息也先不前进，调用方把这批消息保存、检测完之后再调用 commit_messages；
+                       中途出错就不确认，下一次还会把这些消息当作新消息返回（没有新消息时总是直接前进）
+        """
+        state = self.get_user_state(user_name)
+        state.pending = None
+        count = len(elements)
+        fingerprint = state.fingerprint
+        start = None
+        if fingerprint is not None and count >= state.count:
+            previous = [parse(element) for element in elements[state.count - len(fingerprint):state.count]]
+            if self.message_fingerprint(previous) == fingerprint:
+                start = state.count
+                parsed = previous + [parse(element) for element in elements[start:]]
+                offset = state.count - len(fingerprint)  # parsed[0] 对应的元素下标
+        if start is None:
+            parsed = [parse(element) for element in elements]
+            offset = 0
+            start = 0
+            if fingerprint:
+                keys = self.message_fingerprint(parsed)
+                for end in range(count, 0, -1):
+                    # 可见部分比指纹还短时，只要求开头与指纹的末尾吻合
+                    tail = min(len(fingerprint), end)
+                    if keys[end - tail:end] == fingerprint[len(fingerprint) - tail:]:
+                        start = end
+                        break
+        seen = (count, self.message_fingerprint(parsed[max(0, count - FINGERPRINT_TAIL - offset):]))
+        found = [msg for msg in parsed[start - offset:] if msg]
+        if commit or not found:
+            state.count, state.fingerprint = seen
+        else:
+            state.pending = seen
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for msg in found:
+            if msg['timestamp'] is None:
+                msg['timestamp'] = now
+        return found
+
+    def commit_messages(self, user_name: str):
+        """确认上一次 new_messages(commit=False) 返回的消息已处理完，状态前进到当时看到的位置"""
+        state = self.get_user_state(user_name)
+        if state.pending is not None:
+            state.count, state.fingerprint = state.pending
+            state.pending = None
+
     def refresh_page(self):
         """刷新当前页面；若刷新失败则回退到重新打开URL"""
         try:
@@ -158,18 +332,21 @@ if __name__ == '__main__':
     # print(get_douyin_msg.get_user_list())
     # 先获取到所有的用户列表，然后通过用户名和下面的消息判断是否是新消息，如果是则点击该用户然后获取用户的消息判断是否违规
 
+    def parse(element):
+        text = element.ele("xpath=.//*[@class='leadsCsUI-Text']", timeout=0)
+        return {'sender': 'A', 'message': text.text, 'timestamp': None} if text and text.text else None
+
     sleep(3)
-    user_list=get_douyin_msg._get_user_list()
-    print(len(user_list))
+    entries = get_douyin_msg.get_user_entries()
+    print(len(entries))
     sleep(1)
-    user_list.reverse()
-    for user in user_list:
-        print(user.child().child().child().text) # 用户名
-        # 判断是否是新消息 TODO:
-        # 是：点击消息
+    for entry in reversed(entries):
+        print(entry.name, entry.unread)  # 用户名、未读数
+        # 是否有新消息：点开后由 new_messages 与上次的指纹比较（监控时按未读角标和预览决定点开谁，见 UserScheduler）
         sleep(1)
-        user.click()
+        entry.element.click()
         sleep(1)
-        for item in get_douyin_msg.tab.eles('xpath=//*[@class=\'leadsCsUI-MessageItem\']//*[@class=\'leadsCsUI-Text\']'):
-            print(item.text)
+        elements = get_douyin_msg.tab.eles("xpath=//*[@class='leadsCsUI-MessageItem']")
+        for msg in get_douyin_msg.new_messages(entry.name, elements, parse):
+            print(msg['message'])
         sleep(1)
\ No newline at end of file
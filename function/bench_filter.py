@@ -0,0 +1,768 @@
+import gc
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from Filter import KeywordMatcher, KeyWord, MATCH_CACHE_SIZE, REGEX_TIME_BUDGET
+
+# 固定随机种子，保证每次生成的语料和规则一致
+SEED = 20240901
+
+COMMON_CHARS = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+
+REGEX_PREFIXES = ["微信", "薇信", "威信", "vx", "V信", "wx", "QQ", "扣扣", "企鹅", "电话", "手机", "加我", "私聊", "联系"]
+REGEX_BODIES = [
+    r"[:：]?\s*[a-zA-Z][-_a-zA-Z0-9]{5,19}",
+    r"[:：号]?\s*\d{5,11}",
+    r"\D{0,3}1[3-9]\d{9}",
+    r"[^\w]{0,2}[a-z0-9_]{6,20}",
+]
+# 提取不出字面量的规则，走组合正则
+REGEX_NO_LITERAL = [
+    r"1[3-9]\d{9}",
+    r"\d{3}[-\s]\d{4}[-\s]\d{4}",
+    r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}",
+    r"[a-zA-Z]{2}\d{8,10}",
+]
+
+
+def make_corpus(count: int, rng: random.Random, violation_rate: float = 0.02):
+    """生成中文聊天语料，少量消息带联系方式"""
+    messages = []
+    for _ in range(count):
+        msg = ''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(6, 40)))
+        if rng.random() < violation_rate:
+            pos = rng.randint(0, len(msg))
+            contact = rng.choice(REGEX_PREFIXES) + ''.join(rng.choice("0123456789") for _ in range(9))
+            msg = msg[:pos] + contact + msg[pos:]
+        messages.append(msg)
+    return messages
+
+
+def make_regex_rules(count: int):
+    """生成 count 条联系方式类正则，约 1/10 提取不出字面量"""
+    rules = []
+    i = 0
+    while len(rules) < count:
+        if i % 10 == 9:
+            rules.append(REGEX_NO_LITERAL[(i // 10) % len(REGEX_NO_LITERAL)])
+        else:
+            prefix = REGEX_PREFIXES[i % len(REGEX_PREFIXES)]
+            body = REGEX_BODIES[(i // len(REGEX_PREFIXES)) % len(REGEX_BODIES)]
+            # 在前缀后追加序号变体，模拟大量相似但不同的规则
+            rules.append(re.escape(prefix) + "(?:%s)?" % re.escape(str(i)) + body)
+        i += 1
+    return rules
+
+
+def _time_per_message(func, messages) -> float:
+    start = time.perf_counter()
+    for msg in messages:
+        func(msg)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def bench_regex_rules(rule_counts=(10, 50, 100, 200, 400), message_count=2000):
+    """正则规则数量与扫描开销：逐条运行 vs 字面量预过滤"""
+    rng = random.Random(SEED)
+    messages = make_corpus(message_count, rng)
+    matcher = KeywordMatcher()
+
+    print(f"{'规则数':>8} {'逐条运行(us/条)':>16} {'预过滤(us/条)':>14} {'加速比':>8}  预过滤统计")
+    for count in rule_counts:
+        matcher.clear()
+        for pattern in make_regex_rules(count):
+            matcher.add_regex(pattern, "contact")
+        matcher.build()
+
+        def naive(text):
+            for pattern, _ in matcher._snapshot.regex_patterns:
+                for _ in pattern.finditer(text):
+                    pass
+
+        def prefiltered(text):
+            for _ in matcher._search_regex(text):
+                pass
+
+        naive_us = _time_per_message(naive, messages)
+        prefiltered_us = _time_per_message(prefiltered, messages)
+        print(f"{count:>8} {naive_us:>16.1f} {prefiltered_us:>14.1f} {naive_us / prefiltered_us:>7.1f}x  "
+              f"{matcher._regex_prefilter.describe()}")
+    matcher.clear()
+
+
+LATIN_WORDS = ["vx", "QQ", "WeChat", "Python", "OK", "VIP", "App", "Link", "DM", "Add"]
+
+
+def make_mixed_corpus(count: int, rng: random.Random):
+    """生成中英混排的聊天语料（大小写混合）"""
+    messages = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(3, 8)):
+            if rng.random() < 0.3:
+                parts.append(rng.choice(LATIN_WORDS))
+            else:
+                parts.append(''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(2, 6))))
+        messages.append(''.join(parts))
+    return messages
+
+
+def _legacy_exact_starts(matcher, text):
+    """旧实现：每个命中逐位向前切片并小写比较来找起点"""
+    starts = []
+    for end_index, (keyword_id, _) in matcher._snapshot.automaton.iter(text.lower()):
+        keyword_lower = matcher._id_to_keyword[keyword_id].keyword.lower()
+        start_pos = end_index - len(keyword_lower) + 1
+        while start_pos >= 0:
+            if text[start_pos:end_index + 1].lower() == keyword_lower:
+                starts.append(start_pos)
+                break
+            start_pos -= 1
+    return starts
+
+
+def bench_case_insensitive_offsets(keyword_count=2000, message_count=5000):
+    """不区分大小写时精确命中的起点计算：逐位回溯 vs 位置映射"""
+    rng = random.Random(SEED)
+    messages = make_mixed_corpus(message_count, rng)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_case_sensitive(False)
+    for word in LATIN_WORDS:
+        matcher.add_keyword(KeyWord(word, "contact"))
+    for _ in range(keyword_count):
+        matcher.add_keyword(KeyWord(''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(2, 3)))))
+    matcher.build()
+
+    def mapped(text):
+        normalized = matcher._normalize(text)
+        for end_index, (_, length) in matcher._snapshot.automaton.iter(normalized.text):
+            normalized.span(end_index - length + 1, end_index)
+
+    # 'İ' 小写后变成两个字符，小写文本与原文错位，逐位回溯要走很远
+    expanding = [text + "İ" * 20 + text for text in messages[:message_count // 10]]
+    for name, corpus in (("中英混排", messages), ("含变长小写字符", expanding)):
+        hits = sum(len(_legacy_exact_starts(matcher, text)) for text in corpus)
+        legacy_us = _time_per_message(lambda text: _legacy_exact_starts(matcher, text), corpus)
+        mapped_us = _time_per_message(mapped, corpus)
+        print(f"[{name}] 消息数 {len(corpus)}，命中 {hits} 次")
+        print(f"  逐位回溯: {legacy_us:.2f} us/条  位置映射: {mapped_us:.2f} us/条  加速比 {legacy_us / mapped_us:.1f}x")
+    matcher.clear()
+
+
+# 违规词用的字与 COMMON_CHARS 不重叠，干净消息不会误命中
+VIOLATION_CHARS = "赌博嫖娼淫秽毒枪弹诈骗贷裸聊约炮彩票冰麻赔率返利刷单兼职黑卡洗钱代孕迷药窃听翻墙"
+VIOLATION_TYPES = {"porn": 3, "gamble": 2, "fraud": 2, "keyword": 1}
+
+
+def make_violation_keywords(count: int, rng: random.Random):
+    keywords = set()
+    while len(keywords) < count:
+        keywords.add(''.join(rng.choice(VIOLATION_CHARS) for _ in range(rng.randint(3, 5))))
+    types = list(VIOLATION_TYPES)
+    return [KeyWord(word, types[i % len(types)]) for i, word in enumerate(sorted(keywords))]
+
+
+def bench_verdict(keyword_count=3000, rule_count=100, message_count=2000, dirty_rates=(0.02, 0.1, 0.3),
+                  fuzzy=False):
+    """只判断是否违规：收集全部命中 vs 旧 contains_any vs verdict 提前退出"""
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.add_keywords(keywords)
+    for pattern in make_regex_rules(rule_count):
+        matcher.add_regex(pattern, "contact")
+    if fuzzy:
+        matcher.enable_fuzzy_match(1)
+    matcher.set_severity(VIOLATION_TYPES, default=1, threshold=2)
+    matcher.build()
+
+    def collect_all(text):
+        # 调用方目前的做法：取出全部命中再找最严重的类型
+        matches = list(matcher.search(text))
+        if matches:
+            max(matches, key=lambda m: VIOLATION_TYPES.get(getattr(m.keyword, 'type', m.keyword), 1))
+
+    def first_match(text):
+        # 旧版 contains_any：拿到第一个命中即返回
+        next(matcher.search(text), None)
+
+    print(f"{'违规比例':>8} {'全部命中(us/条)':>16} {'首个命中(us/条)':>16} {'verdict(us/条)':>15} {'相对全部命中':>12}")
+    for rate in dirty_rates:
+        messages = make_corpus(message_count, random.Random(SEED), violation_rate=0)
+        for i in range(len(messages)):
+            if rng.random() < rate:
+                pos = rng.randint(0, len(messages[i]))
+                messages[i] = messages[i][:pos] + rng.choice(keywords).keyword + messages[i][pos:]
+        all_us = _time_per_message(collect_all, messages)
+        first_us = _time_per_message(first_match, messages)
+        verdict_us = _time_per_message(matcher.verdict, messages)
+        print(f"{rate:>8.0%} {all_us:>16.1f} {first_us:>16.1f} {verdict_us:>15.1f} {all_us / verdict_us:>11.1f}x")
+    matcher.clear()
+
+
+def bench_match_cache(conversations=200, messages_per_conversation=30, cycles=5):
+    """重复扫描同一批对话（监控每轮刷新）：无缓存 vs 消息级结果缓存"""
+    rng = random.Random(SEED)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.add_keywords(make_violation_keywords(3000, rng))
+    for pattern in make_regex_rules(100):
+        matcher.add_regex(pattern, "contact")
+    matcher.build()
+    corpus = make_corpus(conversations * messages_per_conversation, rng)
+    batches = [corpus[i:i + messages_per_conversation] for i in range(0, len(corpus), messages_per_conversation)]
+
+    def run_cycles():
+        start = time.perf_counter()
+        for cycle in range(cycles):
+            for batch in batches:
+                # 每轮对话末尾多出一条新消息
+                matcher.search_many(batch + [f"第{cycle}轮新消息"])
+        return (time.perf_counter() - start) / cycles * 1000
+
+    matcher.set_cache_size(0)
+    uncached_ms = run_cycles()
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    cached_ms = run_cycles()
+    stats = matcher.cache_stats()
+    print(f"对话数 {conversations}，每段 {messages_per_conversation} 条，共 {cycles} 轮")
+    print(f"  无缓存: {uncached_ms:.1f} ms/轮  有缓存: {cached_ms:.1f} ms/轮  加速比 {uncached_ms / cached_ms:.1f}x  "
+          f"命中率 {stats['hit_rate']:.1%}")
+    matcher.clear()
+
+
+def bench_sharded(keyword_count=300000, message_count=20000, shards=None):
+    """百万级关键词：单个自动机 vs 分片多进程（构建耗时、批量扫描吞吐）"""
+    from sharded_matcher import ShardedKeywordMatcher
+
+    rng = random.Random(SEED)
+    words = set()
+    while len(words) < keyword_count:
+        words.add(''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(3, 6))))
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+    matcher.add_keywords([KeyWord(word) for word in words])
+    messages = make_corpus(message_count, rng)
+
+    start = time.perf_counter()
+    matcher.build()
+    single_build = time.perf_counter() - start
+    start = time.perf_counter()
+    matcher.search_many(messages)
+    single_scan = time.perf_counter() - start
+
+    with ShardedKeywordMatcher(matcher, shards=shards) as sharded:
+        start = time.perf_counter()
+        sharded.build()
+        sharded_build = time.perf_counter() - start
+        start = time.perf_counter()
+        sharded.search_many(messages)
+        sharded_scan = time.perf_counter() - start
+        print(f"关键词 {keyword_count}，消息 {message_count}，分片 {sharded.shard_count}，进程 {sharded.workers}"
+              f"（{sharded.start_method}）")
+    print(f"  构建: 单自动机 {single_build:.2f}s  分片 {sharded_build:.2f}s")
+    print(f"  扫描: 单自动机 {message_count / single_scan:.0f} 条/s  分片 {message_count / sharded_scan:.0f} 条/s")
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+
+def _legacy_replace(matcher, text, replacement="[***]"):
+    """旧版 replace：物化全部命中、排序，重叠时保留先出现的（往往是嵌套里最短的）"""
+    matches = list(matcher.search(text))
+    matches.sort(key=lambda x: x.start)
+    result = []
+    last_end = 0
+    for match in matches:
+        if match.start < last_end:
+            continue
+        result.append(text[last_end:match.start])
+        result.append(replacement)
+        last_end = match.end + 1
+    result.append(text[last_end:])
+    return ''.join(result)
+
+
+def bench_replace(keyword_count=3000, message_count=5000, violation_rate=0.3):
+    """嵌套关键词（"赌"、"赌博"、"网络赌博"）密集时的替换：旧版排序去重 vs 最左最长单遍替换"""
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    # 每个长词再加入它的前缀和后缀，制造大量嵌套命中
+    nested = {kw.keyword for kw in keywords}
+    for kw in keywords:
+        nested.update((kw.keyword[:2], kw.keyword[1:]))
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.add_keywords([KeyWord(word) for word in nested if len(word) > 1])
+    for pattern in make_regex_rules(50):
+        matcher.add_regex(pattern, "contact")
+    matcher.build()
+
+    corpus = make_corpus(message_count, rng)
+    for i in range(message_count):
+        if rng.random() < violation_rate:
+            pos = rng.randint(0, len(corpus[i]))
+            corpus[i] = corpus[i][:pos] + rng.choice(keywords).keyword + corpus[i][pos:]
+
+    legacy_us = _time_per_message(lambda msg: _legacy_replace(matcher, msg), corpus)
+    longest_us = _time_per_message(matcher.replace, corpus)
+    changed = sum(1 for msg in corpus if _legacy_replace(matcher, msg) != matcher.replace(msg))
+    print(f"关键词 {len(nested)}（含嵌套），消息 {message_count}，违规比例 {violation_rate:.0%}")
+    print(f"  旧版: {legacy_us:.1f} us/条  最左最长: {longest_us:.1f} us/条  加速比 {legacy_us / longest_us:.2f}x")
+    print(f"  替换结果不同（旧版只遮住了嵌套里较短的词）的消息: {changed} 条")
+    matcher.clear()
+
+
+def bench_categories(keyword_count=20000, rule_count=100, message_count=10000):
+    """按发送方限定类别：全部命中后再按类型过滤 vs 扫描中用类别掩码过滤（不跑无关的正则）"""
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+    matcher.add_keywords(keywords)
+    for i, pattern in enumerate(make_regex_rules(rule_count)):
+        matcher.add_regex(pattern, "contact" if i % 2 else "phone")
+    matcher.build()
+    corpus = make_corpus(message_count, rng, violation_rate=0.3)
+    for i in range(0, message_count, 3):
+        corpus[i] += rng.choice(keywords).keyword
+
+    def best_of(func, repeat=3):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return result, best
+
+    rule_types = {pattern.pattern: r_type for pattern, r_type in matcher._regex_patterns}
+    scopes = {"用户": ("porn", "gamble", "fraud"), "客服": ("contact", "phone", "fraud")}
+    for scope, categories in scopes.items():
+        def post_filter():
+            return [[m for m in matches
+                     if (m.keyword.type if m.match_type == 'exact' else rule_types[m.keyword]) in categories]
+                    for matches in matcher.search_many(corpus)]
+
+        mask = matcher.category_mask(*categories)
+        expected, post_ms = best_of(post_filter)
+        scoped, mask_ms = best_of(lambda: matcher.search_many(corpus, categories=mask))
+        assert [len(m) for m in scoped] == [len(m) for m in expected]
+        print(f"  {scope} {categories}: 事后过滤 {post_ms:.0f} ms  类别掩码 {mask_ms:.0f} ms  "
+              f"加速比 {post_ms / mask_ms:.2f}x")
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+
+def bench_keyword_memory(keyword_counts=(100000, 1000000), message_count=20000):
+    """关键词表内存占用（tracemalloc，含关键词文本）与批量扫描：MatchResult 列表 vs 紧凑数组"""
+    types = list(VIOLATION_TYPES)
+    for keyword_count in keyword_counts:
+        rng = random.Random(SEED)
+        matcher = KeywordMatcher()
+        matcher.clear()
+        matcher.set_cache_size(0)
+        gc.collect()
+        tracemalloc.start()
+        words = set()
+        while len(words) < keyword_count:
+            words.add(''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(3, 6))))
+        matcher.add_keywords([KeyWord(word, types[i % len(types)]) for i, word in enumerate(words)])
+        sample = rng.sample(sorted(words), 1000)
+        del words
+        matcher.build()
+        gc.collect()
+        total, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        automaton = matcher._snapshot.automaton.get_stats()['total_size']
+        print(f"关键词 {keyword_count}")
+        print(f"  内存: 共 {total / 2 ** 20:.1f} MB（峰值 {peak / 2 ** 20:.1f} MB），其中自动机节点 "
+              f"{automaton / 2 ** 20:.1f} MB，关键词表与索引 {(total - automaton) / 2 ** 20:.1f} MB，"
+              f"每个关键词 {(total - automaton) / keyword_count:.0f} 字节")
+
+        messages = make_corpus(message_count, rng, violation_rate=0.3)
+        for i in range(0, message_count, 2):
+            messages[i] += rng.choice(sample)
+        for scan in (matcher.search_many, matcher.search_many_packed):
+            gc.collect()
+            start = time.perf_counter()
+            scan(messages)
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            result = scan(messages)
+            held, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print(f"  {scan.__name__}: {elapsed * 1000:.0f} ms，结果占用 {held / 1024:.0f} KB")
+        matcher.clear()
+
+
+def bench_regex_budget(rule_count=100, message_count=5000, evil_count=10, evil_length=21):
+    """混入一条会灾难性回溯的规则：不设预算（每条病态消息都卡住） vs 默认预算（第一次超时后隔离）"""
+    rng = random.Random(SEED)
+    corpus = make_corpus(message_count, rng, violation_rate=0.1)
+    for i in range(evil_count):
+        corpus[(i + 1) * message_count // (evil_count + 1)] = 'a' * evil_length + '!'
+    keywords = make_violation_keywords(3000, rng)
+    matcher = KeywordMatcher()
+    matcher.set_cache_size(0)
+    for budget in (None, REGEX_TIME_BUDGET):
+        matcher.clear()
+        matcher.set_regex_budget(budget)
+        matcher.add_keywords(keywords)
+        for i, pattern in enumerate(make_regex_rules(rule_count)):
+            matcher.add_regex(pattern, "contact")
+        matcher.add_regex(r"(a+)+$", "bad")
+        matcher.build()
+        start = time.perf_counter()
+        for msg in corpus:
+            list(matcher.search(msg))
+        elapsed = (time.perf_counter() - start) * 1000
+        label = "不设预算" if budget is None else f"预算 {budget * 1000:.0f} ms"
+        print(f"  {label}: {message_count} 条消息（{evil_count} 条病态）共 {elapsed:.0f} ms")
+        for item in matcher.regex_stats()[:3]:
+            print(f"    #{item['index']} {item['pattern'][:30]}: 调用 {item['calls']} 次，累计 {item['total_ms']:.1f} ms，"
+                  f"最长 {item['max_ms']:.1f} ms{'，已隔离' if item['quarantined'] else ''}")
+    matcher.set_regex_budget(REGEX_TIME_BUDGET)
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+
+def bench_pinyin(keyword_count=5000, message_count=5000, obfuscated_rate=0.2):
+    """关键词写成同音字或拼音：只用精确匹配 / 加模糊匹配 / 加拼音匹配 的检出率和单条耗时"""
+    from pinyin_table import CHAR_PINYIN
+    homophones = {}
+    for ch, syllable in CHAR_PINYIN.items():
+        homophones.setdefault(syllable, []).append(ch)
+
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    corpus = make_corpus(message_count, rng, violation_rate=0)
+    obfuscated = set()
+    for i in range(0, message_count, int(1 / obfuscated_rate)):
+        word = rng.choice(keywords).keyword
+        if i % 2:
+            # 每个字换成随机一个同音字
+            word = ''.join(rng.choice(homophones[CHAR_PINYIN[ch]]) for ch in word)
+        else:
+            word = ' '.join(CHAR_PINYIN[ch] for ch in word)
+        corpus[i] += word
+        obfuscated.add(i)
+
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+    matcher.add_keywords(keywords)
+    matcher.build()
+    modes = [("精确", None), ("精确 + 模糊", lambda: matcher.enable_fuzzy_match(1)),
+             ("精确 + 拼音", lambda: (matcher.clear(), matcher.add_keywords(keywords), matcher.enable_pinyin_match()))]
+    for label, setup in modes:
+        if setup:
+            setup()
+        start = time.perf_counter()
+        results = [list(matcher.search(msg)) for msg in corpus]
+        per_message = (time.perf_counter() - start) / message_count * 1e6
+        caught = sum(1 for i in obfuscated if results[i])
+        false_hits = sum(1 for i, found in enumerate(results) if found and i not in obfuscated)
+        print(f"  {label:<10} 变形消息检出 {caught}/{len(obfuscated)}  其余消息误报 {false_hits}  "
+              f"单条 {per_message:.1f} us")
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+
+def bench_stream(keyword_count=20000, message_count=20000, window=3, split_rate=0.05):
+    """跨消息关键词：每来一条消息把最近 window 条拼起来重扫 vs 流式扫描器只扫新消息"""
+    from stream_scanner import ConversationStream
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    corpus = make_corpus(message_count, rng, violation_rate=0)
+    for i in range(0, message_count - 1, int(1 / split_rate)):
+        word = rng.choice(keywords).keyword
+        cut = rng.randint(1, len(word) - 1)
+        corpus[i] += word[:cut]
+        corpus[i + 1] = word[cut:] + corpus[i + 1]
+
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.add_keywords(keywords)
+    matcher.build()
+
+    start = time.perf_counter()
+    naive = 0
+    for i in range(message_count):
+        recent = corpus[max(0, i - window + 1):i + 1]
+        # 只统计终点落在最新一条消息里的命中，与流式扫描的口径一致
+        tail_start = sum(len(msg) for msg in recent[:-1])
+        naive += sum(1 for m in matcher.search(''.join(recent)) if m.end >= tail_start and m.match_type == 'exact')
+    naive_us = (time.perf_counter() - start) / message_count * 1e6
+
+    stream = ConversationStream(matcher, window=window)
+    start = time.perf_counter()
+    streamed = cross = 0
+    for msg in corpus:
+        for hit in stream.feed(msg):
+            streamed += 1
+            cross += hit.cross_message
+    stream_us = (time.perf_counter() - start) / message_count * 1e6
+    assert streamed == naive
+    print(f"  {message_count} 条消息，{keyword_count} 个关键词，窗口 {window} 条：命中 {streamed}（跨消息 {cross}）")
+    print(f"  拼接最近 {window} 条重扫: {naive_us:.1f} us/条  流式扫描: {stream_us:.1f} us/条  "
+          f"加速比 {naive_us / stream_us:.2f}x")
+    matcher.clear()
+
+
+def bench_fuzzy_batch(keyword_count=5000, message_count=20000, duplicate_rates=(0.0, 0.5, 0.8)):
+    """回扫场景的模糊匹配：逐条 FuzzyIndex.search vs 整批 search_many（窗口去重 + cpdist 向量化打分）"""
+    from fuzzy_index import BATCH_AVAILABLE, FuzzyIndex
+    if not BATCH_AVAILABLE:
+        print("  需要 numpy 和 rapidfuzz >= 3.6，跳过")
+        return
+    rng = random.Random(SEED)
+    words = [kw.keyword for kw in make_violation_keywords(keyword_count, rng)]
+    index = FuzzyIndex(1)
+    index.build(list(enumerate(words)))
+    base = make_corpus(message_count, rng, violation_rate=0)
+    for i in range(0, message_count, 3):
+        word = rng.choice(words)
+        pos = rng.randrange(len(word))
+        base[i] += word[:pos] + rng.choice(COMMON_CHARS) + word[pos + 1:]
+    templates = base[:500]
+    for rate in duplicate_rates:
+        # 回扫的历史消息里有大量重复的话术
+        corpus = [rng.choice(templates) if rng.random() < rate else msg for msg in base]
+        start = time.perf_counter()
+        expected = [index.search(msg, 80) for msg in corpus]
+        single_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        batched = index.search_many(corpus, 80)
+        batch_ms = (time.perf_counter() - start) * 1000
+        assert batched == expected
+        print(f"  重复率 {rate:.0%}: 逐条 {single_ms:.0f} ms  整批 {batch_ms:.0f} ms  加速比 {single_ms / batch_ms:.2f}x")
+
+
+
+def bench_stats(keyword_count=20000, rule_count=50, message_count=20000):
+    """命中计数与分阶段计时的开销：search / search_many 统计关闭 vs 开启"""
+    rng = random.Random(SEED)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+    matcher.add_keywords(make_violation_keywords(keyword_count, rng))
+    for pattern in make_regex_rules(rule_count):
+        matcher.add_regex(pattern, "contact")
+    matcher.build()
+    corpus = make_corpus(message_count, rng, violation_rate=0.1)
+
+    for enabled in (False, True):
+        matcher.enable_stats(enabled)
+        single_us = _time_per_message(lambda text: list(matcher.search(text)), corpus)
+        start = time.perf_counter()
+        for i in range(0, message_count, 100):
+            matcher.search_many(corpus[i:i + 100])
+        many_us = (time.perf_counter() - start) / message_count * 1e6
+        print(f"  统计{'开启' if enabled else '关闭'}: search {single_us:.1f} us/条  search_many {many_us:.1f} us/条")
+    stats = matcher.stats()
+    print(f"  {stats['messages']} 条消息，命中过的关键词 {stats['keywords_hit']}，从未命中 {stats['unused_keywords']}")
+    for stage, hist in stats['stages'].items():
+        if hist['calls']:
+            print(f"    {stage:<9} 平均 {hist['avg_us']:.1f} us  p50 <= {hist['p50_ms']} ms  p99 <= {hist['p99_ms']} ms")
+    matcher.enable_stats(False)
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+
+def bench_exemptions(keyword_count=20000, exemption_count=500, message_count=20000, exempt_rate=0.1):
+    """豁免短语：搜索后再用单独的自动机扫一遍逐个过滤 vs 编进同一个自动机、一遍扫描内丢弃"""
+    import ahocorasick
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    # 豁免短语把关键词包在里面（"禁止" + 关键词 + "行为"）
+    phrases = ["禁止" + kw.keyword + "行为" for kw in rng.sample(keywords, exemption_count)]
+    corpus = make_corpus(message_count, rng, violation_rate=0)
+    for i in range(message_count):
+        roll = rng.random()
+        if roll < exempt_rate:
+            corpus[i] += rng.choice(phrases)
+        elif roll < exempt_rate * 2:
+            corpus[i] += rng.choice(keywords).keyword
+
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+    matcher.add_keywords(keywords)
+    matcher.build()
+    allow = ahocorasick.Automaton()
+    for phrase in phrases:
+        form = matcher._match_form(phrase)
+        allow.add_word(form, len(form))
+    allow.make_automaton()
+
+    def post_filter(text):
+        matches = list(matcher.search(text))
+        if not matches:
+            return matches
+        normalized = matcher._normalize(text)
+        spans = [normalized.span(end - length + 1, end) for end, length in allow.iter(normalized.text)]
+        return [m for m in matches if not any(start <= m.start and m.end <= end for start, end in spans)]
+
+    plain_us = _time_per_message(lambda text: list(matcher.search(text)), corpus)
+    start = time.perf_counter()
+    expected = [post_filter(text) for text in corpus]
+    post_us = (time.perf_counter() - start) / message_count * 1e6
+
+    matcher.add_exemptions(phrases)
+    matcher.build()
+    start = time.perf_counter()
+    found = [list(matcher.search(text)) for text in corpus]
+    single_us = (time.perf_counter() - start) / message_count * 1e6
+    start = time.perf_counter()
+    for i in range(0, message_count, 100):
+        matcher.search_many(corpus[i:i + 100])
+    many_us = (time.perf_counter() - start) / message_count * 1e6
+    sig = lambda matches: [(m.start, m.end) for m in matches]
+    assert [sig(m) for m in found] == [sig(m) for m in expected]
+    print(f"  {message_count} 条消息（约 {exempt_rate:.0%} 含豁免短语），{keyword_count} 个关键词，"
+          f"{exemption_count} 条豁免短语")
+    print(f"  无豁免: {plain_us:.1f} us/条  搜索后二次扫描过滤: {post_us:.1f} us/条  "
+          f"同一自动机 search: {single_us:.1f} us/条  search_many: {many_us:.1f} us/条")
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+def bench_combinations(keyword_count=20000, rule_count=200, message_count=20000, hit_rate=0.05):
+    """组合规则："甲.{0,n}乙|乙.{0,n}甲" 形式的正则 vs 词项编进关键词自动机、由同一遍扫描的命中求值"""
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+    # 每个词项用自己独占的两个字，词项之间不会重叠，两种写法的命中完全一致
+    chars = [chr(code) for code in range(0x4e00, 0x9fa5)
+             if chr(code) not in COMMON_CHARS and matcher._match_form(chr(code)) == chr(code)]
+    terms = [chars[i] + chars[i + 1] for i in range(0, rule_count * 4, 2)]
+    rules = [(terms[2 * i], terms[2 * i + 1], rng.randint(6, 16)) for i in range(rule_count)]
+    corpus = make_corpus(message_count, rng, violation_rate=0)
+    for i in range(message_count):
+        if rng.random() < hit_rate:
+            first, second, window = rng.choice(rules)
+            if rng.random() < 0.5:
+                first, second = second, first
+            gap = ''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(0, window)))
+            pos = rng.randint(0, len(corpus[i]))
+            corpus[i] = corpus[i][:pos] + first + gap + second + corpus[i][pos:]
+
+    matcher.add_keywords(keywords)
+    for first, second, window in rules:
+        gap = window - len(first) - len(second)
+        matcher.add_regex(f"{first}.{{0,{gap}}}{second}|{second}.{{0,{gap}}}{first}", "combination")
+    matcher.build()
+    start = time.perf_counter()
+    expected = [any(m.match_type == 'regex' for m in matcher.search(text)) for text in corpus]
+    regex_us = (time.perf_counter() - start) / message_count * 1e6
+
+    matcher.clear()
+    matcher.set_cache_size(0)
+    matcher.add_keywords(keywords)
+    for first, second, window in rules:
+        matcher.add_combination([first, second], window)
+    matcher.build()
+    start = time.perf_counter()
+    found = [any(m.match_type == 'combination' for m in matcher.search(text)) for text in corpus]
+    combo_us = (time.perf_counter() - start) / message_count * 1e6
+    start = time.perf_counter()
+    for i in range(0, message_count, 100):
+        matcher.search_many(corpus[i:i + 100])
+    many_us = (time.perf_counter() - start) / message_count * 1e6
+    assert found == expected
+    print(f"  {message_count} 条消息（命中 {sum(found)} 条），{keyword_count} 个关键词，{rule_count} 条两词组合规则")
+    print(f"  正则: {regex_us:.1f} us/条  组合规则 search: {combo_us:.1f} us/条  search_many: {many_us:.1f} us/条")
+    matcher.set_cache_size(MATCH_CACHE_SIZE)
+    matcher.clear()
+
+
+def bench_redact_stream(keyword_count=20000, message_count=100000, chunk_size=1 << 16):
+    """大文本脱敏：整段 replace vs 按块的 StreamRedactor（结果一致，比较耗时和峰值内存）"""
+    import io
+    from stream_redactor import StreamRedactor
+    rng = random.Random(SEED)
+    keywords = make_violation_keywords(keyword_count, rng)
+    corpus = make_corpus(message_count, rng)
+    for i in range(0, message_count, 10):
+        corpus[i] += rng.choice(keywords).keyword
+    text = '\n'.join(corpus)
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.add_keywords(keywords)
+    for pattern in make_regex_rules(20):
+        matcher.add_regex(pattern, "contact")
+    matcher.build()
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    expected = matcher.replace(text)
+    whole_s = time.perf_counter() - start
+    whole_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    redactor = StreamRedactor(matcher)
+    reader = io.StringIO(text)
+    writer = io.StringIO()
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    redactor.redact_stream(reader, writer, chunk_size)
+    stream_s = time.perf_counter() - start
+    stream_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert writer.getvalue() == expected
+    # StringIO 输出本身随文件增长，实际写文件时不占内存，这里从峰值中扣除
+    stream_peak -= sys.getsizeof(writer.getvalue())
+    print(f"  文本 {len(text) / 1e6:.1f}M 字符，{keyword_count} 个关键词，块大小 {chunk_size}，重叠 {redactor.overlap}")
+    print(f"  整段 replace: {whole_s:.2f} s，峰值 {whole_peak / 2 ** 20:.1f} MB  "
+          f"StreamRedactor: {stream_s:.2f} s，峰值约 {max(stream_peak, 0) / 2 ** 20:.1f} MB")
+    matcher.clear()
+
+
+if __name__ == "__main__":
+    print(f"Python版本: {sys.version}")
+    print("\n===== 正则规则扫描开销 =====")
+    bench_regex_rules()
+    print("\n===== 中英混排大小写不敏感的起点计算 =====")
+    bench_case_insensitive_offsets()
+    print("\n===== 违规判定（verdict 提前退出） =====")
+    print("[精确 + 正则]")
+    bench_verdict(message_count=10000)
+    print("[精确 + 正则 + 模糊]")
+    bench_verdict(fuzzy=True)
+    print("\n===== 重复扫描对话的结果缓存 =====")
+    bench_match_cache()
+    print("\n===== 嵌套关键词替换（最左最长） =====")
+    bench_replace()
+    print("\n===== 按类别限定的搜索 =====")
+    bench_categories()
+    print("\n===== 正则时间预算与隔离 =====")
+    bench_regex_budget()
+    print("\n===== 拼音/同音字匹配 =====")
+    bench_pinyin()
+    print("\n===== 跨消息流式扫描 =====")
+    bench_stream()
+    print("\n===== 批量模糊打分 =====")
+    bench_fuzzy_batch()
+    print("\n===== 命中统计与分阶段计时的开销 =====")
+    bench_stats()
+    print("\n===== 豁免短语 =====")
+    bench_exemptions()
+    print("\n===== 组合规则 =====")
+    bench_combinations()
+    print("\n===== 大文本流式脱敏 =====")
+    bench_redact_stream()
+    print("\n===== 关键词表内存与紧凑结果 =====")
+    bench_keyword_memory()
+    print("\n===== 分片多进程匹配 =====")
+    bench_sharded()
@@ -0,0 +1,305 @@
+"""
+KeywordMatcher 基准测试套件
+
+每个关键词规模在独立的子进程里运行（峰值内存互不影响），测量：
+    add_s / build_s      添加关键词、构建自动机的耗时
+    save_s / load_s      保存、加载编译后规则文件的耗时，artifact_mb 为文件大小
+    exact                只有关键词时 search() 的吞吐（条/秒、MB/秒）和单条延迟 p50/p99
+    regex                再加上正则规则后的 search()
+    replace              同一配置下的 replace()
+    batch                同一配置下按对话分批的 search_many()（关闭结果缓存）
+    fuzzy                再开启模糊匹配后的 search()（关键词数超过 --fuzzy-max 时跳过）
+    fuzzy_batch          同一配置下按对话分批的 search_many()，模糊阶段走批量打分
+    peak_rss_mb          子进程的峰值常驻内存
+
+结果写成 JSON，并与保存的基线比较，超过容差的回归会列出并以非零状态退出：
+    python bench_suite.py                          # 全部规模，与 bench_baseline.json 比较
+    python bench_suite.py --sizes 1000 10000       # 只跑小规模
+    python bench_suite.py --save-baseline          # 把本次结果保存为新基线
+基线与机器相关，应在同一台（或同配置的）机器上生成和比较。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from Filter import KeywordMatcher, KeyWord
+from bench_filter import COMMON_CHARS, SEED, VIOLATION_TYPES, make_corpus, make_regex_rules
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+# 每段对话的消息数（batch 阶段按此分批调用 search_many）
+CONVERSATION_LENGTH = 30
+
+# 比较时忽略的绝对差值：过小的耗时差异主要是噪声
+_MIN_DELTA = {'_s': 0.01, '_us': 5.0, '_mb': 5.0}
+
+
+def make_keywords(count: int, rng: random.Random) -> List[KeyWord]:
+    """生成 count 个互不相同的中文关键词（3-6 个常用字），类型轮流取违规类型"""
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(COMMON_CHARS) for _ in range(rng.randint(3, 6))))
+    types = list(VIOLATION_TYPES)
+    return [KeyWord(word, types[i % len(types)]) for i, word in enumerate(sorted(words))]
+
+
+def make_chat_corpus(count: int, keywords: List[KeyWord], rng: random.Random) -> List[str]:
+    """合成聊天语料：5% 的消息带联系方式，10% 的消息带一个关键词"""
+    messages = make_corpus(count, rng, violation_rate=0.05)
+    for i in range(count):
+        if rng.random() < 0.1:
+            pos = rng.randint(0, len(messages[i]))
+            messages[i] = messages[i][:pos] + rng.choice(keywords).keyword + messages[i][pos:]
+    return messages
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _throughput(func, messages: List[str], corpus_bytes: int, repeat: int) -> Dict[str, float]:
+    """逐条计时，重复 repeat 遍取总耗时最短的一遍（第一遍兼作预热），返回吞吐和延迟分位数"""
+    perf_counter = time.perf_counter
+    latencies = None
+    total = None
+    for _ in range(repeat):
+        run = []
+        for msg in messages:
+            start = perf_counter()
+            func(msg)
+            run.append(perf_counter() - start)
+        if total is None or sum(run) < total:
+            latencies, total = run, sum(run)
+    latencies.sort()
+    return {
+        'msgs_per_s': len(messages) / total,
+        'mb_per_s': corpus_bytes / total / 2 ** 20,
+        'p50_us': _percentile(latencies, 50) * 1e6,
+        'p99_us': _percentile(latencies, 99) * 1e6,
+    }
+
+
+def _batch_throughput(matcher: KeywordMatcher, messages: List[str], corpus_bytes: int,
+                      repeat: int) -> Dict[str, float]:
+    """按对话分批调用 search_many，延迟按批计"""
+    batches = [messages[i:i + CONVERSATION_LENGTH] for i in range(0, len(messages), CONVERSATION_LENGTH)]
+    result = _throughput(matcher.search_many, batches, corpus_bytes, repeat)
+    result['msgs_per_s'] *= len(messages) / len(batches)
+    return result
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 以 KB 计，macOS 以字节计
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2 ** 20
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_size(keyword_count: int, message_count: int, rule_count: int, fuzzy_max: int, repeat: int = 3) -> Dict:
+    """在当前进程里跑一个关键词规模的全部测量"""
+    rng = random.Random(SEED)
+    keywords = make_keywords(keyword_count, rng)
+    messages = make_chat_corpus(message_count, keywords, rng)
+    corpus_bytes = sum(len(msg.encode('utf-8')) for msg in messages)
+    result: Dict = {'keywords': keyword_count}
+
+    matcher = KeywordMatcher()
+    matcher.clear()
+    matcher.set_cache_size(0)
+
+    start = time.perf_counter()
+    matcher.add_keywords(keywords)
+    result['add_s'] = time.perf_counter() - start
+    del keywords
+    start = time.perf_counter()
+    matcher.build()
+    result['build_s'] = time.perf_counter() - start
+
+    def search(msg):
+        for _ in matcher.search(msg):
+            pass
+
+    result['exact'] = _throughput(search, messages, corpus_bytes, repeat)
+
+    for i, pattern in enumerate(make_regex_rules(rule_count)):
+        matcher.add_regex(pattern, "contact" if i % 2 else "phone")
+    matcher.build()
+    result['regex'] = _throughput(search, messages, corpus_bytes, repeat)
+    result['replace'] = _throughput(matcher.replace, messages, corpus_bytes, repeat)
+    result['batch'] = _batch_throughput(matcher, messages, corpus_bytes, repeat)
+
+    fd, path = tempfile.mkstemp(suffix='.kwm')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        matcher.save(path)
+        result['save_s'] = time.perf_counter() - start
+        result['artifact_mb'] = os.path.getsize(path) / 2 ** 20
+        matcher.clear()
+        start = time.perf_counter()
+        matcher.load(path)
+        result['load_s'] = time.perf_counter() - start
+    finally:
+        os.remove(path)
+
+    if keyword_count <= fuzzy_max:
+        start = time.perf_counter()
+        matcher.enable_fuzzy_match(max_distance=1)
+        result['fuzzy_build_s'] = time.perf_counter() - start
+        # 模糊匹配慢一个数量级，只跑一遍
+        result['fuzzy'] = _throughput(search, messages, corpus_bytes, 1)
+        result['fuzzy_batch'] = _batch_throughput(matcher, messages, corpus_bytes, 1)
+
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run_suite(sizes, message_count: int, rule_count: int, fuzzy_max: int, repeat: int) -> Dict:
+    """每个规模启动一个子进程运行 run_size"""
+    results = {}
+    for size in sizes:
+        print(f"[基准] 关键词 {size} ...", flush=True)
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', str(size), '--result', path,
+                            '--messages', str(message_count), '--rules', str(rule_count),
+                            '--fuzzy-max', str(fuzzy_max), '--repeat', str(repeat)], check=True)
+            with open(path, 'r', encoding='utf-8') as f:
+                results[str(size)] = json.load(f)
+        finally:
+            os.remove(path)
+        _print_size(results[str(size)])
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': SEED,
+            'messages': message_count,
+            'rules': rule_count,
+            'fuzzy_max': fuzzy_max,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def _print_size(result: Dict):
+    print(f"  构建 {result['build_s']:.2f}s  加载 {result['load_s']:.3f}s  规则文件 {result['artifact_mb']:.1f} MB  "
+          f"峰值内存 {result['peak_rss_mb'] or 0:.0f} MB")
+    for stage in ('exact', 'regex', 'replace', 'batch', 'fuzzy', 'fuzzy_batch'):
+        if stage in result:
+            m = result[stage]
+            print(f"  {stage:<11} {m['msgs_per_s']:>9.0f} 条/s  {m['mb_per_s']:>6.2f} MB/s  "
+                  f"p50 {m['p50_us']:>8.1f} us  p99 {m['p99_us']:>8.1f} us")
+
+
+def _flatten(result: Dict, prefix: str = '') -> Dict[str, float]:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and key != 'keywords':
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    与基线逐项比较，返回回归说明列表
+    吞吐（*_per_s）越高越好，其余（耗时、延迟、内存、文件大小）越低越好
+    """
+    if current['meta'].get('messages') != baseline['meta'].get('messages') or \
+            current['meta'].get('rules') != baseline['meta'].get('rules'):
+        print("[基准] 警告: 语料或规则数量与基线不同，比较结果仅供参考")
+
+    regressions = []
+    for size, result in current['results'].items():
+        base = baseline['results'].get(size)
+        if base is None:
+            continue
+        base_flat = _flatten(base)
+        for name, value in sorted(_flatten(result).items()):
+            old = base_flat.get(name)
+            if old is None or value is None or not old:
+                continue
+            higher_is_better = name.endswith('_per_s')
+            change = (value - old) / old
+            worse = -change if higher_is_better else change
+            min_delta = next((delta for suffix, delta in _MIN_DELTA.items() if name.endswith(suffix)), 0)
+            if worse > tolerance and abs(value - old) > min_delta:
+                regressions.append(f"关键词 {size} {name}: {old:.4g} -> {value:.4g} ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="KeywordMatcher 基准测试套件")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="关键词规模")
+    parser.add_argument('--messages', type=int, default=20000, help="语料消息数")
+    parser.add_argument('--rules', type=int, default=100, help="正则规则数")
+    parser.add_argument('--fuzzy-max', type=int, default=100000, help="超过该关键词数时跳过模糊匹配")
+    parser.add_argument('--repeat', type=int, default=3, help="每项吞吐测量的重复次数（取最快的一遍）")
+    parser.add_argument('--output', default='bench_results.json', help="结果文件")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="基线文件")
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的相对退化（0.2 即 20%%）")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        result = run_size(args.worker, args.messages, args.rules, args.fuzzy_max, args.repeat)
+        with open(args.result, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return 0
+
+    current = run_suite(args.sizes, args.messages, args.rules, args.fuzzy_max, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"[基准] 结果已写入 {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"[基准] 已保存为基线 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("[基准] 没有基线文件，跳过比较（使用 --save-baseline 生成）")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance)
+    if regressions:
+        print(f"[基准] 发现 {len(regressions)} 项超过 {args.tolerance:.0%} 的回归:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"[基准] 与基线相比没有超过 {args.tolerance:.0%} 的回归")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+组合规则（"微信" 和 "转账" 相距不超过 N 个字、"加…信" 这类带间隔的关键词）
+词项和关键词编进同一个自动机，规则不再写成回溯的正则，而是由一条消息的词项命中
+（自动机按结束位置产出，天然有序）一遍求出：每个规则记住各词项最近一次出现的位置，
+新的词项命中到来时检查窗口
+"""
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+# 自动机中组合规则词项的值标记：词项 i 存为 TERM_ID_BASE - i（EXEMPT_ID 为 -1）
+TERM_ID_BASE = -2
+
+
+class CombinationRule(NamedTuple):
+    terms: Tuple[str, ...]   # 词项原文
+    window: int              # 整个组合（第一个词项起点到最后一个词项终点）最多的字符数
+    type: str
+    ordered: bool            # 是否要求按 terms 的顺序出现且互不重叠
+
+    @property
+    def label(self) -> str:
+        """结果中代替关键词显示的文本，如 "微信&转账/10"、"加…信/5\""""
+        return ('…' if self.ordered else '&').join(self.terms) + f"/{self.window}"
+
+
+class ComboIndex:
+    """
+    一个快照的组合规则，构建后只读
+    词项按匹配形式去重编号；本身就是关键词的词项命中时值是关键词ID，用 term_of_keyword 换算
+    """
+
+    def __init__(self, rules: Sequence[CombinationRule], forms: Sequence[Tuple[str, ...]],
+                 keyword_to_id: Dict[str, int]):
+        """
+        :param rules: 规则，下标即规则编号
+        :param forms: 每条规则各词项的匹配形式
+        :param keyword_to_id: 关键词匹配形式 -> 关键词ID
+        """
+        self.rules = tuple(rules)
+        self.terms: Dict[str, int] = {}             # 匹配形式 -> 词项编号
+        self.term_of_keyword: Dict[int, int] = {}   # 关键词ID -> 词项编号
+        self.rule_terms: List[Tuple[int, ...]] = []
+        self.uses: List[List[Tuple[int, int]]] = []  # 词项编号 -> [(规则编号, 在规则中的位置), ...]
+        for rule_index, rule_forms in enumerate(forms):
+            term_ids = []
+            for form in rule_forms:
+                term = self.terms.get(form)
+                if term is None:
+                    term = self.terms[form] = len(self.terms)
+                    self.uses.append([])
+                    keyword_id = keyword_to_id.get(form)
+                    if keyword_id is not None:
+                        self.term_of_keyword[keyword_id] = term
+                term_ids.append(term)
+            self.rule_terms.append(tuple(term_ids))
+            # 同一词项在有序规则里出现多次时按位置从后往前更新，一次命中不会被连用两次
+            for position in reversed(range(len(term_ids))):
+                self.uses[term_ids[position]].append((rule_index, position))
+
+    def automaton_words(self) -> List[Tuple[str, int]]:
+        """需要单独加进自动机的词项（不是关键词的那些）：(匹配形式, 自动机中的值标记)"""
+        keyword_terms = set(self.term_of_keyword.values())
+        return [(form, TERM_ID_BASE - term) for form, term in self.terms.items() if term not in keyword_terms]
+
+    def match(self, hits: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+        """
+        :param hits: 一条消息的词项命中 (起点, 终点, 词项编号)，按终点排列
+        :return: 规则命中 [(起点, 终点, 规则编号), ...]，同一条规则的命中互不重叠，按终点排列
+        """
+        found = []
+        # 规则编号 -> 各位置的状态；无序规则存该词项最近一次的起点，有序规则存以该位置结尾的链的 (起点, 终点)
+        state: Dict[int, list] = {}
+        rules = self.rules
+        rule_terms = self.rule_terms
+        for start, end, term in hits:
+            for rule_index, position in self.uses[term]:
+                rule = rules[rule_index]
+                slots = state.get(rule_index)
+                if slots is None:
+                    slots = state[rule_index] = [None] * len(rule_terms[rule_index])
+                if rule.ordered:
+                    if position == 0:
+                        slots[0] = (start, end)
+                    else:
+                        chain = slots[position - 1]
+                        if chain is None or chain[1] >= start:
+                            continue  # 前面的词项还没出现，或与这次命中重叠
+                        slots[position] = (chain[0], end)
+                    chain = slots[-1]
+                    if chain is None or chain[1] != end:
+                        continue
+                    first = chain[0]
+                else:
+                    slots[position] = start
+                    if None in slots:
+                        continue
+                    first = min(slots)
+                if end - first + 1 <= rule.window:
+                    found.append((first, end, rule_index))
+                    # 用过的词项命中不再参与这条规则之后的命中
+                    state[rule_index] = [None] * len(slots)
+        return found
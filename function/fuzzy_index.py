@@ -0,0 +1,351 @@
+from itertools import accumulate, combinations
+from typing import Dict, Iterator, List, Set, Tuple
+
+from rapidfuzz import fuzz, process
+
+try:
+    import numpy as np
+except ImportError:  # 批量打分需要 numpy，没有时退回逐条搜索
+    np = None
+
+# 批量打分需要 rapidfuzz >= 3.6 的 cpdist
+BATCH_AVAILABLE = np is not None and hasattr(process, 'cpdist')
+
+# 批量搜索时一块消息最多收集这么多个不同的窗口（窗口去重表约 100 MB），超过就先打分
+BATCH_BLOCK_WINDOWS = 500_000
+
+
+class FuzzyIndex:
+    """
+    SymSpell 风格的删除索引，用于模糊匹配的候选生成
+    关键词在建索引时生成所有 ≤ max_distance 次删除的变体，
+    搜索时对消息的滑动窗口生成同样的删除变体并查表，
+    候选只和少量关键词比较，开销与关键词总数无关；
+    窗口先经过字符、二元组的前缀和过滤，max_distance 为 1 时再按长度跳过打分达不到阈值的删除变体查询；
+    长度不超过 max_distance 的关键词（距离 1 时的单字词）删除后是空串、会匹配任意窗口，不进索引，只做精确匹配
+    """
+
+    def __init__(self, max_distance: int = 1):
+        self.max_distance = max_distance
+        # 删除变体 -> 关键词ID元组；值不可变，copy() 只需浅拷贝字典
+        self._deletes: Dict[str, Tuple[int, ...]] = {}
+        self._words: Dict[int, str] = {}          # 关键词ID -> 关键词（已归一化）
+        self._length_count: Dict[int, int] = {}   # 关键词长度 -> 数量
+        self._char_count: Dict[str, int] = {}     # 关键词中出现的字符 -> 出现次数
+        self._bigram_count: Dict[str, int] = {}   # 关键词中出现的相邻两字 -> 出现次数
+        self._window_lengths: List[int] = []
+        self._plans: Dict[float, List[Tuple[int, bool]]] = {}  # 阈值 -> _window_plan 的结果
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def _variants(self, word: str) -> Set[str]:
+        """生成 word 本身及其 ≤ max_distance 次删除的所有变体"""
+        n = len(word)
+        if self.max_distance == 1:
+            # 常见情况：单次删除直接切片，避免 combinations 的开销
+            variants = {word[:i] + word[i + 1:] for i in range(n)}
+            variants.add(word)
+            variants.discard('')
+            return variants
+        variants = {word}
+        for depth in range(1, min(self.max_distance, n) + 1):
+            for removed in combinations(range(n), depth):
+                variants.add(''.join(ch for i, ch in enumerate(word) if i not in removed))
+        variants.discard('')
+        return variants
+
+    def add(self, word_id: int, word: str) -> bool:
+        """
+        加入一个关键词
+        :return: 是否进了索引；已存在或长度不超过 max_distance 的词不加入，返回 False
+        """
+        # 长度不超过编辑距离的词删除后为空串，会匹配任意窗口，不建索引
+        if len(word) <= self.max_distance or word_id in self._words:
+            return False
+        self._words[word_id] = word
+        deletes = self._deletes
+        for variant in self._variants(word):
+            deletes[variant] = deletes.get(variant, ()) + (word_id,)
+        self._length_count[len(word)] = self._length_count.get(len(word), 0) + 1
+        self._count_grams(word)
+        self._window_lengths = []
+        self._plans = {}
+        return True
+
+    def remove(self, word_id: int):
+        word = self._words.pop(word_id, None)
+        if word is None:
+            return
+        for variant in self._variants(word):
+            ids = self._deletes.get(variant)
+            if ids is None:
+                continue
+            ids = tuple(i for i in ids if i != word_id)
+            if ids:
+                self._deletes[variant] = ids
+            else:
+                del self._deletes[variant]
+        remaining = self._length_count[len(word)] - 1
+        if remaining:
+            self._length_count[len(word)] = remaining
+        else:
+            del self._length_count[len(word)]
+        for counts, gram in self._grams(word):
+            remaining = counts[gram] - 1
+            if remaining:
+                counts[gram] = remaining
+            else:
+                del counts[gram]
+        self._window_lengths = []
+        self._plans = {}
+
+    def build(self, words: List[Tuple[int, str]]):
+        """用 (关键词ID, 关键词) 列表重建索引，长度不超过 max_distance 的词跳过并汇总打印"""
+        self.clear()
+        # 批量建索引先用列表累积，避免逐个拼接元组
+        buckets: Dict[str, List[int]] = {}
+        short = 0
+        for word_id, word in words:
+            if len(word) <= self.max_distance:
+                short += 1
+                continue
+            if word_id in self._words:
+                continue
+            self._words[word_id] = word
+            for variant in self._variants(word):
+                buckets.setdefault(variant, []).append(word_id)
+            self._length_count[len(word)] = self._length_count.get(len(word), 0) + 1
+            self._count_grams(word)
+        self._deletes = {variant: tuple(ids) for variant, ids in buckets.items()}
+        if short:
+            print(f"[模糊匹配] {short} 个关键词不超过 {self.max_distance} 个字，不参与模糊匹配（仍做精确匹配）")
+
+    def copy(self) -> 'FuzzyIndex':
+        """独立副本，之后对原索引的增删不影响副本"""
+        other = FuzzyIndex(self.max_distance)
+        other._deletes = self._deletes.copy()
+        other._words = self._words.copy()
+        other._length_count = self._length_count.copy()
+        other._char_count = self._char_count.copy()
+        other._bigram_count = self._bigram_count.copy()
+        return other
+
+    def clear(self):
+        # 换成新字典而不是原地清空，已交给其他线程的副本不受影响
+        self._deletes = {}
+        self._words = {}
+        self._length_count = {}
+        self._char_count = {}
+        self._bigram_count = {}
+        self._window_lengths = []
+        self._plans = {}
+
+    def _grams(self, word: str) -> Iterator[Tuple[Dict[str, int], str]]:
+        """word 中的字符和相邻两字，连同各自所属的计数表"""
+        for ch in word:
+            yield self._char_count, ch
+        for i in range(len(word) - 1):
+            yield self._bigram_count, word[i:i + 2]
+
+    def _count_grams(self, word: str):
+        for counts, gram in self._grams(word):
+            counts[gram] = counts.get(gram, 0) + 1
+
+    def _get_window_lengths(self) -> List[int]:
+        if not self._window_lengths and self._length_count:
+            lengths = set()
+            for length in self._length_count:
+                for delta in range(-self.max_distance, self.max_distance + 1):
+                    if length + delta > 0:
+                        lengths.add(length + delta)
+            self._window_lengths = sorted(lengths)
+        return self._window_lengths
+
+    def _window_plan(self, score_cutoff: float) -> List[Tuple[int, bool]]:
+        """
+        各窗口长度，以及该长度的窗口要不要查删除变体
+        max_distance 为 1 时，窗口删掉一个字只会找到短一个字的关键词和同长度、替换了一个字的关键词；
+        fuzz.ratio 的 indel 距离至少是长度差，同长度又不相同时至少是 2，两种都到不了阈值的长度只查窗口本身
+        """
+        plan = self._plans.get(score_cutoff)
+        if plan is None:
+            lengths = self._length_count
+
+            def reachable(length: int, other: int, indel: int) -> bool:
+                return other in lengths and 100 * (1 - indel / (length + other)) >= score_cutoff - 1e-9
+
+            plan = [(length, self.max_distance != 1 or reachable(length, length - 1, 1)
+                     or reachable(length, length, 2)) for length in self._get_window_lengths()]
+            self._plans[score_cutoff] = plan
+        return plan
+
+    def _candidates(self, window: str) -> Set[int]:
+        """与窗口有相同删除变体的关键词ID"""
+        deletes = self._deletes
+        ids = set()
+        if self.max_distance == 1:
+            # 常见情况：直接查窗口本身和逐个删掉一个字的串，不先构造变体集合
+            found = deletes.get(window)
+            if found:
+                ids.update(found)
+            for i in range(len(window)):
+                found = deletes.get(window[:i] + window[i + 1:])
+                if found:
+                    ids.update(found)
+            return ids
+        for variant in self._variants(window):
+            found = deletes.get(variant)
+            if found:
+                ids.update(found)
+        return ids
+
+    def _known_prefix(self, text: str) -> List[int]:
+        """
+        前缀计数：known[j] - known[i] 是 text[i:j] 中在关键词里出现过的字符数
+        窗口要和某个关键词有相同的删除变体，至少 长度 - max_distance 个字符必须出现在关键词里，
+        不满足的窗口不用生成变体
+        """
+        chars = self._char_count
+        return [0, *accumulate(ch in chars for ch in text)]
+
+    def _windows(self, text: str, score_cutoff: float) -> Iterator[Tuple[int, int, bool]]:
+        """
+        逐个产出可能有命中的窗口 (起点, 长度, 是否查删除变体)
+        两道前缀和过滤：至少 长度 - max_distance 个字符在关键词里出现过；
+        至少 长度 - 1 - 3 * max_distance 个相邻两字在关键词里出现过
+        （窗口删一个字最多破坏窗口里的两个相邻两字，关键词删一个字相当于往窗口插一个字，再破坏一个）
+        """
+        n = len(text)
+        known = self._known_prefix(text)
+        known_bigrams = None
+        for length, deletions in self._window_plan(score_cutoff):
+            if length > n:
+                break
+            need = length - self.max_distance
+            need_bigrams = length - 1 - 3 * self.max_distance
+            if need_bigrams > 0 and known_bigrams is None:
+                # known_bigrams[j] - known_bigrams[i] 是从 text[i:j] 各位置开始的相邻两字里出现过的个数
+                bigrams = self._bigram_count
+                known_bigrams = [0, *accumulate(text[i:i + 2] in bigrams for i in range(n - 1))]
+            for start in range(n - length + 1):
+                if known[start + length] - known[start] < need:
+                    continue
+                if need_bigrams > 0 and known_bigrams[start + length - 1] - known_bigrams[start] < need_bigrams:
+                    continue
+                yield start, length, deletions
+
+    def iter_hits(self, text: str, score_cutoff: float) -> Iterator[Tuple[int, int, int, float]]:
+        """
+        按窗口扫描顺序逐个产出达到阈值的 (start, end, word_id, score)，不做去重
+        只需判断有没有命中时可以在第一个命中处停下
+        """
+        if not self._words:
+            return
+
+        words = self._words
+        deletes = self._deletes
+        for start, length, deletions in self._windows(text, score_cutoff):
+            window = text[start:start + length]
+            # 不用查删除变体的窗口只查它本身，值元组里的ID互不重复，不用再放进集合
+            for word_id in self._candidates(window) if deletions else deletes.get(window, ()):
+                score = fuzz.ratio(window, words[word_id], score_cutoff=score_cutoff)
+                if score:
+                    yield start, start + length - 1, word_id, score
+
+    def search(self, text: str, score_cutoff: float) -> List[Tuple[int, int, int, float]]:
+        """
+        在 text 中查找模糊命中
+        :return: [(start, end, word_id, score), ...]，end 为闭区间；
+                 同一关键词的命中互不重叠，完全相同（score=100）的窗口交给精确匹配处理
+        """
+        # 关键词ID -> [(score, start, end)]
+        candidates: Dict[int, List[Tuple[float, int, int]]] = {}
+        for start, end, word_id, score in self.iter_hits(text, score_cutoff):
+            candidates.setdefault(word_id, []).append((score, start, end))
+        return self._select(candidates)
+
+    @staticmethod
+    def _select(candidates: Dict[int, List[Tuple[float, int, int]]]) -> List[Tuple[int, int, int, float]]:
+        results = []
+        for word_id, hits in candidates.items():
+            # 分数高者优先、同分取短窗口，贪心挑出互不重叠的窗口
+            hits.sort(key=lambda h: (-h[0], h[2] - h[1], h[1]))
+            taken: List[Tuple[int, int]] = []
+            for score, start, end in hits:
+                if any(start <= t_end and t_start <= end for t_start, t_end in taken):
+                    continue
+                taken.append((start, end))
+                if score < 100:
+                    results.append((start, end, word_id, score))
+        results.sort(key=lambda r: (r[0], r[1], r[2]))
+        return results
+
+    def search_many(self, texts: List[str], score_cutoff: float, workers: int = -1,
+                    block_windows: int = BATCH_BLOCK_WINDOWS) -> List[List[Tuple[int, int, int, float]]]:
+        """
+        批量模糊搜索（夜间回扫等大批量场景），结果与逐条调用 search 相同
+        一块消息里重复出现的窗口只查一次删除索引；全部 (窗口, 候选关键词) 组合交给
+        rapidfuzz.process.cpdist 一次打分（C 层多线程），阈值判断和位置还原在得分数组上做，只有命中回到 Python
+        :param workers: 打分线程数，-1 表示全部 CPU
+        :param block_windows: 一块最多收集的不同窗口数，控制内存
+        """
+        if not BATCH_AVAILABLE:
+            return [self.search(text, score_cutoff) for text in texts]
+        results: List[List[Tuple[int, int, int, float]]] = [[] for _ in texts]
+        if not self._words:
+            return results
+
+        row_of: Dict[str, int] = {}         # 窗口 -> 行号，没有候选关键词的窗口为 -1
+        windows: List[str] = []             # 行号 -> 窗口
+        pair_rows: List[int] = []           # 需要打分的 (行号, 关键词ID)，即逐条搜索时调用 fuzz.ratio 的组合
+        pair_ids: List[int] = []
+        occurrences: List[Tuple[int, int, int, int]] = []  # (消息序号, 起点, 长度, 行)
+        for msg_index, text in enumerate(texts):
+            for start, length, deletions in self._windows(text, score_cutoff):
+                window = text[start:start + length]
+                row = row_of.get(window)
+                if row is None:
+                    ids = self._candidates(window) if deletions else self._deletes.get(window, ())
+                    if not ids:
+                        row_of[window] = -1
+                        continue
+                    row = row_of[window] = len(windows)
+                    windows.append(window)
+                    pair_rows.extend([row] * len(ids))
+                    pair_ids.extend(ids)
+                if row >= 0:
+                    occurrences.append((msg_index, start, length, row))
+            if len(row_of) >= block_windows or msg_index == len(texts) - 1:
+                self._score_block(windows, pair_rows, pair_ids, occurrences, score_cutoff, workers, results)
+                row_of, windows, pair_rows, pair_ids, occurrences = {}, [], [], [], []
+        return results
+
+    def _score_block(self, windows: List[str], pair_rows: List[int], pair_ids: List[int],
+                     occurrences: List[Tuple[int, int, int, int]], score_cutoff: float, workers: int,
+                     results: List[List[Tuple[int, int, int, float]]]):
+        if not pair_rows:
+            return
+        # 候选组合很稀疏，用 cpdist 逐对打分；cdist 的稠密矩阵里绝大多数格子用不到
+        words = self._words
+        scores = process.cpdist([windows[row] for row in pair_rows], [words[word_id] for word_id in pair_ids],
+                                scorer=fuzz.ratio, score_cutoff=score_cutoff, dtype=np.float64, workers=workers)
+        keep = np.flatnonzero(scores >= score_cutoff)
+        if not len(keep):
+            return
+        # 行号 -> [(关键词ID, 得分)]，只含达到阈值的组合
+        hits_by_row: Dict[int, List[Tuple[int, float]]] = {}
+        for i, score in zip(keep.tolist(), scores[keep].tolist()):
+            hits_by_row.setdefault(pair_rows[i], []).append((pair_ids[i], score))
+
+        # 窗口出现的位置还原成各条消息里的 (起点, 终点)，再按消息做同 search 的去重挑选
+        per_message: Dict[int, Dict[int, List[Tuple[float, int, int]]]] = {}
+        for msg_index, start, length, row in occurrences:
+            hits = hits_by_row.get(row)
+            if hits is None:
+                continue
+            candidates = per_message.setdefault(msg_index, {})
+            for word_id, score in hits:
+                candidates.setdefault(word_id, []).append((score, start, start + length - 1))
+        for msg_index, candidates in per_message.items():
+            results[msg_index] = self._select(candidates)
@@ -0,0 +1,177 @@
+"""
+关键词变更同步
+数据库的关键词增删会同时写入 keyword_changes 变更日志（seq 单调递增），
+运行中的匹配器记录已应用到的序号，后台轮询只拉取之后的变更并整批应用，
+改一个词不需要重新加载整张关键词表；少量增删叠加在原自动机上生效，也不重建整个自动机
+（见 KeywordMatcher.apply_changes）
+"""
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from function.Filter import KeywordMatcher, KeyWord
+
+
+def open_keyword_db():
+    """按系统配置打开关键词库：优先 MySQL，未配置或连接失败时回退 SQLite"""
+    from database.mysql_pool_db import MySQLKeywordDBPool
+    from database.sqlite_db import KeywordDB
+    from config.database_config import DatabaseConfig
+
+    try:
+        config = DatabaseConfig.load_config()
+        if config:
+            db = MySQLKeywordDBPool(config)
+            if db.test_connection():
+                return db
+            print("MySQL连接失败，使用SQLite关键词库")
+    except Exception as e:
+        print(f"打开MySQL关键词库失败: {e}")
+    return KeywordDB("BaseData/violation_keywords.db")
+
+
+def load_all_keywords(matcher: KeywordMatcher, db) -> int:
+    """
+    从数据库全量加载关键词
+    先记下变更日志的最新序号再读整张表，读表期间发生的变更会被之后的轮询再应用一次（增删都是幂等的）
+    :return: 加载的关键词数量
+    """
+    change_seq = db.get_latest_change_seq()
+    keywords = []
+    for row in db.get_all_keywords():
+        if isinstance(row, (tuple, list)):
+            # MySQL: (id, keyword, type, created_at)
+            keywords.append(KeyWord(row[1], row[2]))
+        else:
+            # SQLite: keyword
+            keywords.append(KeyWord(row))
+    matcher.add_keywords(keywords)
+    matcher.change_seq = change_seq
+    matcher.build()
+    return len(keywords)
+
+
+class KeywordChangePoller:
+    """
+    后台轮询关键词变更日志，把增量整批应用到匹配器
+    MySQL 的自增序号按分配顺序而不是提交顺序可见，遇到序号空洞时先停在空洞前，
+    超过 gap_timeout 仍未补上（事务回滚）才跳过
+    """
+
+    def __init__(self, matcher: KeywordMatcher, db, interval: float = 5.0,
+                 batch_size: int = 1000, gap_timeout: float = 30.0):
+        """
+        :param matcher: 要同步的匹配器
+        :param db: 关键词库实例（MySQLKeywordDBPool 或 KeywordDB）
+        :param interval: 轮询间隔（秒）
+        :param batch_size: 单次拉取的最大变更数
+        :param gap_timeout: 序号空洞的最长等待时间（秒）
+        """
+        self.matcher = matcher
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.gap_timeout = gap_timeout
+
+        self._lock = threading.Lock()
+        self._gap_since: Optional[float] = None
+        self._wake = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def poll_once(self) -> int:
+        """拉取并应用一次变更，返回应用的条数"""
+        with self._lock:
+            applied = 0
+            while True:
+                last_seq = self.matcher.change_seq
+                rows = self.db.get_keyword_changes(last_seq, self.batch_size)
+                if not rows:
+                    self._gap_since = None
+                    return applied
+
+                batch = []
+                next_seq = last_seq
+                for seq, op, keyword, keyword_type in rows:
+                    if seq != next_seq + 1 and not self._gap_expired():
+                        break
+                    self._gap_since = None
+                    batch.append((op, keyword, keyword_type))
+                    next_seq = seq
+                if not batch:
+                    return applied
+
+                self.matcher.apply_changes(batch, next_seq)
+                applied += len(batch)
+                if len(batch) < len(rows) or len(rows) < self.batch_size:
+                    return applied
+
+    def _gap_expired(self) -> bool:
+        now = time.monotonic()
+        if self._gap_since is None:
+            self._gap_since = now
+        return now - self._gap_since >= self.gap_timeout
+
+    def wake(self):
+        """立即触发一次轮询（如本地刚修改了关键词）"""
+        self._wake.set()
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    def _worker(self):
+        while self._running:
+            try:
+                applied = self.poll_once()
+                if applied:
+                    print(f"[关键词同步] 已应用 {applied} 条变更，当前序号 {self.matcher.change_seq}")
+            except Exception as e:
+                print(f"[关键词同步] 应用关键词变更出错: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+# 全局轮询器实例
+_global_poller = None
+_poller_lock = threading.Lock()
+
+
+def start_keyword_poller(matcher: KeywordMatcher, db, interval: float = 5.0) -> KeywordChangePoller:
+    """启动（或切换数据库后重启）全局关键词变更轮询"""
+    global _global_poller
+
+    with _poller_lock:
+        if _global_poller is not None:
+            if _global_poller.matcher is matcher and _global_poller.db is db:
+                return _global_poller
+            _global_poller.stop()
+        _global_poller = KeywordChangePoller(matcher, db, interval)
+        _global_poller.start()
+        return _global_poller
+
+
+def get_keyword_poller() -> Optional[KeywordChangePoller]:
+    """获取全局轮询器，尚未启动时返回 None"""
+    return _global_poller
+
+
+def stop_keyword_poller():
+    global _global_poller
+
+    with _poller_lock:
+        if _global_poller is not None:
+            _global_poller.stop()
+            _global_poller = None
@@ -0,0 +1,64 @@
+"""
+叠加自动机：大的基础自动机 + 小的增量自动机
+变更同步每批只增删少量关键词，为它们重建整个自动机不划算；
+新增的词单独编成一个小自动机，删除的词在基础自动机的输出里按ID过滤，两路命中按位置合并，
+与用全部关键词重建出的自动机输出相同。增量积累到一定规模后由匹配器整体重建合并
+"""
+import heapq
+from typing import Iterable, Optional, Set
+
+import ahocorasick
+
+
+def _hit_order(hit):
+    # 与单个自动机的输出顺序一致：按结束位置，同一位置长的在前
+    end_index, (_, length) = hit
+    return end_index, -length
+
+
+class LayeredAutomaton:
+    """对外提供和 ahocorasick.Automaton 相同的 kind / iter()，命中值同为 (关键词ID, 长度)"""
+    __slots__ = ('base', 'delta', 'removed', 'kind')
+
+    def __init__(self, base: ahocorasick.Automaton, delta: Optional[ahocorasick.Automaton], removed: Set[int]):
+        """
+        :param base: 上次整体构建的自动机
+        :param delta: 之后新增关键词的自动机，没有新增时为 None
+        :param removed: 之后从基础自动机中删除的关键词ID
+        """
+        self.base = base
+        self.delta = delta
+        self.removed = frozenset(removed)
+        # 没有新增、基础自动机又是空的，就和空自动机一样什么都不命中
+        built = base.kind == ahocorasick.AHOCORASICK or delta is not None
+        self.kind = ahocorasick.AHOCORASICK if built else ahocorasick.EMPTY
+
+    def iter(self, text: str) -> '_LayeredIter':
+        return _LayeredIter(self, text)
+
+    def __len__(self):
+        return len(self.base) - len(self.removed) + (len(self.delta) if self.delta is not None else 0)
+
+
+class _LayeredIter:
+    """同 ahocorasick 的迭代器，支持 set(text, reset) 接着上一段文本继续扫描（流式扫描用）"""
+    __slots__ = ('_base', '_delta', '_removed')
+
+    def __init__(self, layered: LayeredAutomaton, text: str):
+        base = layered.base
+        self._base = base.iter(text) if base.kind == ahocorasick.AHOCORASICK else None
+        self._delta = layered.delta.iter(text) if layered.delta is not None else None
+        self._removed = layered.removed
+
+    def set(self, text: str, reset: bool = False):
+        for it in (self._base, self._delta):
+            if it is not None:
+                it.set(text, reset)
+
+    def __iter__(self) -> Iterable:
+        removed = self._removed
+        base = () if self._base is None else (
+            (hit for hit in self._base if hit[1][0] not in removed) if removed else self._base)
+        if self._delta is None:
+            return iter(base)
+        return heapq.merge(base, self._delta, key=_hit_order)
@@ -0,0 +1,86 @@
+"""
+匹配器的命中计数与分阶段耗时直方图
+默认关闭；启用后 search / search_many / search_many_packed 按关键词ID、正则下标、组合规则编号累计命中次数，
+并把每个阶段（归一化、精确、组合规则、拼音、正则、模糊）的单条消息耗时记入固定分桶的直方图
+"""
+from bisect import bisect_left
+from collections import Counter
+from time import perf_counter, time
+from typing import Any, Dict, List, Tuple
+
+# 搜索的各个阶段，按执行顺序
+STAGES = ('normalize', 'exact', 'combination', 'pinyin', 'regex', 'fuzzy')
+
+# 直方图分桶的上界（秒），超过最后一个上界的记入溢出桶
+LATENCY_BUCKETS = (0.00001, 0.00002, 0.00005, 0.0001, 0.0002, 0.0005,
+                   0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+
+
+class MatchStats:
+    """
+    命中计数和阶段耗时，多个搜索线程不加锁累加，个别计数可能丢失，只作排查参考
+    批量接口的阶段耗时按消息条数平均后记入直方图（一批 N 条记 N 次平均值）
+    """
+
+    def __init__(self):
+        self.since = time()
+        self.messages = 0
+        self.keyword_hits: Counter = Counter()   # 关键词ID -> 命中次数
+        self.regex_hits: Counter = Counter()     # 正则下标 -> 命中次数
+        self.combo_hits: Counter = Counter()     # 组合规则编号 -> 命中次数
+        self.stage_counts: Dict[str, List[int]] = {stage: [0] * (len(LATENCY_BUCKETS) + 1) for stage in STAGES}
+        self.stage_total: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+
+    def add_time(self, stage: str, elapsed: float, messages: int = 1):
+        """记录一个阶段处理 messages 条消息的总耗时"""
+        if messages <= 0:
+            return
+        self.stage_counts[stage][bisect_left(LATENCY_BUCKETS, elapsed / messages)] += messages
+        self.stage_total[stage] += elapsed
+
+    def lap(self, stage: str, started: float, messages: int = 1) -> float:
+        """记录从 started（perf_counter）到现在的阶段耗时，返回现在作为下一阶段的起点"""
+        now = perf_counter()
+        if messages <= 0:
+            return now
+        elapsed = now - started
+        # 与 add_time 相同，内联以减少每条消息的调用次数
+        self.stage_counts[stage][bisect_left(LATENCY_BUCKETS, elapsed / messages)] += messages
+        self.stage_total[stage] += elapsed
+        return now
+
+    def histograms(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的直方图：分桶上界（毫秒，最后一个为 None 表示溢出）、各桶条数、累计耗时"""
+        bounds: List[Any] = [bound * 1000 for bound in LATENCY_BUCKETS] + [None]
+        result = {}
+        for stage in STAGES:
+            counts = self.stage_counts[stage]
+            calls = sum(counts)
+            total = self.stage_total[stage]
+            result[stage] = {
+                'bucket_ms': bounds,
+                'counts': counts[:],
+                'calls': calls,
+                'total_ms': total * 1000,
+                'avg_us': total / calls * 1e6 if calls else 0.0,
+                'p50_ms': self._percentile(counts, calls, 0.5),
+                'p99_ms': self._percentile(counts, calls, 0.99),
+            }
+        return result
+
+    @staticmethod
+    def _percentile(counts: List[int], calls: int, q: float):
+        """分位数所在桶的上界（毫秒），落在溢出桶时为 None；只精确到分桶"""
+        if not calls:
+            return 0.0
+        rank = q * calls
+        seen = 0
+        for bucket, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return LATENCY_BUCKETS[bucket] * 1000 if bucket < len(LATENCY_BUCKETS) else None
+        return None
+
+    def hit_counts(self) -> Tuple[Dict[int, int], Dict[int, int]]:
+        """关键词和正则命中次数的副本 (关键词ID -> 次数, 正则下标 -> 次数)，搜索线程可能正在累加"""
+        return dict(self.keyword_hits), dict(self.regex_hits)
@@ -0,0 +1,159 @@
+"""
+编译后的匹配器规则文件格式
+
+文件布局：
+    header      MAGIC(8) | 格式版本 u32 | 关键词数 u32 | 段数 u32 | 保留 u32 | 内容 SHA-256(32)
+    directory   每段一项：段名(16, ASCII 右补 0) | 偏移 u64 | 长度 u64
+    sections    各段数据，起始位置按 8 字节对齐，数组段可以直接对 mmap 做 memoryview.cast
+
+header 与 directory 固定为小端序；数组段按写入机器的字节序存放，由调用方在元数据里记录。
+
+SHA-256 覆盖 directory 和全部段数据，加载时校验，防止文件截断或被改动。
+"""
+import hashlib
+import mmap
+import struct
+from array import array
+from typing import Dict
+
+MAGIC = b'KWMATCH\x00'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<8sIII4x32s')
+_ENTRY = struct.Struct('<16sQQ')
+_ALIGN = 8
+
+
+class ArtifactError(Exception):
+    """规则文件格式错误、版本不兼容或校验失败"""
+
+
+def is_artifact(filepath: str) -> bool:
+    """判断文件是否为编译后的规则文件（否则按旧版 pickle 处理）"""
+    with open(filepath, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_artifact(filepath: str, keyword_count: int, sections: Dict[str, bytes]):
+    """
+    写入规则文件
+    :param keyword_count: 关键词数量，写入文件头便于不解析内容就能查看
+    :param sections: 段名 -> 数据（array 会按机器字节序写出，读取端同样按 array 解释）
+    """
+    names = list(sections)
+    data_start = _HEADER.size + _ENTRY.size * len(names)
+    directory = []
+    chunks = []
+    pos = data_start
+    for name in names:
+        encoded = name.encode('ascii')
+        if len(encoded) > 16:
+            raise ArtifactError(f"段名过长: {name}")
+        data = sections[name]
+        if isinstance(data, array):
+            data = data.tobytes()
+        padding = (-pos) % _ALIGN
+        if padding:
+            chunks.append(b'\x00' * padding)
+            pos += padding
+        directory.append(_ENTRY.pack(encoded, pos, len(data)))
+        chunks.append(data)
+        pos += len(data)
+
+    digest = hashlib.sha256()
+    for part in directory:
+        digest.update(part)
+    for chunk in chunks:
+        digest.update(chunk)
+
+    with open(filepath, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, keyword_count, len(names), digest.digest()))
+        for part in directory:
+            f.write(part)
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def read_header(filepath: str) -> Dict:
+    """只读取文件头（版本、关键词数、内容哈希）"""
+    with open(filepath, 'rb') as f:
+        raw = f.read(_HEADER.size)
+    if len(raw) < _HEADER.size:
+        raise ArtifactError("文件头不完整")
+    magic, version, keyword_count, section_count, content_hash = _HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ArtifactError("不是匹配器规则文件")
+    return {
+        'format_version': version,
+        'keyword_count': keyword_count,
+        'section_count': section_count,
+        'content_hash': content_hash.hex(),
+    }
+
+
+class Artifact:
+    """
+    以 mmap 方式打开的规则文件
+    段数据是指向 mmap 的 memoryview，不复制；用完后调用 close()（或用 with 语句）
+    """
+
+    def __init__(self, filepath: str, verify: bool = True):
+        with open(filepath, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+        self._sections: Dict[str, memoryview] = {}
+        try:
+            self.header = self._parse(verify)
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self, verify: bool) -> Dict:
+        mm = self._mm
+        if len(mm) < _HEADER.size:
+            raise ArtifactError("文件头不完整")
+        magic, version, keyword_count, section_count, content_hash = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            raise ArtifactError("不是匹配器规则文件")
+        if version != FORMAT_VERSION:
+            raise ArtifactError(f"不支持的规则文件版本: {version}（当前支持 {FORMAT_VERSION}）")
+        if verify:
+            with self._view[_HEADER.size:] as body:
+                if hashlib.sha256(body).digest() != content_hash:
+                    raise ArtifactError("规则文件校验失败，内容可能已损坏")
+        for i in range(section_count):
+            raw_name, offset, length = _ENTRY.unpack_from(mm, _HEADER.size + i * _ENTRY.size)
+            if offset + length > len(mm):
+                raise ArtifactError("段数据越界，文件可能被截断")
+            self._sections[raw_name.rstrip(b'\x00').decode('ascii')] = self._view[offset:offset + length]
+        return {
+            'format_version': version,
+            'keyword_count': keyword_count,
+            'section_count': section_count,
+            'content_hash': content_hash.hex(),
+        }
+
+    def section(self, name: str) -> memoryview:
+        try:
+            return self._sections[name]
+        except KeyError:
+            raise ArtifactError(f"缺少数据段: {name}")
+
+    def array(self, name: str, typecode: str) -> memoryview:
+        """把数组段零拷贝地解释为指定类型"""
+        view = self.section(name).cast(typecode)
+        self._sections[f"{name}:{typecode}"] = view
+        return view
+
+    def close(self):
+        for view in self._sections.values():
+            view.release()
+        self._sections.clear()
+        self._view.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
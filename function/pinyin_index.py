@@ -0,0 +1,115 @@
+"""
+拼音/同音字匹配
+关键词的拼音投影编进第二个自动机，消息中的汉字整段投影成拼音（一次 str.translate）后扫描一遍，
+同音字（"堵搏"）、拼音（"dubo"）、拼音汉字混写（"赌bo"）都投影成同一个串；
+命中只在起止都落在整字上时有效，位置映射回投影前的文本；
+整段都是字母的命中还要求两侧是词边界或汉字，"代理" 不会命中英文单词 "daily" 里的 "daili"
+"""
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Tuple
+
+import ahocorasick
+
+from function.pinyin_table import CHAR_PINYIN
+
+# 至少含这么多个汉字的关键词才建拼音投影，单字的拼音太短，误报太多
+PINYIN_MIN_CHARS = 2
+# 首字母缩写（"网络赌博" -> "wldb"）至少这么长
+INITIALS_MIN_CHARS = 3
+
+# 汉字 -> 拼音，其余字符原样保留
+_PINYIN_TRANS = str.maketrans(CHAR_PINYIN)
+
+
+def to_pinyin(text: str) -> str:
+    """把文本中的汉字换成不带声调的拼音，其余字符不变"""
+    return text.translate(_PINYIN_TRANS)
+
+
+def _char_starts(text: str) -> array:
+    """每个字符在投影串中的起点，末尾追加投影串总长"""
+    starts = array('i')
+    pos = 0
+    get = CHAR_PINYIN.get
+    for ch in text:
+        starts.append(pos)
+        pos += len(get(ch, ch))
+    starts.append(pos)
+    return starts
+
+
+def _is_boundary(text: str, pos: int) -> bool:
+    """text[pos] 能否作为字母命中的边界：越界、非字母数字、或汉字"""
+    if pos < 0 or pos >= len(text):
+        return True
+    ch = text[pos]
+    return not ch.isalnum() or ch in CHAR_PINYIN
+
+
+class PinyinIndex:
+    """
+    拼音投影自动机，构建后只读，可被多个快照共享
+    自动机的值为 (全拼命中的关键词ID元组, 首字母命中的关键词ID元组, 投影长度)，
+    投影相同的关键词（互为同音词）共用一个条目
+    """
+
+    def __init__(self, initials: bool = False):
+        """
+        :param initials: 是否同时匹配首字母缩写，只在消息里直接打出的字母上匹配
+        """
+        self.initials = initials
+        self._automaton = ahocorasick.Automaton()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def build(self, words: Iterable[Tuple[int, str]]):
+        """
+        :param words: (关键词ID, 归一化后的关键词)
+        """
+        forms: Dict[str, Tuple[List[int], List[int]]] = {}
+        for keyword_id, word in words:
+            hanzi = sum(1 for ch in word if ch in CHAR_PINYIN)
+            if hanzi < PINYIN_MIN_CHARS:
+                continue
+            forms.setdefault(to_pinyin(word), ([], []))[0].append(keyword_id)
+            if self.initials and hanzi == len(word) and hanzi >= INITIALS_MIN_CHARS:
+                forms.setdefault(''.join(CHAR_PINYIN[ch][0] for ch in word), ([], []))[1].append(keyword_id)
+
+        automaton = ahocorasick.Automaton()
+        for form, (full_ids, initial_ids) in forms.items():
+            automaton.add_word(form, (tuple(full_ids), tuple(initial_ids), len(form)))
+        if forms:
+            automaton.make_automaton()
+        self._automaton = automaton
+        self._size = len(forms)
+
+    def search(self, text: str) -> List[Tuple[int, int, int]]:
+        """
+        :param text: 归一化后的消息
+        :return: [(起点, 终点, 关键词ID), ...]，text 中的闭区间，按投影串中的结束位置排列
+        """
+        if not self._size:
+            return []
+        hits = []
+        starts = None
+        for proj_end, (full_ids, initial_ids, length) in self._automaton.iter(text.translate(_PINYIN_TRANS)):
+            if starts is None:
+                # 位置表只在有命中时才建，没命中的消息只付出 translate 和一遍扫描
+                starts = _char_starts(text)
+            proj_start = proj_end - length + 1
+            start = bisect_right(starts, proj_start) - 1
+            end = bisect_right(starts, proj_end) - 1
+            if starts[start] != proj_start or starts[end + 1] != proj_end + 1:
+                continue  # 起止落在某个字的拼音中间（"an" 命中 "huan" 的后半）
+            latin = not any(ch in CHAR_PINYIN for ch in text[start:end + 1])
+            if latin and not (_is_boundary(text, start - 1) and _is_boundary(text, end + 1)):
+                continue  # 整段是字母，却嵌在英文单词里（"daily" 中的 "daili"）
+            for keyword_id in full_ids:
+                hits.append((start, end, keyword_id))
+            if initial_ids and latin:
+                for keyword_id in initial_ids:
+                    hits.append((start, end, keyword_id))
+        return hits
@@ -0,0 +1,133 @@
+"""
+正则规则的耗时统计、时间预算与静态检查
+Python 的 re 无法在匹配途中打断，预算的作用是：某条规则单次匹配超过预算就立即隔离，
+之后的消息不再运行它，一条病态规则最多拖慢一条消息，而不是每条消息都卡住
+"""
+import re
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+# 单条规则单次匹配的默认时间预算（秒），正常规则在聊天消息上是微秒级
+REGEX_TIME_BUDGET = 0.05
+
+# 会回溯的量词；占有量词（*+、++）和原子分组内部不回溯，不检查
+_BACKTRACKING_REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+
+
+def _nested_repeat(items, in_repeat: bool) -> bool:
+    """in_repeat 表示当前位于一个可以重复多次的量词内部"""
+    for op, av in items:
+        if op in _BACKTRACKING_REPEATS:
+            low, high, sub = av
+            if in_repeat and high > 1 and high != low:
+                return True
+            if _nested_repeat(sub, in_repeat or high > 1):
+                return True
+        elif op is sre_constants.SUBPATTERN:
+            if _nested_repeat(av[-1], in_repeat):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_nested_repeat(branch, in_repeat) for branch in av[1]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _nested_repeat(av[1], in_repeat):
+                return True
+    return False
+
+
+def has_nested_quantifier(pattern: str, flags: int = 0) -> bool:
+    """
+    静态检查：可变次数的量词是否嵌套在另一个可重复多次的量词里（如 (a+)+、(\\w+\\s?)*）
+    这类写法在不匹配的输入上可能指数级回溯；只是提示，不保证一定会慢
+    """
+    try:
+        return _nested_repeat(sre_parse.parse(pattern, flags), False)
+    except Exception:
+        return False
+
+
+class RegexGuard:
+    """
+    按规则序号记录调用次数、累计和最长耗时，单次超过预算的规则进入隔离
+    每次调用都计时，预算对每次调用都生效；
+    统计在多个搜索线程间不加锁累加，个别计数可能丢失，只作排查参考
+    """
+
+    def __init__(self, budget: Optional[float] = REGEX_TIME_BUDGET):
+        """
+        :param budget: 单次匹配的时间预算（秒），None 表示只统计不隔离
+        """
+        self.budget = budget
+        self.calls: List[int] = []
+        self.total: List[float] = []
+        self.worst: List[float] = []
+        self.nested: List[bool] = []
+        self.quarantined: Dict[int, str] = {}  # 规则序号 -> 隔离原因
+        self.generation = 0                    # 隔离状态变化（隔离或解除）的次数，结果缓存据此作废
+
+    def add_rule(self, nested: bool):
+        """登记下一条规则（序号与匹配器的规则列表一致）"""
+        self.calls.append(0)
+        self.total.append(0.0)
+        self.worst.append(0.0)
+        self.nested.append(nested)
+
+    def record(self, index: int, elapsed: float, pattern: re.Pattern, text_length: int) -> bool:
+        """
+        记录一次匹配耗时，超出预算时隔离并打印报告
+        :return: 是否因为这次超出预算而新进入隔离
+        """
+        self.calls[index] += 1
+        self.total[index] += elapsed
+        if elapsed > self.worst[index]:
+            self.worst[index] = elapsed
+        budget = self.budget
+        if budget is not None and elapsed > budget and index not in self.quarantined:
+            reason = (f"单次匹配耗时 {elapsed * 1000:.0f} ms，超过预算 {budget * 1000:.0f} ms"
+                      f"（消息长度 {text_length}）")
+            self.quarantined[index] = reason
+            self.generation += 1
+            print(f"[正则隔离] 规则 #{index} '{pattern.pattern}' 已停用: {reason}")
+            return True
+        return False
+
+    def finditer(self, index: int, pattern: re.Pattern, text: str, pos: int = 0) -> Iterator[re.Match]:
+        """
+        计时运行第 index 条规则，逐个产出匹配；已隔离的规则不运行
+        只累计 re 自身的耗时，不含调用方处理每个匹配的时间；调用方提前停下时按已运行的部分记录
+        """
+        if index in self.quarantined:
+            return
+        elapsed = 0.0
+        start = perf_counter()
+        try:
+            for match in pattern.finditer(text, pos):
+                elapsed += perf_counter() - start
+                yield match
+                start = perf_counter()
+            elapsed += perf_counter() - start
+        finally:
+            self.record(index, elapsed, pattern, len(text))
+
+    def search(self, index: int, pattern: re.Pattern, text: str, pos: int = 0) -> Optional[re.Match]:
+        """计时运行第 index 条规则，只找第一个匹配；已隔离的规则不运行"""
+        if index in self.quarantined:
+            return None
+        start = perf_counter()
+        found = pattern.search(text, pos)
+        self.record(index, perf_counter() - start, pattern, len(text))
+        return found
+
+    def release(self, index: int) -> bool:
+        """解除隔离，返回该规则之前是否处于隔离"""
+        if self.quarantined.pop(index, None) is None:
+            return False
+        self.generation += 1
+        return True
@@ -0,0 +1,269 @@
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Set, Tuple
+
+import ahocorasick
+
+try:
+    import re._parser as sre_parse
+    import re._constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+
+# 分支展开后的字面量集合上限，超过则视为无法提取
+_MAX_LITERAL_SET = 64
+
+# 可以写成局部内联标志的 re 标志
+_SCOPED_FLAGS = (
+    (re.IGNORECASE, 'i'),
+    (re.MULTILINE, 'm'),
+    (re.DOTALL, 's'),
+    (re.VERBOSE, 'x'),
+    (re.ASCII, 'a'),
+)
+
+
+def _better(candidate: Set[str], best: Optional[Set[str]]) -> bool:
+    """最短字面量越长越好，同等长度下集合越小越好"""
+    if best is None:
+        return True
+    return (min(map(len, candidate)), -len(candidate)) > (min(map(len, best)), -len(best))
+
+
+def _required_literals(items) -> Optional[Set[str]]:
+    """返回一组字面量，任何匹配都至少包含其中一个；无法确定时返回 None"""
+    best = None
+    run: List[str] = []
+
+    def consider(literals):
+        nonlocal best
+        if literals and '' not in literals and len(literals) <= _MAX_LITERAL_SET and _better(literals, best):
+            best = literals
+
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is sre_constants.AT:
+            # 零宽锚点（\b、^ 等）不消耗字符，字面量可以跨过它继续累积
+            continue
+        if run:
+            consider({''.join(run)})
+            run = []
+        if op is sre_constants.SUBPATTERN:
+            consider(_required_literals(av[-1]))
+        elif op is sre_constants.BRANCH:
+            alternatives = [_required_literals(branch) for branch in av[1]]
+            if all(alternatives):
+                consider(set().union(*alternatives))
+        elif op in _REPEATS:
+            low, _high, sub = av
+            if low >= 1:
+                consider(_required_literals(sub))
+        elif getattr(sre_constants, 'ATOMIC_GROUP', None) is op:
+            consider(_required_literals(av))
+    if run:
+        consider({''.join(run)})
+    return best
+
+
+def extract_literals(pattern: str, flags: int = 0) -> Optional[List[str]]:
+    """
+    提取正则的必需字面量（已 casefold）
+    :return: 字面量列表，匹配文本必然包含其中至少一个；无法提取时返回 None
+    """
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+    literals = _required_literals(parsed)
+    if not literals:
+        return None
+    return sorted({literal.casefold() for literal in literals})
+
+
+def _has_group_refs(items) -> bool:
+    """包含反向引用或条件分组的正则不能并入组合正则（分组编号会变）"""
+    for op, av in items:
+        if op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            return True
+        if op is sre_constants.SUBPATTERN:
+            if _has_group_refs(av[-1]):
+                return True
+        elif op is sre_constants.BRANCH:
+            if any(_has_group_refs(branch) for branch in av[1]):
+                return True
+        elif op in _REPEATS:
+            if _has_group_refs(av[2]):
+                return True
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            if _has_group_refs(av[1]):
+                return True
+        elif getattr(sre_constants, 'ATOMIC_GROUP', None) is op:
+            if _has_group_refs(av):
+                return True
+    return False
+
+
+class RegexPrefilter:
+    """
+    正则规则的字面量预过滤
+    能提取出必需字面量的正则放进二级 AC 自动机，只有字面量命中时才运行；
+    提取不出字面量的正则合并成一个带命名分组的组合正则，先整体判断是否可能命中；
+    含反向引用、命名分组等无法合并的正则每次都单独运行
+    """
+
+    def __init__(self):
+        self._automaton = None
+        self._literal_to_indexes: Dict[str, List[int]] = {}
+        self._fallback: Dict[int, str] = {}   # 规则序号 -> 组合正则中的分支
+        self._standalone: List[int] = []
+        self._combined: Optional[re.Pattern] = None
+        self._dirty = False
+
+    def add(self, index: int, compiled: re.Pattern, standalone: bool = False):
+        """
+        登记第 index 条正则
+        :param standalone: 提取不出字面量时单独运行，不并入组合正则（便于单独计时、隔离可能回溯的规则）
+        """
+        literals = extract_literals(compiled.pattern, compiled.flags)
+        if literals:
+            for literal in literals:
+                self._literal_to_indexes.setdefault(literal, []).append(index)
+        else:
+            branch = None if standalone else self._as_branch(index, compiled)
+            if branch is None:
+                self._standalone.append(index)
+            else:
+                self._fallback[index] = branch
+        self._dirty = True
+
+    @staticmethod
+    def _as_branch(index: int, compiled: re.Pattern) -> Optional[str]:
+        if compiled.groupindex:
+            return None
+        try:
+            if _has_group_refs(sre_parse.parse(compiled.pattern, compiled.flags)):
+                return None
+        except Exception:
+            return None
+        letters = ''.join(letter for flag, letter in _SCOPED_FLAGS if compiled.flags & flag)
+        # VERBOSE 模式下行尾注释会吞掉右括号，先换行
+        tail = '\n' if compiled.flags & re.VERBOSE else ''
+        branch = f"(?P<_r{index}>(?{letters}:{compiled.pattern}{tail}))"
+        try:
+            re.compile(branch)
+        except re.error:
+            return None
+        return branch
+
+    def build(self):
+        if self._literal_to_indexes:
+            automaton = ahocorasick.Automaton()
+            for literal, indexes in self._literal_to_indexes.items():
+                automaton.add_word(literal, tuple(indexes))
+            automaton.make_automaton()
+            self._automaton = automaton
+        else:
+            self._automaton = None
+
+        self._combined = None
+        if self._fallback:
+            try:
+                self._combined = re.compile('|'.join(self._fallback[i] for i in sorted(self._fallback)))
+            except re.error:
+                self._standalone.extend(self._fallback)
+                self._standalone.sort()
+                self._fallback.clear()
+        self._dirty = False
+
+    def clear(self):
+        self._automaton = None
+        self._literal_to_indexes = {}
+        self._fallback = {}
+        self._standalone = []
+        self._combined = None
+        self._dirty = False
+
+    def copy(self) -> 'RegexPrefilter':
+        """
+        已构建状态的独立副本
+        自动机和组合正则构建后不再修改，直接共享；之后对原对象的增删不影响副本
+        """
+        if self._dirty:
+            self.build()
+        other = RegexPrefilter()
+        other._automaton = self._automaton
+        other._literal_to_indexes = {literal: list(indexes) for literal, indexes in self._literal_to_indexes.items()}
+        other._fallback = dict(self._fallback)
+        other._standalone = list(self._standalone)
+        other._combined = self._combined
+        return other
+
+    def candidates(self, text: str) -> List[Tuple[int, int]]:
+        """
+        返回需要在 text 上运行的正则
+        :return: [(规则序号, 起始搜索位置), ...]，按规则序号排序
+        """
+        if self._dirty:
+            self.build()
+
+        selected: Dict[int, int] = {}
+        if self._automaton is not None:
+            for _, indexes in self._automaton.iter(text.casefold()):
+                for index in indexes:
+                    selected[index] = 0
+        if self._combined is not None:
+            # 组合正则在首个命中位置之前都不匹配，单条正则也就不必从更早的位置开始
+            gate = self._combined.search(text)
+            if gate is not None:
+                for index in self._fallback:
+                    selected[index] = gate.start()
+        for index in self._standalone:
+            selected[index] = 0
+        return sorted(selected.items())
+
+    def candidates_many(self, texts: List[str], separator: str) -> List[List[Tuple[int, int]]]:
+        """
+        批量版 candidates：字面量自动机对拼接后的整段文本只扫描一遍
+        :return: 与 texts 一一对应的候选列表
+        """
+        if self._dirty:
+            self.build()
+
+        selected: List[Dict[int, int]] = [{} for _ in texts]
+        if self._automaton is not None and texts:
+            folded = [text.casefold() for text in texts]
+            starts = []
+            pos = 0
+            for text in folded:
+                starts.append(pos)
+                pos += len(text) + len(separator)
+            for end_index, indexes in self._automaton.iter(separator.join(folded)):
+                msg_selected = selected[bisect_right(starts, end_index) - 1]
+                for index in indexes:
+                    msg_selected[index] = 0
+        for text, msg_selected in zip(texts, selected):
+            if self._combined is not None:
+                gate = self._combined.search(text)
+                if gate is not None:
+                    for index in self._fallback:
+                        msg_selected[index] = gate.start()
+            for index in self._standalone:
+                msg_selected[index] = 0
+        return [sorted(msg_selected.items()) for msg_selected in selected]
+
+    def describe(self) -> Dict[str, int]:
+        """预过滤统计：字面量数量、各类规则数量"""
+        gated = {i for indexes in self._literal_to_indexes.values() for i in indexes}
+        return {
+            'literals': len(self._literal_to_indexes),
+            'gated_patterns': len(gated),
+            'combined_patterns': len(self._fallback),
+            'standalone_patterns': len(self._standalone),
+        }
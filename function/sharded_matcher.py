@@ -0,0 +1,282 @@
+"""
+分片多进程关键词匹配（可选模式，面向百万级关键词）
+关键词直接从匹配器的关键词表按匹配形式的哈希分到 N 个自动机，不构建单个大自动机；
+每个扫描进程在初始化时自己构建分到它的那几个分片并一直持有，父进程不保留分片。
+扫描时每批消息发给所有扫描进程，各自在自己的分片上运行，命中在父进程合并
+拼音、正则和模糊匹配仍使用匹配器的构建状态，结果合并成同样的 MatchResult 流
+"""
+import multiprocessing
+import os
+import sys
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Generator, List, Optional, Tuple
+
+import ahocorasick
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from function.Filter import KeywordMatcher, iter_hits, MatchResult, MESSAGE_SEPARATOR
+
+# 扫描进程自己构建并持有的分片
+_SHARDS: List[ahocorasick.Automaton] = []
+
+
+def _make_shard(words: List[Tuple[str, int]]) -> ahocorasick.Automaton:
+    automaton = ahocorasick.Automaton()
+    for word_for_match, keyword_id in words:
+        automaton.add_word(word_for_match, (keyword_id, len(word_for_match)))
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_shards(partitions: List[List[Tuple[str, int]]]):
+    """扫描进程的初始化函数：构建分到本进程的分片"""
+    global _SHARDS
+    _SHARDS = [_make_shard(words) for words in partitions]
+
+
+def _shard_size() -> int:
+    return sum(len(automaton) for automaton in _SHARDS)
+
+
+def _scan(shards: List[ahocorasick.Automaton], texts: List[str]) -> List[Tuple[int, int, int, int]]:
+    """
+    在拼接后的文本上依次运行所有分片
+    :return: [(消息序号, 消息内结束位置, 关键词ID, 匹配长度), ...]
+    """
+    starts = []
+    pos = 0
+    for text in texts:
+        starts.append(pos)
+        pos += len(text) + len(MESSAGE_SEPARATOR)
+    buffer = MESSAGE_SEPARATOR.join(texts)
+    hits = []
+    for automaton in shards:
+        for end_index, (keyword_id, length) in iter_hits(automaton, buffer):
+            msg_index = bisect_right(starts, end_index) - 1
+            hits.append((msg_index, end_index - starts[msg_index], keyword_id, length))
+    return hits
+
+
+def _scan_in_worker(texts: List[str]) -> List[Tuple[int, int, int, int]]:
+    return _scan(_SHARDS, texts)
+
+
+class ShardedKeywordMatcher:
+    """
+    把 KeywordMatcher 的精确关键词拆成多个分片自动机，由各扫描进程并行构建、并行扫描
+    构建时取匹配器当前的关键词集合；之后匹配器的增删需要重新 build() 才会反映到分片
+    """
+
+    def __init__(self, matcher: Optional[KeywordMatcher] = None, shards: Optional[int] = None,
+                 workers: Optional[int] = None, start_method: Optional[str] = None):
+        """
+        :param matcher: 提供关键词、归一化、正则和模糊匹配的匹配器，默认取单例
+        :param shards: 分片数，默认等于 CPU 核数
+        :param workers: 扫描进程数，默认等于分片数（多于分片数时按分片数）；为 1 时在当前进程构建和扫描
+        :param start_method: 进程启动方式，默认有 fork 用 fork，否则 spawn
+        """
+        self.matcher = matcher or KeywordMatcher()
+        self.shard_count = shards or os.cpu_count() or 1
+        self.workers = workers or self.shard_count
+        if start_method is None:
+            start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+
+        # 单进程模式下的分片；多进程时分片只在扫描进程里
+        self._shards: List[ahocorasick.Automaton] = []
+        self._pools: List[ProcessPoolExecutor] = []
+        self._size = 0
+        self._snapshot = None
+
+    # ==================== 构建 ====================
+
+    def build(self):
+        """按当前关键词重建全部分片，并重启扫描进程"""
+        matcher = self.matcher
+        partitions: List[List[Tuple[str, int]]] = [[] for _ in range(self.shard_count)]
+        with matcher._edit_lock:
+            # 组合规则词项、豁免短语和关键词按同样的哈希分片，排在后面的覆盖前面相同的匹配形式；
+            # 精确匹配只用分片，快照里不放自动机
+            matcher._prepare_build()
+            for word in matcher._automaton_words():
+                partitions[zlib.crc32(word[0].encode('utf-8')) % self.shard_count].append(word)
+            snapshot = matcher._compose_snapshot(None)
+        # 关键词比分片少时有的分区是空的，空自动机无法扫描，不为它建分片
+        partitions = [partition for partition in partitions if partition]
+
+        self.close()
+        self._snapshot = snapshot
+        if self.workers <= 1:
+            # 单进程：直接在当前进程构建，省掉进程间通信
+            self._shards = [_make_shard(partition) for partition in partitions]
+            self._size = sum(len(automaton) for automaton in self._shards)
+            return
+
+        # 分片轮流分给各扫描进程，每个进程在初始化时构建自己的那几个
+        groups = [partitions[i::self.workers] for i in range(min(self.workers, len(partitions)))]
+        del partitions
+        context = multiprocessing.get_context(self.start_method)
+        self._pools = [ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                           initializer=_build_shards, initargs=(group,))
+                       for group in groups]
+        del groups
+        # 立即拉起全部进程并等它们构建完
+        sizes = [pool.submit(_shard_size) for pool in self._pools]
+        self._size = sum(future.result() for future in sizes)
+
+    def close(self):
+        """关闭扫描进程"""
+        for pool in self._pools:
+            pool.shutdown()
+        self._pools = []
+        self._shards = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ==================== 搜索 ====================
+
+    def search(self, text: str, categories: Optional[int] = None) -> Generator[MatchResult, None, None]:
+        """单条消息搜索，结果与 KeywordMatcher.search 相同"""
+        yield from self.search_many([text], categories)[0]
+
+    def search_many(self, texts: List[str], categories: Optional[int] = None) -> List[List[MatchResult]]:
+        """
+        批量搜索：消息拼接后发给各扫描进程，每个进程在自己的分片上运行，命中合并回各条消息
+        与 KeywordMatcher.search_many 相同：支持按类别过滤，开启统计时同样记录各阶段耗时和命中次数
+        :param categories: 只返回这些类别的命中（category_mask 的结果）
+        :return: 与 texts 一一对应的匹配结果列表
+        """
+        if self._snapshot is None:
+            self.build()
+        snapshot = self._snapshot
+        matcher = self.matcher
+        results: List[List[MatchResult]] = [[] for _ in texts]
+        if not texts:
+            return results
+        stats = matcher._stats
+        count = len(texts)
+        if stats is not None:
+            stats.messages += count
+            lap = perf_counter()
+
+        # 1. 精确匹配（分片）
+        normalized_texts = [snapshot.normalizer.normalize(text) for text in texts]
+        if stats is not None:
+            lap = stats.lap('normalize', lap, count)
+        exempt = {}
+        try:
+            hits = self._scan_exact([normalized.text for normalized in normalized_texts])
+            # 与单个自动机的输出顺序一致：按结束位置，同一位置长的在前
+            hits.sort(key=lambda hit: (hit[0], hit[1], -hit[3]))
+            if snapshot.tagged:
+                exempt = self._split_tagged(hits, normalized_texts, snapshot, results, categories, stats)
+            else:
+                self._exact_results(hits, normalized_texts, snapshot, results, categories, stats)
+        except Exception as e:
+            print(f"分片精确匹配出错: {e}")
+        if stats is not None:
+            lap = stats.lap('exact', lap, count)
+
+        # 2. 拼音/同音字匹配（可选，单个自动机，不分片）
+        if snapshot.pinyin_index is not None:
+            try:
+                for msg_results, normalized in zip(results, normalized_texts):
+                    msg_results.extend(matcher._search_pinyin(normalized, snapshot, categories, stats))
+            except Exception as e:
+                print(f"拼音匹配出错: {e}")
+            if stats is not None:
+                lap = stats.lap('pinyin', lap, count)
+
+        # 3. 正则匹配
+        try:
+            all_candidates = snapshot.regex_prefilter.candidates_many(texts, MESSAGE_SEPARATOR)
+            for msg_results, text, candidates in zip(results, texts, all_candidates):
+                if candidates:
+                    msg_results.extend(matcher._search_regex(text, candidates, snapshot, categories, stats))
+        except Exception as e:
+            print(f"正则匹配出错: {e}")
+        if stats is not None:
+            lap = stats.lap('regex', lap, count)
+
+        # 4. 模糊匹配
+        if snapshot.fuzzy_index is not None:
+            try:
+                all_hits = matcher._fuzzy_hits_many(normalized_texts, snapshot)
+                for msg_results, normalized, hits in zip(results, normalized_texts, all_hits):
+                    msg_results.extend(matcher._fuzzy_results(normalized, hits, snapshot, categories, stats))
+            except Exception as e:
+                print(f"模糊匹配出错: {e}")
+            if stats is not None:
+                stats.lap('fuzzy', lap, count)
+
+        for msg_index, spans in exempt.items():
+            results[msg_index] = [match for match in results[msg_index] if not spans.covers(match.start, match.end)]
+        return results
+
+    @staticmethod
+    def _exact_results(hits: List[Tuple[int, int, int, int]], normalized_texts, snapshot, results,
+                       categories: Optional[int] = None, stats=None):
+        id_to_keyword = snapshot.id_to_keyword
+        type_masks = snapshot.type_masks
+        type_codes = snapshot.keywords.type_codes
+        for msg_index, local_end, keyword_id, length in hits:
+            if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                continue
+            if stats is not None:
+                stats.keyword_hits[keyword_id] += 1
+            start_index, end_index = normalized_texts[msg_index].span(local_end - length + 1, local_end)
+            results[msg_index].append(MatchResult(
+                start=start_index,
+                end=end_index,
+                keyword=id_to_keyword[keyword_id],
+                match_type='exact'
+            ))
+
+    def _split_tagged(self, hits: List[Tuple[int, int, int, int]], normalized_texts, snapshot, results,
+                      categories: Optional[int] = None, stats=None) -> dict:
+        """
+        各分片的命中合并后按消息交给 KeywordMatcher._split_hits：去掉豁免短语及被它完整覆盖的命中，求组合规则
+        :return: 消息序号 -> 原文中的豁免区间，用来过滤拼音、正则、模糊的命中
+        """
+        exempt = {}
+        matcher = self.matcher
+        group_start = 0
+        for i in range(1, len(hits) + 1):
+            if i < len(hits) and hits[i][0] == hits[group_start][0]:
+                continue
+            msg_index = hits[group_start][0]
+            normalized = normalized_texts[msg_index]
+            found, spans, combo_hits = matcher._split_hits(
+                [(local_end, (keyword_id, length)) for _, local_end, keyword_id, length in hits[group_start:i]],
+                snapshot)
+            self._exact_results([(msg_index, local_end, keyword_id, length)
+                                 for local_end, (keyword_id, length) in found],
+                                normalized_texts, snapshot, results, categories, stats)
+            if combo_hits:
+                results[msg_index].extend(matcher._combo_results(combo_hits, normalized, snapshot, categories, stats))
+            if spans:
+                exempt[msg_index] = matcher._exempt_by_message(spans, [0], [normalized])[0]
+            group_start = i
+        return exempt
+
+    def _scan_exact(self, texts: List[str]) -> List[Tuple[int, int, int, int]]:
+        if not self._pools:
+            return _scan(self._shards, texts)
+        # 每个扫描进程只有一部分分片，整批消息发给所有进程
+        futures = [pool.submit(_scan_in_worker, texts) for pool in self._pools]
+        hits = []
+        for future in futures:
+            hits.extend(future.result())
+        return hits
+
+    def size(self) -> int:
+        """全部分片的条目数"""
+        return self._size
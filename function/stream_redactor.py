@@ -0,0 +1,212 @@
+"""
+大文件的流式脱敏
+按块读入文本，每块连同上一块末尾的一段重叠一起交给 search_longest（与 replace 相同的最左最长命中），
+只输出不会再被后面的文本改变的部分，内存占用只与块大小有关，与文件大小无关；
+命中按类型选择替换方式（整段替换、等长打码、类型标签、删除），在同一遍里完成
+
+命令行：
+    python stream_redactor.py export.txt redacted.txt --rules keyword_matcher.pkl --strategy phone=mask
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+from typing import Callable, Dict, Optional, TextIO, Union
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from function.Filter import KeywordMatcher, MatchResult
+
+# 每次读入的字符数
+REDACT_CHUNK_SIZE = 1 << 20
+
+# 重叠长度 = 最长的关键词/豁免短语/组合窗口 × 该系数（拼音拼写和被去掉的分隔符会让原文比关键词长），且不少于下限
+REDACT_OVERLAP_FACTOR = 8
+REDACT_MIN_OVERLAP = 256
+
+# 替换方式：(命中的原文, 类型) -> 替换文本
+Strategy = Callable[[str, str], str]
+
+STRATEGIES: Dict[str, Strategy] = {
+    'mask': lambda matched, _: '*' * len(matched),   # 等长打码，保持原文长度和对齐
+    'tag': lambda _, r_type: f"[{r_type}]",          # 类型标签
+    'drop': lambda matched, _: '',                   # 直接删除
+}
+
+
+def _strategy(spec: Union[str, Strategy]) -> Strategy:
+    """STRATEGIES 中的名字、固定的替换文本或可调用对象 -> 可调用对象"""
+    if callable(spec):
+        return spec
+    if spec in STRATEGIES:
+        return STRATEGIES[spec]
+    return lambda matched, _: spec
+
+
+class StreamRedactor:
+    """
+    有状态的分块脱敏器：feed 依次喂入文本块，返回已经确定的脱敏结果，最后调用 flush 取出剩余部分
+    起点落在 (当前缓冲区长度 - overlap) 之前的命中才处理，之后的留到下一块连同新文本重新扫描；
+    已输出文本的末尾一段保留为上下文，跨块的豁免短语同样生效
+    只有超过 overlap 的正则命中可能被块边界截断
+    """
+
+    def __init__(self, matcher: Optional[KeywordMatcher] = None, replacement: Union[str, Strategy] = "[***]",
+                 strategies: Optional[Dict[str, Union[str, Strategy]]] = None,
+                 categories: Optional[int] = None, overlap: Optional[int] = None):
+        """
+        :param matcher: 提供规则的匹配器，默认取单例
+        :param replacement: 没有单独指定替换方式的类型使用的替换方式
+        :param strategies: 类型 -> 替换方式（STRATEGIES 中的名字、固定文本或 (原文, 类型) -> 文本 的函数）
+        :param categories: 只脱敏这些类别（category_mask 的结果），默认全部
+        :param overlap: 相邻两块重新扫描的字符数，默认按当前规则中最长的模式计算
+        """
+        self.matcher = matcher or KeywordMatcher()
+        self.default = _strategy(replacement)
+        self.strategies = {r_type: _strategy(spec) for r_type, spec in (strategies or {}).items()}
+        self.categories = categories
+        self.overlap = overlap if overlap is not None else self._default_overlap()
+        self.counts: Counter = Counter()   # 类型 -> 已脱敏的命中数
+        self._snapshot = None
+        self._regex_types: Dict[str, str] = {}
+        self._combo_types: Dict[str, str] = {}
+        self.reset()
+
+    def reset(self):
+        """丢弃缓冲的文本和计数，开始新的一段输入"""
+        self._pending = ''   # 已输出的上下文 + 尚未输出的文本
+        self._context = 0    # _pending 开头已输出、只用于扫描的字符数
+        self.counts.clear()
+
+    def _default_overlap(self) -> int:
+        matcher = self.matcher
+        longest = max(map(len, [*matcher._keyword_to_id, *matcher._exemptions]), default=0)
+        longest = max([longest, *(rule.window for rule in matcher._combinations)])
+        return max(REDACT_MIN_OVERLAP, (longest + matcher._max_distance) * REDACT_OVERLAP_FACTOR)
+
+    def feed(self, text: str) -> str:
+        """追加一块文本，返回可以输出的脱敏结果（可能为空，也可能包含之前几块的文本）"""
+        return self._redact(self._pending + text, final=False)
+
+    def flush(self) -> str:
+        """输入结束，返回剩余文本的脱敏结果"""
+        redacted = self._redact(self._pending, final=True)
+        self._pending = ''
+        self._context = 0
+        return redacted
+
+    def _type_of(self, match: MatchResult) -> str:
+        if match.match_type == 'regex':
+            return self._regex_types.get(match.keyword, 'regex')
+        if match.match_type == 'combination':
+            return self._combo_types.get(match.keyword, 'combination')
+        return match.keyword.type
+
+    def _refresh_types(self):
+        """正则和组合规则的结果里只有 pattern / label，类型从当前快照查"""
+        snapshot = self.matcher._snapshot
+        if snapshot is self._snapshot:
+            return
+        self._snapshot = snapshot
+        self._regex_types = {pattern.pattern: r_type for pattern, r_type in snapshot.regex_patterns}
+        self._combo_types = {rule.label: rule.type for rule in snapshot.combos.rules} if snapshot.combos else {}
+
+    def _redact(self, buffer: str, final: bool) -> str:
+        context = self._context
+        cut = len(buffer) if final else len(buffer) - self.overlap
+        if cut <= context:
+            self._pending = buffer
+            return ''
+        self._refresh_types()
+        out = []
+        pos = context
+        last_end = -1
+        for match in self.matcher.search_longest(buffer, self.categories):
+            if match.start < pos:
+                continue  # 起点在已输出的上下文里，上一块已经处理过
+            if match.start >= cut:
+                break
+            r_type = self._type_of(match)
+            matched = buffer[match.start:match.end + 1]
+            out.append(buffer[pos:match.start])
+            out.append(self.strategies.get(r_type, self.default)(matched, r_type))
+            self.counts[r_type] += 1
+            pos = match.end + 1
+            last_end = match.end
+        if pos < cut:
+            out.append(buffer[pos:cut])
+            pos = cut
+        # 上下文不越过最后一次替换：替换之后到 pos 之间没有被选中的命中，重新扫描时结果不变
+        keep = max(pos - self.overlap, last_end + 1, 0)
+        self._pending = buffer[keep:]
+        self._context = pos - keep
+        return ''.join(out)
+
+    def redact_stream(self, reader: TextIO, writer: TextIO, chunk_size: int = REDACT_CHUNK_SIZE) -> Dict[str, int]:
+        """
+        从 reader 按块读取、脱敏后写入 writer
+        :return: 类型 -> 脱敏的命中数
+        """
+        self.reset()
+        while True:
+            chunk = reader.read(chunk_size)
+            if not chunk:
+                break
+            redacted = self.feed(chunk)
+            if redacted:
+                writer.write(redacted)
+        writer.write(self.flush())
+        return dict(self.counts)
+
+    def redact_file(self, src: str, dst: str, encoding: str = 'utf-8',
+                    chunk_size: int = REDACT_CHUNK_SIZE) -> Dict[str, int]:
+        """脱敏一个文本文件，换行符原样保留"""
+        with open(src, 'r', encoding=encoding, newline='') as reader, \
+                open(dst, 'w', encoding=encoding, newline='') as writer:
+            return self.redact_stream(reader, writer, chunk_size)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="按块流式脱敏大文本文件（对话导出等）")
+    parser.add_argument('input', help="输入文件，- 表示标准输入")
+    parser.add_argument('output', help="输出文件，- 表示标准输出")
+    parser.add_argument('--rules', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        'keyword_matcher.pkl'),
+                        help="匹配器规则文件（save / compile 的输出）")
+    parser.add_argument('--replacement', default="[***]",
+                        help="默认替换方式：mask（等长打码）、tag（类型标签）、drop（删除）或固定文本")
+    parser.add_argument('--strategy', action='append', default=[], metavar='TYPE=SPEC',
+                        help="单个类型的替换方式，可重复，如 phone=mask")
+    parser.add_argument('--categories', nargs='+', help="只脱敏这些类型，默认全部")
+    parser.add_argument('--chunk-size', type=int, default=REDACT_CHUNK_SIZE, help="每次读入的字符数")
+    parser.add_argument('--overlap', type=int, help="相邻两块重新扫描的字符数，默认按规则自动计算")
+    parser.add_argument('--encoding', default='utf-8')
+    args = parser.parse_args(argv)
+
+    strategies = {}
+    for item in args.strategy:
+        r_type, sep, spec = item.partition('=')
+        if not sep:
+            parser.error(f"--strategy 需要 TYPE=SPEC 形式: {item}")
+        strategies[r_type] = spec
+
+    matcher = KeywordMatcher()
+    matcher.load(args.rules)
+    categories = matcher.category_mask(*args.categories) if args.categories else None
+    redactor = StreamRedactor(matcher, args.replacement, strategies, categories, args.overlap)
+
+    if args.input == '-':
+        reader = open(sys.stdin.fileno(), 'r', encoding=args.encoding, newline='', closefd=False)
+    else:
+        reader = open(args.input, 'r', encoding=args.encoding, newline='')
+    if args.output == '-':
+        writer = open(sys.stdout.fileno(), 'w', encoding=args.encoding, newline='', closefd=False)
+    else:
+        writer = open(args.output, 'w', encoding=args.encoding, newline='')
+    with reader, writer:
+        counts = redactor.redact_stream(reader, writer, args.chunk_size)
+    print(f"已脱敏 {sum(counts.values())} 处: {counts}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+跨消息的流式关键词扫描
+一段对话的消息（或一条消息的若干分块）依次喂给同一个自动机搜索迭代器，自动机状态在消息之间延续，
+被拆到相邻消息里的关键词（"加" / "微信"）也能命中；每次追加只扫描新到的文本
+"""
+import os
+import sys
+from bisect import bisect_right
+from typing import List, NamedTuple, Optional
+
+import ahocorasick
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from function.Filter import KeywordMatcher, KeyWord
+from function.text_normalizer import NormalizedText
+
+# 默认允许一个关键词跨越的消息条数
+STREAM_WINDOW = 3
+
+
+class StreamHit(NamedTuple):
+    """流中的一次命中，起止都是 (消息序号, 原文中的字符位置)，终点为闭区间"""
+    start_message: int
+    start_offset: int
+    end_message: int
+    end_offset: int
+    keyword: KeyWord
+
+    @property
+    def cross_message(self) -> bool:
+        return self.start_message != self.end_message
+
+
+class _Segment:
+    """流中的一段归一化文本：一条消息或消息的一个分块"""
+    __slots__ = ('start', 'message', 'offset', 'normalized')
+
+    def __init__(self, start: int, message: int, offset: int, normalized: NormalizedText):
+        self.start = start            # 在整个流（归一化文本拼接）中的起点
+        self.message = message        # 所属消息序号
+        self.offset = offset          # 分块在消息原文中的起点
+        self.normalized = normalized
+
+
+class ConversationStream:
+    """
+    有状态的对话扫描器，只做精确匹配（正则、模糊仍按单条消息用 search）
+    只保留最近 window 条消息的位置映射，跨越更多消息的命中丢弃；豁免短语（add_exemptions）同样可以跨消息；
+    匹配器发布新快照后，下一次追加时切换到新自动机，并用保留的最近文本恢复状态
+    """
+
+    def __init__(self, matcher: Optional[KeywordMatcher] = None, window: int = STREAM_WINDOW,
+                 categories: Optional[int] = None):
+        """
+        :param matcher: 提供自动机和归一化的匹配器，默认取单例
+        :param window: 一个关键词最多跨越的消息条数，1 表示不跨消息
+        :param categories: 只报告这些类别的命中（category_mask 的结果），默认全部
+        """
+        if window < 1:
+            raise ValueError("window 至少为 1")
+        self.matcher = matcher or KeywordMatcher()
+        self.window = window
+        self.categories = categories
+        self.reset()
+
+    def reset(self):
+        """丢弃全部状态，下一条消息从序号 0 开始"""
+        self._snapshot = None
+        self._iter = None
+        self._iter_base = 0      # 迭代器位置 0 对应的流位置
+        self._length = 0         # 已扫描的归一化文本总长
+        self._segments: List[_Segment] = []
+        self._segment_starts: List[int] = []
+        self._message = -1
+        self._message_offset = 0
+        self._message_open = False
+
+    @property
+    def message_count(self) -> int:
+        return self._message + 1
+
+    def feed(self, text: str, final: bool = True) -> List[StreamHit]:
+        """
+        追加文本并返回终点落在这段文本里的命中（包括起点在前几条消息中的）
+        :param text: 一条消息，或一条消息的一个分块
+        :param final: 这段文本是否是当前消息的最后一块；False 时下一次 feed 仍属于同一条消息
+        """
+        if not self._message_open:
+            self._message += 1
+            self._message_offset = 0
+            self._message_open = True
+            self._trim()
+        message = self._message
+
+        snapshot = self.matcher._snapshot
+        normalized = snapshot.normalizer.normalize(text)
+        segment = _Segment(self._length, message, self._message_offset, normalized)
+        self._segments.append(segment)
+        self._segment_starts.append(segment.start)
+        self._message_offset += len(text)
+        if final:
+            self._message_open = False
+
+        if snapshot is not self._snapshot:
+            # 新快照：重建迭代器，用窗口内已有的文本恢复自动机状态（这些命中之前已报告过）
+            self._switch(snapshot)
+        return self._scan(snapshot, segment)
+
+    def _trim(self):
+        """丢掉窗口之外的消息；新消息开始时调用"""
+        oldest = self._message - self.window + 1
+        drop = 0
+        while drop < len(self._segments) and self._segments[drop].message < oldest:
+            drop += 1
+        if drop:
+            del self._segments[:drop]
+            del self._segment_starts[:drop]
+
+    def _switch(self, snapshot):
+        self._snapshot = snapshot
+        self._iter = None
+        if snapshot.automaton.kind != ahocorasick.AHOCORASICK:
+            return  # 没有关键词，什么都不会命中
+        self._iter_base = self._segments[0].start
+        self._iter = snapshot.automaton.iter('')
+        # 最后一段是本次新增的，由调用方扫描
+        for segment in self._segments[:-1]:
+            self._iter.set(segment.normalized.text, False)
+            for _ in self._iter:
+                pass
+
+    def _scan(self, snapshot, segment: _Segment) -> List[StreamHit]:
+        text = segment.normalized.text
+        self._length += len(text)
+        hits: List[StreamHit] = []
+        if self._iter is None or not text:
+            return hits
+        categories = self.categories
+        type_masks = snapshot.type_masks
+        type_codes = snapshot.keywords.type_codes
+        self._iter.set(text, False)
+        found = self._iter
+        if snapshot.tagged:
+            # 只能去掉与豁免短语在同一次追加里结束的命中，之前报告过的不会撤回；组合规则不在流里求值
+            found = KeywordMatcher._split_hits(found, snapshot)[0]
+        for end, (keyword_id, length) in found:
+            end += self._iter_base
+            start = end - length + 1
+            if start < self._segment_starts[0]:
+                continue  # 起点在窗口之外
+            if categories is not None and not type_masks[type_codes[keyword_id]] & categories:
+                continue
+            first = self._segments[bisect_right(self._segment_starts, start) - 1]
+            local_start = start - first.start
+            local_end = end - segment.start
+            hits.append(StreamHit(first.message, first.offset + first.normalized.span(local_start, local_start)[0],
+                                  segment.message, segment.offset + segment.normalized.span(local_end, local_end)[1],
+                                  snapshot.id_to_keyword[keyword_id]))
+        return hits
@@ -0,0 +1,683 @@
+"""KeywordMatcher 及周边模块的行为测试（pytest）"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from function.Filter import KeywordMatcher, KeyWord, MATCH_CACHE_SIZE
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+@pytest.fixture
+def matcher():
+    """单例匹配器，每个测试前后清空"""
+    m = KeywordMatcher()
+    m.clear()
+    yield m
+    m.clear()
+    m.set_cache_size(MATCH_CACHE_SIZE)
+
+
+def keywords_of(matches):
+    return [match.keyword.keyword if isinstance(match.keyword, KeyWord) else match.keyword for match in matches]
+
+
+# ==================== 旧版 pickle ====================
+
+def test_load_legacy_pickle(matcher):
+    # data/keyword_matcher.pkl 是旧版本保存的，里面是带 __dict__ 的 BaseData.KeyWord
+    matcher.load(os.path.join(DATA_DIR, 'keyword_matcher.pkl'))
+    assert matcher.size() == 2
+    assert keywords_of(matcher.search("打压赌博")) == ['打压', '赌博']
+
+
+def test_basedata_keyword_accepts_dict_state():
+    from BaseData.KeyWord import KeyWord as BaseKeyWord
+    kw = BaseKeyWord.__new__(BaseKeyWord)
+    kw.__setstate__({'id': 3, 'keyword': '赌博', 'type': 'gamble', 'created_at': None})
+    assert (kw.id, kw.keyword, kw.type) == (3, '赌博', 'gamble')
+
+
+def test_keyword_pickle_round_trip():
+    import pickle
+    kw = KeyWord("赌博", "gamble")
+    kw.id = 7
+    loaded = pickle.loads(pickle.dumps(kw))
+    assert (loaded.id, loaded.keyword, loaded.type, loaded.created_at) == (7, "赌博", "gamble", kw.created_at)
+
+
+def test_save_and_load_round_trip(matcher, tmp_path):
+    for word, kw_type in [("赌博", "gamble"), ("裸聊", "porn")]:
+        matcher.add_keyword(KeyWord(word, kw_type))
+    matcher.add_regex(r"1\d{10}", "phone")
+    matcher.build()
+    path = str(tmp_path / "rules.kwm")
+    matcher.save(path)
+    matcher.clear()
+    matcher.load(path)
+    found = list(matcher.search("裸聊赌博13800138000"))
+    assert [(m.match_type, m.start, m.end) for m in found] == [('exact', 0, 1), ('exact', 2, 3), ('regex', 4, 14)]
+    assert [m.keyword.type for m in found[:2]] == ['porn', 'gamble']
+
+
+# ==================== 没有精确关键词 ====================
+
+def test_regex_only_matcher_scans_every_path(matcher, capsys):
+    # 没有关键词时自动机未构建，各扫描路径都不能在精确阶段报错，其余阶段照常
+    matcher.add_regex(r"1\d{10}", "phone")
+    matcher.build()
+    text = "电话13800138000"
+    assert [m.match_type for m in matcher.search(text)] == ['regex']
+    assert [[m.match_type for m in found] for found in matcher.search_many([text, "没有"])] == [['regex'], []]
+    hits, offsets = matcher.search_many_packed([text])
+    assert len(hits) == 4 and list(offsets) == [0, 1]
+    assert [m.match_type for m in matcher.search_longest(text)] == ['regex']
+    assert matcher.replace(text) == "电话[***]"
+    assert matcher.verdict(text).hit
+    assert "出错" not in capsys.readouterr().out
+
+
+def test_remove_last_keyword(matcher, capsys):
+    matcher.add_keyword(KeyWord("赌博", "gamble"))
+    matcher.build()
+    assert keywords_of(matcher.search("赌博")) == ['赌博']
+    assert matcher.remove_keyword("赌博")
+    matcher.build()
+    assert list(matcher.search("赌博")) == []
+    assert matcher.search_many(["赌博"]) == [[]]
+    assert matcher.replace("赌博") == "赌博"
+    assert "出错" not in capsys.readouterr().out
+
+
+# ==================== 分片匹配 ====================
+
+def test_sharded_with_more_shards_than_keywords(matcher, capsys):
+    from function.sharded_matcher import ShardedKeywordMatcher
+    for word, kw_type in [("赌博", "gamble"), ("裸聊", "porn"), ("微信", "contact")]:
+        matcher.add_keyword(KeyWord(word, kw_type))
+    matcher.build()
+    texts = ["加微信裸聊", "赌博"]
+    expected = [[(m.start, m.end, m.match_type) for m in found] for found in matcher.search_many(texts)]
+    with ShardedKeywordMatcher(matcher, shards=8, workers=1) as sharded:
+        sharded.build()
+        found = sharded.search_many(texts)
+    assert [[(m.start, m.end, m.match_type) for m in msg] for msg in found] == expected
+    assert all(expected)
+    assert "出错" not in capsys.readouterr().out
+
+
+def test_sharded_workers_match_single_automaton(matcher, capsys):
+    # 多进程分片：分片只在扫描进程里构建，类别过滤、豁免、组合规则和统计都与单个自动机一致
+    import multiprocessing
+    from function.sharded_matcher import ShardedKeywordMatcher
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("需要 fork")
+    for word, kw_type in [("赌博", "gamble"), ("裸聊", "porn"), ("微信", "contact"), ("转账", "money")]:
+        matcher.add_keyword(KeyWord(word, kw_type))
+    matcher.add_exemptions(["禁止赌博"])
+    matcher.add_combination(["加", "信"], 4, "contact", ordered=True)
+    matcher.add_regex(r"1\d{10}", "phone")
+    texts = ["加微信裸聊转账", "禁止赌博，赌博", "电话13800138000", "加个信"]
+    matcher.set_cache_size(0)
+    matcher.build()
+    matcher.enable_stats()
+    contact = matcher.category_mask("contact", "phone")
+    expected = [[(m.start, m.end, m.match_type) for m in found] for found in matcher.search_many(texts)]
+    expected_filtered = [[(m.start, m.end, m.match_type) for m in found]
+                         for found in matcher.search_many(texts, contact)]
+    expected_stats = matcher.stats()
+    matcher.enable_stats()
+    with ShardedKeywordMatcher(matcher, shards=3, workers=2, start_method='fork') as sharded:
+        sharded.build()
+        assert sharded._shards == [] and len(sharded._pools) == 2
+        assert sharded.size() == 7  # 4 个关键词、1 条豁免短语、2 个词项
+        found = sharded.search_many(texts)
+        filtered = sharded.search_many(texts, contact)
+    assert [[(m.start, m.end, m.match_type) for m in msg] for msg in found] == expected
+    assert [[(m.start, m.end, m.match_type) for m in msg] for msg in filtered] == expected_filtered
+    stats = matcher.stats()
+    for key in ('messages', 'top_keywords', 'regex', 'combinations'):
+        assert stats[key] == expected_stats[key]
+    assert "出错" not in capsys.readouterr().out
+
+
+# ==================== 增量同步 ====================
+
+def test_apply_changes_layers_small_batches(matcher, capsys):
+    # 少量增删叠加在原自动机上，结果与整体重建相同（批量、单条和流式扫描都一样）
+    import random
+    from function.layered_automaton import LayeredAutomaton
+    from function.stream_scanner import ConversationStream
+    rng = random.Random(8)
+    alphabet = "赌博裸聊微信加ab"
+
+    def word():
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 3)))
+
+    def observe():
+        texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12))) for _ in range(20)]
+        batch = [[(m.start, m.end, m.keyword.keyword) for m in found] for found in matcher.search_many(texts)]
+        single = [[(m.start, m.end, m.keyword.keyword) for m in matcher.search(text)] for text in texts]
+        stream = ConversationStream(matcher)
+        fed = [[(hit.start_offset, hit.end_offset, hit.keyword.keyword) for hit in stream.feed(text)] for text in texts]
+        return batch, single, fed
+
+    matcher.set_cache_size(0)
+    matcher.add_exemptions(["禁止赌博"])
+    matcher.add_keywords([KeyWord(word(), "base") for _ in range(30)])
+    matcher.build()
+    for _ in range(20):
+        changes = [(rng.choice(['add', 'add', 'remove']), word(), "delta") for _ in range(rng.randint(1, 4))]
+        if matcher.apply_changes(changes):
+            assert isinstance(matcher._snapshot.automaton, LayeredAutomaton)
+        state = rng.getstate()
+        layered = observe()
+        matcher._keywords_changed = True
+        matcher.build()
+        rng.setstate(state)
+        assert observe() == layered
+    assert "出错" not in capsys.readouterr().out
+
+
+def test_apply_changes_merges_large_batches(matcher):
+    from function.Filter import LAYER_MAX_CHANGES
+    from function.layered_automaton import LayeredAutomaton
+    matcher.add_keyword(KeyWord("赌博", "gamble"))
+    matcher.build()
+    matcher.apply_changes([('add', "裸聊", "porn")])
+    assert isinstance(matcher._snapshot.automaton, LayeredAutomaton)
+    matcher.apply_changes([('add', f"词{i}", "bulk") for i in range(LAYER_MAX_CHANGES)])
+    assert not isinstance(matcher._snapshot.automaton, LayeredAutomaton)
+    assert keywords_of(matcher.search("裸聊赌博词7")) == ['裸聊', '赌博', '词7']
+    # 'clear' 总是整体重建
+    matcher.apply_changes([('clear', '', ''), ('add', "微信", "contact")])
+    assert not isinstance(matcher._snapshot.automaton, LayeredAutomaton)
+    assert keywords_of(matcher.search("赌博微信")) == ['微信']
+
+
+# ==================== 豁免短语 ====================
+
+@pytest.mark.parametrize("text, expected", [
+    ("禁止赌博", []),                            # 豁免短语包含关键词
+    ("禁止赌博，赌博", [(5, 6)]),                 # 只压掉豁免区间里的那一次
+    ("禁止赌博赌博", [(4, 5)]),                   # 紧挨着豁免短语
+    ("赌博彩票", [(0, 1)]),                       # 与豁免短语"博彩"部分重叠，照常报告
+    ("禁止赌", []),
+    ("禁止赌博彩票", []),                         # 同时落在两个豁免短语里
+])
+def test_exemption_suppresses_hits_inside_span_only(matcher, capsys, text, expected):
+    matcher.add_keyword(KeyWord("赌博", "gamble"))
+    matcher.add_exemptions(["禁止赌博", "博彩"])
+    matcher.build()
+    assert [(m.start, m.end) for m in matcher.search(text)] == expected
+    assert [(m.start, m.end) for m in matcher.search_many([text, text])[1]] == expected
+    hits, offsets = matcher.search_many_packed([text])
+    assert [tuple(hits[i:i + 2]) for i in range(0, len(hits), 4)] == expected
+    assert [(m.start, m.end) for m in matcher.search_longest(text)] == expected
+    assert matcher.verdict(text).hit == bool(expected)
+    assert "出错" not in capsys.readouterr().out
+
+
+def test_exemption_covers_regex_and_fuzzy_hits(matcher):
+    # 豁免区间对其他阶段的命中同样生效，部分重叠的不受影响
+    matcher.add_keyword(KeyWord("赌博网站", "gamble"))
+    matcher.add_regex(r"赌\w", "regex")
+    matcher.add_exemptions(["禁止赌博"])
+    matcher.enable_fuzzy_match(1)
+    found = [(m.match_type, m.start, m.end) for m in matcher.search("禁止赌博网址，赌钱")]
+    # 豁免区间里的"赌博"不报告正则命中；"赌博网址"的模糊命中超出了豁免区间，照常报告
+    assert [hit for hit in found if hit[0] == 'regex'] == [('regex', 7, 8)]
+    assert [(start, end > 3) for kind, start, end in found if kind == 'fuzzy'] == [(2, True)]
+
+
+# ==================== 组合规则 ====================
+
+@pytest.mark.parametrize("text, expected", [
+    ("微信转账", [(0, 3, '微信&转账/6')]),
+    ("转账给微信", [(0, 4, '微信&转账/6')]),              # 无序规则不管先后
+    ("微信好友请你转账", []),                             # 超出窗口
+    ("微信转账微信转账", [(0, 3, '微信&转账/6'), (4, 7, '微信&转账/6')]),
+    ("转账微信转账", [(0, 3, '微信&转账/6')]),            # 用过的词项不再参与后面的命中
+    ("加个信", [(0, 2, '加…信/4')]),
+    ("信个加", []),                                       # 有序规则要按顺序
+    ("加个人的信", []),
+    ("加信加信", [(0, 1, '加…信/4'), (2, 3, '加…信/4')]),
+    ("转转钱", [(0, 2, '转…转…钱/5')]),                  # 重复的词项要各自命中一次
+    ("转钱转", []),
+    ("转转转钱", [(1, 3, '转…转…钱/5')]),
+])
+def test_combination_rules_window_and_repeats(matcher, capsys, text, expected):
+    matcher.add_keyword(KeyWord("微信", "contact"))
+    matcher.add_combination(["微信", "转账"], 6, "money")
+    matcher.add_combination(["加", "信"], 4, "contact", ordered=True)
+    matcher.add_combination(["转", "转", "钱"], 5, "money", ordered=True)
+    matcher.build()
+    combos = [(m.start, m.end, m.keyword) for m in matcher.search(text) if m.match_type == 'combination']
+    assert combos == expected
+    found = matcher.search_many(["", text])[1]
+    assert [(m.start, m.end, m.keyword) for m in found if m.match_type == 'combination'] == expected
+    # 本身是关键词的词项照常作为关键词报告
+    assert [m.start for m in found if m.match_type == 'exact'] == [i for i in range(len(text)) if text.startswith("微信", i)]
+    assert "出错" not in capsys.readouterr().out
+
+
+def test_combination_rule_arguments(matcher, capsys):
+    assert matcher.add_combination(["微信", "微信"], 6) is None
+    assert matcher.add_combination(["微信"], 6) is None
+    assert matcher.add_combination(["微信", "转账"], 1) is None
+    assert matcher.add_combination(["转", "转"], 2, ordered=True) == 0
+    out = capsys.readouterr().out
+    assert "不能重复" in out and "至少需要两个" in out and "放不下" in out
+
+
+# ==================== 结果缓存 ====================
+
+def test_search_many_cache_follows_rule_edits(matcher):
+    matcher.add_keyword(KeyWord("赌博", "gamble"))
+    matcher.build()
+    texts = ["赌博裸聊", "加微信"]
+    assert [keywords_of(found) for found in matcher.search_many(texts)] == [['赌博'], []]
+    assert [keywords_of(found) for found in matcher.search_many(texts)] == [['赌博'], []]
+    assert matcher.cache_stats()['hits'] == 2
+    # 编辑在 build() 发布之前不影响结果，发布之后缓存作废
+    matcher.add_keyword(KeyWord("裸聊", "porn"))
+    assert [keywords_of(found) for found in matcher.search_many(texts)] == [['赌博'], []]
+    matcher.build()
+    assert [keywords_of(found) for found in matcher.search_many(texts)] == [['赌博', '裸聊'], []]
+    matcher.remove_keyword("赌博")
+    matcher.add_regex("微信", "contact")
+    matcher.build()
+    assert [keywords_of(found) for found in matcher.search_many(texts)] == [['裸聊'], ['微信']]
+
+
+def test_search_many_cache_drops_results_of_quarantined_rules(matcher, capsys):
+    from function.regex_guard import REGEX_TIME_BUDGET
+    try:
+        matcher.set_regex_budget(1.0)
+        matcher.add_regex(r"\d+", "phone")
+        matcher.build()
+        assert [[m.match_type for m in found] for found in matcher.search_many(["电话123"])] == [['regex']]
+        # 预算改为 0：下一次运行就隔离，版本号不变，但缓存里带这条规则命中的结果要作废
+        matcher.set_regex_budget(0)
+        assert [[m.match_type for m in found] for found in matcher.search_many(["电话456"])] == [['regex']]
+        assert matcher.search_many(["电话123", "电话456"]) == [[], []]
+        assert "[正则隔离]" in capsys.readouterr().out
+        # 解除隔离同样作废缓存
+        assert matcher.release_regex(0)
+        assert [[m.match_type for m in found] for found in matcher.search_many(["电话123"])] == [['regex']]
+    finally:
+        matcher.set_regex_budget(REGEX_TIME_BUDGET)
+
+
+# ==================== 流式扫描 ====================
+
+def stream_hits(stream, text, final=True):
+    return [(hit.start_message, hit.start_offset, hit.end_message, hit.end_offset, hit.keyword.keyword)
+            for hit in stream.feed(text, final)]
+
+
+def test_conversation_stream_cross_message_and_window(matcher):
+    from function.stream_scanner import ConversationStream
+    for word in ["加微信", "赌博"]:
+        matcher.add_keyword(KeyWord(word, "x"))
+    matcher.build()
+    stream = ConversationStream(matcher)
+    assert stream_hits(stream, "你好加") == []
+    assert stream_hits(stream, "微") == []
+    assert stream_hits(stream, "信") == [(0, 2, 2, 0, "加微信")]
+    # 窗口为 2 时跨三条消息的命中丢弃，跨两条的照常报告
+    stream = ConversationStream(matcher, window=2)
+    assert [stream_hits(stream, text) for text in ["加", "微", "信"]] == [[], [], []]
+    assert stream_hits(stream, "赌") == []
+    assert stream_hits(stream, "博") == [(3, 0, 4, 0, "赌博")]
+    assert stream.message_count == 5
+    # 窗口为 1 时不跨消息
+    stream = ConversationStream(matcher, window=1)
+    assert [stream_hits(stream, text) for text in ["赌", "博赌博"]] == [[], [(1, 1, 1, 2, "赌博")]]
+
+
+def test_conversation_stream_chunks_of_one_message(matcher):
+    from function.stream_scanner import ConversationStream
+    matcher.add_keyword(KeyWord("加微信", "x"))
+    matcher.build()
+    # final=False 的分块属于同一条消息，位置接着算；窗口按消息而不是分块计
+    stream = ConversationStream(matcher, window=1)
+    assert stream_hits(stream, "请加", final=False) == []
+    assert stream_hits(stream, "微", final=False) == []
+    assert stream_hits(stream, "信吧") == [(0, 1, 0, 3, "加微信")]
+    assert stream.message_count == 1
+    assert stream_hits(stream, "信") == []
+
+
+def test_conversation_stream_switches_snapshot_mid_stream(matcher):
+    from function.stream_scanner import ConversationStream
+    matcher.add_keyword(KeyWord("赌博", "x"))
+    matcher.build()
+    stream = ConversationStream(matcher)
+    assert stream_hits(stream, "加微") == []
+    # 新快照发布后，下一次追加用窗口里已有的文本恢复自动机状态，之前的文本能和新文本组成新关键词
+    matcher.add_keyword(KeyWord("加微信", "x"))
+    matcher.build()
+    assert stream_hits(stream, "信赌") == [(0, 0, 1, 0, "加微信")]
+    matcher.remove_keyword("赌博")
+    matcher.build()
+    assert stream_hits(stream, "博") == []
+    # 恢复时已扫描过的命中不会重复报告
+    assert stream_hits(stream, "好") == []
+
+
+# ==================== 流式脱敏 ====================
+
+def test_stream_redactor_matches_replace_for_any_chunking(matcher):
+    # 任意块大小、不小于最长命中的重叠下，分块脱敏的结果与整段 replace 相同
+    import io
+    import random
+    from function.stream_redactor import StreamRedactor
+    rng = random.Random(23)
+    alphabet = "赌博裸聊微信加禁ab12 "
+    for word in ["赌博", "裸聊", "微信", "加微信", "ab", "bab", "博裸"]:
+        matcher.add_keyword(KeyWord(word, "x"))
+    matcher.add_exemptions(["禁赌博"])
+    matcher.add_regex(r"1\d{3}", "phone")
+    matcher.build()
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        chunk_size = rng.randint(1, 7)
+        overlap = rng.randint(6, 12)
+        writer = io.StringIO()
+        StreamRedactor(matcher, overlap=overlap).redact_stream(io.StringIO(text), writer, chunk_size)
+        assert writer.getvalue() == matcher.replace(text), (text, chunk_size, overlap)
+
+
+# ==================== 命中统计 ====================
+
+def test_stats_with_empty_batches(matcher):
+    from array import array
+    matcher.add_keyword(KeyWord("赌博", "gamble"))
+    matcher.build()
+    matcher.enable_stats()
+    assert matcher.search_many_packed([]) == (array('i'), array('i', [0]))
+    assert matcher.search_many([]) == []
+    stats = matcher.stats()
+    assert stats['messages'] == 0
+    assert stats['stages']['exact']['calls'] == 0
+
+
+def test_stats_lap_ignores_empty_batches():
+    from time import perf_counter
+    from function.match_stats import MatchStats
+    stats = MatchStats()
+    stats.lap('exact', perf_counter(), 0)
+    assert stats.histograms()['exact']['calls'] == 0
+
+
+# ==================== 文本归一化 ====================
+
+@pytest.mark.parametrize("text, normalized", [
+    ("加 微-信", "加微信"),          # 中文之间的分隔符删除
+    ("加 vx", "加vx"),               # 中文与字母之间的也删除
+    ("q q", "q q"),                  # 字母之间是正常的词间空格，保留
+    ("faq, quiz", "faq, quiz"),
+    ("ＱＱ　号", "qq号"),            # 全角转半角后同样处理
+    ("賭\u200b博", "赌博"),          # 不可见字符总是删除
+    ("著名老闆", "著名老闆"),        # 会改掉别的词的异体字不转换
+])
+def test_normalizer_strips_separators_outside_latin_words(text, normalized):
+    from function.text_normalizer import TextNormalizer
+    assert TextNormalizer().normalize(text).text == normalized
+
+
+@pytest.mark.parametrize("text", ["加 微-信", "Ａ ｂ", "  前后  ", "赌\u200b博 a_b，c", "İstanbul 赌.博", ""])
+def test_normalized_text_maps_every_char_back(text):
+    # 归一化文本的每个字符都映射回原文中产生它的字符，区间映射不越界且保持顺序
+    from function.text_normalizer import TextNormalizer
+    from function.variant_chars import VARIANT_MAP
+    normalized = TextNormalizer().normalize(text)
+    positions = [normalized.span(i, i)[0] for i in range(len(normalized.text))]
+    assert positions == sorted(positions) and all(0 <= pos < len(text) for pos in positions)
+    for i, pos in enumerate(positions):
+        source = VARIANT_MAP.get(text[pos], text[pos])
+        if '\uff01' <= source <= '\uff5e':
+            source = chr(ord(source) - 0xfee0)
+        assert normalized.text[i] in source.lower()
+
+
+def test_latin_keyword_does_not_match_across_words(matcher):
+    matcher.add_keyword(KeyWord("qq", "contact"))
+    matcher.add_keyword(KeyWord("加微信", "contact"))
+    matcher.build()
+    assert list(matcher.search("faq quiz, q q")) == []
+    assert [(m.start, m.end) for m in matcher.search("QQ号，加 微.信")] == [(0, 1), (4, 8)]
+
+
+# ==================== 删除关键词 ====================
+
+def test_remove_keyword_by_variant_spelling(matcher):
+    matcher.set_case_sensitive(True)
+    matcher.add_keyword(KeyWord("VPN", "contact"))
+    matcher.add_keyword(KeyWord("vpn", "contact"))
+    # 改成不区分大小写后两条关键词的匹配形式相同，按任一写法删除都要一起删掉
+    matcher.set_case_sensitive(False)
+    assert matcher.remove_keyword("Vpn")
+    assert matcher.size() == 0
+    matcher.set_case_sensitive(True)
+    matcher.build()
+    assert list(matcher.search("vpn VPN")) == []
+    matcher.set_case_sensitive(False)
+
+
+def test_remove_keyword_by_id_drops_its_match_form(matcher):
+    matcher.set_case_sensitive(False)
+    keyword_id = matcher.add_keyword(KeyWord("VPN", "contact"))
+    assert matcher.remove_keyword(keyword_id)
+    # 匹配形式已释放，同一写法可以重新添加
+    assert matcher.add_keyword(KeyWord("vpn", "contact")) != keyword_id
+    matcher.build()
+    assert keywords_of(matcher.search("VPN")) == ['vpn']
+
+
+# ==================== 拼音匹配 ====================
+
+def test_pinyin_latin_hits_need_word_boundary():
+    from function.pinyin_index import PinyinIndex
+    index = PinyinIndex(initials=True)
+    index.build([(0, "代理"), (1, "网络赌博")])
+
+    def ids(text):
+        return sorted({keyword_id for _, _, keyword_id in index.search(text)})
+
+    # 英文单词内部的拼音不算
+    assert ids("daily report") == []
+    assert ids("newldbook") == []
+    # 独立的拼音、挨着汉字的拼音、拼音汉字混写照常命中
+    assert ids("找daili") == [0]
+    assert ids("daili,wldb") == [0, 1]
+    assert ids("代li加v") == [0]
+    assert ids("袋里") == [0]
+
+
+# ==================== 模糊匹配 ====================
+
+def test_fuzzy_prefilters_keep_matches():
+    from function.fuzzy_index import FuzzyIndex
+    index = FuzzyIndex(1)
+    index.build([(0, "网络赌博平台"), (1, "刷单")])
+    # 替换一个字、多一个字、少一个字都还能命中；短词的替换到不了 80 分
+    assert [hit[2] for hit in index.search("来网络堵博平台玩", 80)] == [0]
+    assert [hit[2] for hit in index.search("网络赌x博平台", 80)] == [0]
+    assert [hit[2] for hit in index.search("网络博平台", 80)] == [0]
+    assert [hit[2] for hit in index.search("刷x单", 80)] == [1]
+    assert index.search("刷票", 80) == []
+    assert index.search("完全无关的一句话", 80) == []
+
+
+def test_fuzzy_skips_keywords_not_longer_than_distance(matcher, capsys):
+    from function.fuzzy_index import FuzzyIndex
+    index = FuzzyIndex(1)
+    assert not index.add(0, "赌")
+    assert index.add(1, "赌博")
+    index.build([(0, "赌"), (1, "赌博"), (2, "毒")])
+    assert len(index) == 1
+    assert "2 个关键词不超过 1 个字" in capsys.readouterr().out
+    # 单字词只做精确匹配
+    matcher.add_keyword(KeyWord("毒", "drug"))
+    matcher.enable_fuzzy_match(1)
+    assert [(m.match_type, m.start) for m in matcher.search("独毒")] == [('exact', 1)]
+
+
+# ==================== 正则预过滤 ====================
+
+REGEX_RULES = [
+    # 能提取出字面量的
+    "微信", "a+b", "(微|v)信", r"1\d{2}", "b[a1]b",
+    # 提取不出字面量、可以并入组合正则的
+    r"\d{3}", r"[ab]{2}\d", "(?:a|1)(?:b|2)", r"\s\d", r"\b\w{2}\b",
+    # 反向引用、命名分组，只能单独运行
+    r"(a|b)\1", r"(?P<x>\d)(?P=x)", "(?P<y>[ab])1",
+]
+
+
+@pytest.mark.parametrize("budget", [None, 1.0])
+def test_regex_prefilter_matches_plain_finditer(matcher, capsys, budget):
+    # 预过滤（字面量自动机、组合正则的起点、单独运行的规则）只决定跑哪些规则、从哪开始，结果必须与逐条 finditer 相同
+    import random
+    import re
+    from function.regex_guard import REGEX_TIME_BUDGET
+    rng = random.Random(2)
+    try:
+        matcher.set_regex_budget(budget)
+        for _ in range(30):
+            matcher.clear()
+            for pattern in rng.sample(REGEX_RULES, 6):
+                matcher.add_regex(pattern)
+            matcher.build()
+            rules = [pattern for pattern, _ in matcher._snapshot.regex_patterns]
+            texts = ["".join(rng.choice("abA12 微信v") for _ in range(rng.randint(0, 16))) for _ in range(30)]
+            expected = [[(rule.pattern, m.start(), m.end() - 1) for rule in rules for m in rule.finditer(text)]
+                        for text in texts]
+            single = [[(m.keyword, m.start, m.end) for m in matcher.search(text)] for text in texts]
+            batch = [[(m.keyword, m.start, m.end) for m in found] for found in matcher.search_many(texts)]
+            assert single == expected
+            assert batch == expected
+            assert any(expected)
+    finally:
+        matcher.set_regex_budget(REGEX_TIME_BUDGET)
+    assert "出错" not in capsys.readouterr().out
+
+
+# ==================== 正则耗时统计 ====================
+
+def test_regex_guard_times_every_call_and_yields_lazily():
+    import re
+    from function.regex_guard import RegexGuard
+    guard = RegexGuard(budget=None)
+    guard.add_rule(nested=False)
+    pattern = re.compile(r"\d")
+    for _ in range(20):
+        assert [m.group() for m in guard.finditer(0, pattern, "a1b2")] == ['1', '2']
+        guard.search(0, pattern, "a1")
+    assert guard.calls == [40]
+    # 匹配逐个产出，调用方提前停下时也会记录这次计时
+    found = guard.finditer(0, pattern, "1" * 10000)
+    assert next(found).group() == '1'
+    found.close()
+    assert guard.calls == [41]
+
+
+def test_regex_guard_quarantines_slow_rule_after_fast_calls(capsys):
+    import re
+    from function.regex_guard import RegexGuard, has_nested_quantifier
+    # 没有嵌套量词，静态检查查不出来，但在没有数字的长串上会指数级回溯
+    source = r"(\w|\w\w)*\d"
+    assert not has_nested_quantifier(source)
+    pattern = re.compile(source)
+    guard = RegexGuard(budget=0.002)
+    guard.add_rule(nested=False)
+    for _ in range(5):
+        assert guard.search(0, pattern, "a1")
+    # 前面的调用都很快，第一次慢的调用就要隔离，之后不再运行
+    assert guard.search(0, pattern, "a" * 22) is None
+    assert 0 in guard.quarantined
+    assert list(guard.finditer(0, pattern, "a1")) == []
+    assert "[正则隔离]" in capsys.readouterr().out
+
+
+def test_regex_guard_quarantines_on_first_call(matcher, capsys):
+    from function.regex_guard import REGEX_TIME_BUDGET
+    matcher.set_regex_budget(0)
+    matcher.add_regex(r"\d+", "phone")
+    matcher.build()
+    assert [m.match_type for m in matcher.search("电话123")] == ['regex']
+    assert list(matcher.search("电话123")) == []
+    assert "[正则隔离]" in capsys.readouterr().out
+    stats = matcher.regex_stats()[0]
+    assert stats['quarantined'] and stats['calls'] == 1
+    matcher.set_regex_budget(REGEX_TIME_BUDGET)
+
+
+def test_literal_less_rule_runs_under_budget(matcher, capsys):
+    from function.regex_guard import REGEX_TIME_BUDGET
+    # 提取不出字面量、也没有嵌套量词的规则，不能在预过滤的组合正则里绕过预算
+    matcher.add_regex(r"(\w|\w\w)*\d", "slow")
+    matcher.build()
+    assert matcher._snapshot.regex_prefilter.describe()['combined_patterns'] == 0
+    matcher.set_regex_budget(0.002)
+    assert list(matcher.search("a" * 22)) == []
+    stats = matcher.regex_stats()[0]
+    assert stats['calls'] == 1 and stats['quarantined']
+    assert "[正则隔离]" in capsys.readouterr().out
+    # 不设预算时只统计，仍可并入组合正则
+    matcher.set_regex_budget(None)
+    assert matcher._snapshot.regex_prefilter.describe()['combined_patterns'] == 1
+    matcher.set_regex_budget(REGEX_TIME_BUDGET)
+    assert matcher._snapshot.regex_prefilter.describe()['combined_patterns'] == 0
+
+
+# ==================== 新消息判断 ====================
+
+def test_new_messages_tells_repeats_apart_by_time():
+    pytest.importorskip("DrissionPage")
+    from function.GetDouyinMsg import GetDouyinMsg
+    douyin_msg = GetDouyinMsg()
+    douyin_msg.user_list.clear()
+
+    def parse(element):
+        text, shown = element
+        return {'sender': 'A', 'message': text, 'timestamp': shown}
+
+    # 虚拟列表只渲染最后 3 条，同一句话重复发送时列表内容只靠时间区分
+    log = [("在吗", "10:00"), ("在吗", "10:01"), ("在吗", "10:02")]
+    assert len(douyin_msg.new_messages("u", log[-3:], parse)) == 3
+    log.append(("在吗", "10:03"))
+    assert [msg['timestamp'] for msg in douyin_msg.new_messages("u", log[-3:], parse)] == ["10:03"]
+    assert douyin_msg.new_messages("u", log[-3:], parse) == []
+    # 页面没显示时间时补成抓取时刻
+    log.append(("在吗", None))
+    found = douyin_msg.new_messages("u", log[-3:], parse)
+    assert len(found) == 1 and found[0]['timestamp']
+
+
+def test_new_messages_advance_only_after_commit():
+    pytest.importorskip("DrissionPage")
+    from function.GetDouyinMsg import GetDouyinMsg
+    douyin_msg = GetDouyinMsg()
+    douyin_msg.user_list.clear()
+
+    def parse(element):
+        text, shown = element
+        return {'sender': 'A', 'message': text, 'timestamp': shown}
+
+    log = [("你好", "10:00"), ("加微信", "10:01")]
+    # 没有确认（保存或检测出错）时，下一次仍返回同一批消息
+    assert len(douyin_msg.new_messages("u", log, parse, commit=False)) == 2
+    assert len(douyin_msg.new_messages("u", log, parse, commit=False)) == 2
+    douyin_msg.commit_messages("u")
+    assert douyin_msg.new_messages("u", log, parse, commit=False) == []
+    log.append(("转账", "10:02"))
+    assert [msg['message'] for msg in douyin_msg.new_messages("u", log, parse, commit=False)] == ["转账"]
+    douyin_msg.commit_messages("u")
+    douyin_msg.commit_messages("u")  # 重复确认不会越过之后的消息
+    log.append(("在吗", "10:03"))
+    assert [msg['message'] for msg in douyin_msg.new_messages("u", log, parse)] == ["在吗"]
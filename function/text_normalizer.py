@@ -0,0 +1,201 @@
+import re
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+from function.variant_chars import VARIANT_MAP
+
+# 零宽字符、方向控制符、变体选择符、软连字符等不可见字符
+INVISIBLE_CHARS = (
+    "\u00ad\u034f\u061c\u115f\u1160\u17b4\u17b5\u180e"
+    "\u200b\u200c\u200d\u200e\u200f\u202a\u202b\u202c\u202d\u202e"
+    "\u2060\u2061\u2062\u2063\u2064\u206a\u206b\u206c\u206d\u206e\u206f"
+    "\u3164\ufeff\uffa0"
+    + ''.join(chr(c) for c in range(0xfe00, 0xfe10))
+)
+
+# 常被插在关键词中间用来规避检测的分隔符（全角符号会先转成半角）
+SEPARATOR_CHARS = " \t\r\n\xa0*._-~|/\\,·•、，。…—"
+
+
+def _word_char(ch: str) -> bool:
+    """拉丁字母、数字等非中日韩的单词字符；两边都是这类字符的分隔符是正常的词间空格"""
+    return ch.isalnum() and ch < '\u2e80'
+
+
+class NormalizedText:
+    """
+    归一化后的文本及其到原文的位置映射
+    to_original 为 None 表示与原文逐字符对齐（最常见的情况，零额外开销）
+    """
+    __slots__ = ('original', 'text', 'to_original')
+
+    def __init__(self, original: str, text: str, to_original: Optional[array] = None):
+        self.original = original
+        self.text = text
+        self.to_original = to_original
+
+    def span(self, start: int, end: int) -> Tuple[int, int]:
+        """把归一化文本中的闭区间 [start, end] 映射回原文"""
+        to_original = self.to_original
+        if to_original is None:
+            return start, end
+        return to_original[start], to_original[end]
+
+
+def _compose(outer: Optional[array], inner: Optional[array]) -> Optional[array]:
+    """两级位置映射合成：inner 映射到中间文本，outer 再映射到原文"""
+    if inner is None:
+        return outer
+    if outer is None:
+        return inner
+    return array('i', [outer[i] for i in inner])
+
+
+def lower_text(text: str) -> NormalizedText:
+    """
+    整段文本只小写一次
+    小写后长度不变时（中文、绝大多数拉丁字母）逐字符对齐，直接复用下标；
+    只有 'İ' 这类小写后变长的字符才逐字符建立映射表
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return NormalizedText(text, lowered)
+    to_original = array('i')
+    for i, ch in enumerate(text):
+        to_original.extend([i] * len(ch.lower()))
+    return NormalizedText(text, lowered, to_original)
+
+
+class TextNormalizer:
+    """
+    可插拔的文本归一化流水线
+    全角转半角、繁简/异体字转换、删除不可见字符合并成一张 str.translate 表，
+    整段文本只过一遍 C 层的 translate，再删除分隔符、按需小写；
+    分隔符两边都是拉丁字母或数字时是单词之间的空格，不删除（否则 "q q"、"faq quiz" 都会命中 "qq"），
+    只删除中文之间、中文与字母之间的分隔符；
+    输出保留到原文的位置映射，命中区间可以映射回原文
+    """
+
+    def __init__(self, fullwidth: bool = True, variants: bool = True,
+                 strip_invisible: bool = True, strip_separators: bool = True,
+                 lowercase: bool = True):
+        self.fullwidth = fullwidth
+        self.variants = variants
+        self.strip_invisible = strip_invisible
+        self.strip_separators = strip_separators
+        self.lowercase = lowercase
+        self._extra_map: Dict[str, str] = {}
+        self._extra_strip = set()
+        self._table: Dict[int, Optional[str]] = {}
+        self._deleted = frozenset()
+        self._separators: Optional[re.Pattern] = None
+        self._compile()
+
+    def config(self) -> Dict:
+        """可序列化的配置，用于持久化"""
+        return {
+            'fullwidth': self.fullwidth,
+            'variants': self.variants,
+            'strip_invisible': self.strip_invisible,
+            'strip_separators': self.strip_separators,
+            'lowercase': self.lowercase,
+            'extra_map': dict(self._extra_map),
+            'extra_strip': ''.join(sorted(self._extra_strip)),
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'TextNormalizer':
+        normalizer = cls(
+            fullwidth=config.get('fullwidth', True),
+            variants=config.get('variants', True),
+            strip_invisible=config.get('strip_invisible', True),
+            strip_separators=config.get('strip_separators', True),
+            lowercase=config.get('lowercase', True),
+        )
+        if config.get('extra_map'):
+            normalizer.add_mapping(config['extra_map'])
+        if config.get('extra_strip'):
+            normalizer.add_strip_chars(config['extra_strip'])
+        return normalizer
+
+    def add_mapping(self, mapping: Dict[str, str]):
+        """追加单字符替换表（如自定义异体字），替换结果必须是单个字符"""
+        for src, dst in mapping.items():
+            if len(src) != 1 or len(dst) != 1:
+                raise ValueError(f"替换表只支持单字符到单字符: {src!r} -> {dst!r}")
+        self._extra_map.update(mapping)
+        self._compile()
+
+    def add_strip_chars(self, chars: Iterable[str]):
+        """追加需要删除的字符"""
+        self._extra_strip.update(chars)
+        self._compile()
+
+    def _compile(self):
+        mapping: Dict[str, str] = {}
+        if self.fullwidth:
+            # 全角 ASCII（U+FF01-U+FF5E）与全角空格
+            for code in range(0xff01, 0xff5f):
+                mapping[chr(code)] = chr(code - 0xfee0)
+            mapping['\u3000'] = ' '
+        if self.variants:
+            mapping.update(VARIANT_MAP)
+        mapping.update(self._extra_map)
+
+        deleted = set(self._extra_strip)
+        if self.strip_invisible:
+            deleted.update(INVISIBLE_CHARS)
+        # 分隔符要看两边的字符才能决定删不删，不放进 translate 表
+        separators = ''.join(sorted(set(SEPARATOR_CHARS) - deleted))
+        self._separators = re.compile(f"[{re.escape(separators)}]+") if self.strip_separators and separators else None
+
+        table: Dict[int, Optional[str]] = {}
+        for src, dst in mapping.items():
+            # 先替换再删除：全角逗号等替换后落在删除集合里的直接删掉
+            table[ord(src)] = None if dst in deleted else dst
+        for ch in deleted:
+            table[ord(ch)] = None
+        self._table = table
+        self._deleted = frozenset(deleted) | frozenset(
+            src for src, dst in mapping.items() if dst in deleted)
+
+    def normalize(self, text: str) -> NormalizedText:
+        translated = text.translate(self._table)
+        to_original = None
+        if len(translated) != len(text):
+            # 只有删除了字符才需要映射表；替换都是单字符对单字符
+            deleted = self._deleted
+            to_original = array('i', [i for i, ch in enumerate(text) if ch not in deleted])
+        if self._separators is not None:
+            stripped, kept = self._strip_separators(translated)
+            if kept is not None:
+                translated = stripped
+                to_original = _compose(to_original, kept)
+        if not self.lowercase:
+            return NormalizedText(text, translated, to_original)
+        lowered = lower_text(translated)
+        return NormalizedText(text, lowered.text, _compose(to_original, lowered.to_original))
+
+    def _strip_separators(self, text: str) -> Tuple[str, Optional[array]]:
+        """:return: (删除分隔符后的文本, 保留字符在 text 中的下标)；没有可删的分隔符时为 (text, None)"""
+        pieces = []
+        kept = None
+        pos = 0
+        last = len(text)
+        for match in self._separators.finditer(text):
+            start, end = match.span()
+            if 0 < start and end < last and _word_char(text[start - 1]) and _word_char(text[end]):
+                continue
+            if kept is None:
+                kept = array('i')
+            pieces.append(text[pos:start])
+            kept.extend(range(pos, start))
+            pos = end
+        if kept is None:
+            return text, None
+        pieces.append(text[pos:])
+        kept.extend(range(pos, last))
+        return ''.join(pieces), kept
+
+    def normalize_keyword(self, keyword: str) -> str:
+        return self.normalize(keyword).text
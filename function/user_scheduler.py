@@ -0,0 +1,68 @@
+"""
+用户检查顺序的调度
+每轮从用户列表项的未读角标和预览文本判断哪些用户有新内容：有未读的先点，其次是预览变了的，
+其余用户按上次检查的先后隔 aging 秒再看一次，没有新内容、也没到期的用户不点击
+"""
+import heapq
+import time
+from typing import Callable, List, Optional, Tuple
+
+# 没有新内容的用户最多隔多久再点开检查一次（秒），防止预览没变化的新消息被漏掉
+USER_AGING_INTERVAL = 180
+
+# 优先级档位，小的先处理
+TIER_UNREAD = 0
+TIER_CHANGED = 1
+TIER_AGING = 2
+
+
+class UserScheduler:
+    """按优先级挑选本轮要点开的用户，状态存在 GetDouyinMsg.user_list 的 UserState 里"""
+
+    def __init__(self, get_state: Callable, aging: float = USER_AGING_INTERVAL):
+        """
+        :param get_state: 用户名 -> UserState（GetDouyinMsg.get_user_state）
+        :param aging: 没有新内容的用户再次检查的间隔（秒）
+        """
+        self.get_state = get_state
+        self.aging = aging
+
+    def tier(self, entry, now: Optional[float] = None) -> Optional[int]:
+        """用户列表项的优先级档位，不需要点开时返回 None"""
+        if entry.unread:
+            return TIER_UNREAD
+        state = self.get_state(entry.name)
+        if entry.preview != state.preview:
+            return TIER_CHANGED  # 包括从没点开过的用户
+        if (time.time() if now is None else now) - state.last_visit >= self.aging:
+            return TIER_AGING
+        return None
+
+    def due(self, entries: list, limit: int, now: Optional[float] = None) -> Tuple[List, int]:
+        """
+        本轮要点开的用户
+        :param entries: GetDouyinMsg.get_user_entries() 的结果
+        :param limit: 最多返回的用户数
+        :return: (按优先级排列的 UserEntry, 其中有新内容（未读或预览变化）的个数)
+        """
+        now = time.time() if now is None else now
+        heap = []
+        seen = set()
+        for order, entry in enumerate(entries):
+            if entry.name in seen:
+                continue
+            seen.add(entry.name)
+            tier = self.tier(entry, now)
+            if tier is None:
+                continue
+            # 未读多的先处理；同档位里上次检查早的先处理，再按列表中的位置
+            rank = -entry.unread if tier == TIER_UNREAD else self.get_state(entry.name).last_visit
+            heap.append((tier, rank, order, entry))
+        batch = heapq.nsmallest(limit, heap)
+        return [item[3] for item in batch], sum(1 for item in batch if item[0] < TIER_AGING)
+
+    def visited(self, entry, now: Optional[float] = None):
+        """点开并处理完一个用户后调用，记下此时的预览文本和时间"""
+        state = self.get_state(entry.name)
+        state.preview = entry.preview
+        state.last_visit = time.time() if now is None else now
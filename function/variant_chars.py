@@ -0,0 +1,28 @@
+"""
+繁简/异体字对照表（本地内置，离线可用）
+覆盖聊天违规词中常见的繁体字，按位置一一对应
+"""
+
+TRADITIONAL = (
+    "賭博彩嫖娼淫穢蕩槍彈藥毒販詐騙錢財貸款買賣銷價碼號聯係繫帳賬戶轉額獎勵線網絡體驗"
+    "微紅發財運動員會議說話語認識記錄書頁標題簽證單據報導講師學習課時間問題檢測實際業務處理"
+    "電腦視頻圖片觀看廣告傳開關門開鎖鑰匙風險場雙開頭條經濟層級幾個們這邊還沒對嗎為什麼樣"
+    "來東車馬鳥魚龍龜貓豬雞鴨鵝寶貝愛戀婦幣銀鐵鋼銅鍋鑽針錯鏡鐘鈴長門問閃間閉閱隊陣陽陰陸險隱雜難雲電靈"
+    "顏題類顯風飛飯飲餓館首騎驗髮鬥鬧魯鮮麥黃點黨齊齒齡"
+    "優傳傷價倫偽側債傾僅僱儲兒內兩冊減則剛創劃劇劍勁勝務動勢區醫協單賣廠廳縣參變葉號吳嚇園圍國圖團壓壞壯聲處備夠頭夾奪獎嬰孫寧實審寫對專將尋導屆層屬島峽帥師帶幫幹廣廢強歸彎徑從徵愛態慣憂戰戲擁擇擊擔據擴擺擾攝攜敵數斷時晝曬書會條來極構槍樂標樣樹橋機檢歡歲歷殘殺毀氣漢滅滿漁漲潔潛澤濟濕災為烏無煙熱燈營爺牆狀獨獄獲現環產畫當療發盡監盤眾睜矯礦確碼禮禍禪種稱穩窮竊競筆節範築簡糧緊紀約級紙納純紗細終組結絕統絲經綠維網緒線練縮總織繼續罷羅聞職聽腦臉興舉艦艱藝節萬葉蘇蘭處號虧蠶術衛衝補裝裡製複見規親覺覽觀觸計訂訓託記許設訪證評詞試詩該詳誌認誤說請諸課調談論謝謀謂講謹識議護讀讓變豐豬貝負貢財責賢貨販貧購貴貿費賀資賊賞賠賦質購賽贊贏趕趨跡躍軍軟較載輕輛輪輸轉辦辭農這連進運過達違遠適選遺遲邊郵鄉鄰醜釋鑒開閒間關閣隊階際陳陸隨險雖雙雞離難電霧靜響頂項順須預領頻題額願顧飄飾餘驅驚體鬆"
+)
+
+SIMPLIFIED = (
+    "赌博彩嫖娼淫秽荡枪弹药毒贩诈骗钱财贷款买卖销价码号联系系帐账户转额奖励线网络体验"
+    "微红发财运动员会议说话语认识记录书页标题签证单据报导讲师学习课时间问题检测实际业务处理"
+    "电脑视频图片观看广告传开关门开锁钥匙风险场双开头条经济层级几个们这边还没对吗为什么样"
+    "来东车马鸟鱼龙龟猫猪鸡鸭鹅宝贝爱恋妇币银铁钢铜锅钻针错镜钟铃长门问闪间闭阅队阵阳阴陆险隐杂难云电灵"
+    "颜题类显风飞饭饮饿馆首骑验发斗闹鲁鲜麦黄点党齐齿龄"
+    "优传伤价伦伪侧债倾仅雇储儿内两册减则刚创划剧剑劲胜务动势区医协单卖厂厅县参变叶号吴吓园围国图团压坏壮声处备够头夹夺奖婴孙宁实审写对专将寻导届层属岛峡帅师带帮干广废强归弯径从征爱态惯忧战戏拥择击担据扩摆扰摄携敌数断时昼晒书会条来极构枪乐标样树桥机检欢岁历残杀毁气汉灭满渔涨洁潜泽济湿灾为乌无烟热灯营爷墙状独狱获现环产画当疗发尽监盘众睁矫矿确码礼祸禅种称稳穷窃竞笔节范筑简粮紧纪约级纸纳纯纱细终组结绝统丝经绿维网绪线练缩总织继续罢罗闻职听脑脸兴举舰艰艺节万叶苏兰处号亏蚕术卫冲补装里制复见规亲觉览观触计订训托记许设访证评词试诗该详志认误说请诸课调谈论谢谋谓讲谨识议护读让变丰猪贝负贡财责贤货贩贫购贵贸费贺资贼赏赔赋质购赛赞赢赶趋迹跃军软较载轻辆轮输转办辞农这连进运过达违远适选遗迟边邮乡邻丑释鉴开闲间关阁队阶际陈陆随险虽双鸡离难电雾静响顶项顺须预领频题额愿顾飘饰余驱惊体松"
+)
+
+assert len(TRADITIONAL) == len(SIMPLIFIED)
+
+# 繁体/异体字 -> 简体字（相同字符不入表）
+# 转换后会把别的词改掉的不收（"著名"的"著"不是"着"，"闆"也不等于"板"）
+VARIANT_MAP = {t: s for t, s in zip(TRADITIONAL, SIMPLIFIED) if t != s}
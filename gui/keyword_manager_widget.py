@@ -13,6 +13,7 @@ from database.sqlite_db import KeywordDB
 from database.mysql_pool_db import MySQLKeywordDBPool
 from config.database_config import DatabaseConfig
 from config.system_config import Config
+from function.keyword_sync import get_keyword_poller
 
 
 class KeywordManagerWidget(QWidget):
@@ -164,6 +165,15 @@ class KeywordManagerWidget(QWidget):
                 self.keyword_table.setItem(i, 2, QTableWidgetItem("keyword"))
                 self.keyword_table.setItem(i, 3, QTableWidgetItem(""))
     
+    def _sync_matcher(self):
+        """
+        关键词增删已写入变更日志，通知运行中的匹配器立即拉取，监控无需重启
+        匹配器尚未加载时不处理，首次使用时会从数据库完整加载
+        """
+        poller = get_keyword_poller()
+        if poller:
+            poller.wake()
+
     def add_keyword(self):
         """添加关键词"""
         keyword = self.keyword_input.text().strip()
@@ -176,6 +186,7 @@ class KeywordManagerWidget(QWidget):
                 success = self.db.add_keyword(keyword)
                 
             if success:
+                self._sync_matcher()
                 self.load_keywords()
                 self.keyword_input.clear()
                 QMessageBox.information(self, "成功", f"关键词 '{keyword}' 添加成功")
@@ -190,6 +201,7 @@ class KeywordManagerWidget(QWidget):
             reply = QMessageBox.question(self, "确认删除", f"确定要删除关键词 '{keyword}' 吗？")
             if reply == QMessageBox.Yes:
                 if self.db.remove_keyword(keyword):
+                    self._sync_matcher()
                     self.load_keywords()
                     QMessageBox.information(self, "成功", "删除成功")
     
@@ -198,6 +210,7 @@ class KeywordManagerWidget(QWidget):
         reply = QMessageBox.question(self, "确认清空", "确定要清空所有关键词吗？此操作不可恢复！")
         if reply == QMessageBox.Yes:
             if self.db.clear_all_keywords():
+                self._sync_matcher()
                 self.load_keywords()
                 QMessageBox.information(self, "成功", "清空成功")
     
@@ -216,6 +229,7 @@ class KeywordManagerWidget(QWidget):
                 else:
                     # SQLite批量添加
                     count = self.db.add_keywords(keywords)
+                self._sync_matcher()
                 
                 self.load_keywords()
                 QMessageBox.information(self, "导入成功", f"成功导入 {count} 个关键词")
@@ -2,7 +2,7 @@ import sys
 import os
 import time
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from DrissionPage._functions.by import By
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QGroupBox,
@@ -13,7 +13,9 @@ from PyQt5.QtCore import Qt, QThread, pyqtSignal
 # 导入项目模块
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from function.Filter import KeywordMatcher
+from function.keyword_sync import load_all_keywords, open_keyword_db, start_keyword_poller
 from function.GetDouyinMsg import GetDouyinMsg
+from function.user_scheduler import UserScheduler
 from config.system_config import Config
 from database.batch_saver import get_batch_saver, stop_batch_saver
 
@@ -27,6 +29,8 @@ class MessageDetectionThread(QThread):
         self.matcher = matcher
         self.douyin_msg = douyin_msg
         self.running = False
+        # 按未读角标和预览变化决定点开哪些用户
+        self.scheduler = UserScheduler(douyin_msg.get_user_state)
         # 首次进入监控时先进行一次刷新并等待
         self._initial_refresh_done = False
         # 初始化批量保存器
@@ -40,7 +44,8 @@ class MessageDetectionThread(QThread):
         # 刷新与批处理控制
         last_refresh_ts = 0
         REFRESH_INTERVAL = 20   # 秒
-        BATCH_SIZE = 8          # 每批处理的用户数量
+        BATCH_SIZE = 8          # 每批最多处理的用户数量
+        IDLE_WAIT = 2           # 可见用户都没有新内容时，滚动列表后的等待（秒）
         PER_USER_DWELL = 1      # 点击后页面稳定等待（秒）
         PER_USER_CYCLE = 3      # 单个用户完整处理耗时目标（秒）
 
@@ -68,10 +73,13 @@ class MessageDetectionThread(QThread):
                 now_ts = time.time()
                 if now_ts - last_refresh_ts >= REFRESH_INTERVAL:
                     try:
+                        # 刷新会让用户列表回到顶部，记下滚动位置，刷新后滚回去，下面的用户照样轮得到
+                        scroll_top = self.douyin_msg.user_list_scroll_top()
                         # 只要刷新浏览器，就等待5秒，然后等待列表条件通过
                         self.douyin_msg.refresh_page()
                         time.sleep(5)
-                        self.douyin_msg.wait_for_user_list(timeout=10)
+                        if self.douyin_msg.wait_for_user_list(timeout=10):
+                            self.douyin_msg.restore_user_list_scroll(scroll_top)
                         self.status_update.emit("定时刷新页面（20秒），已等待5秒并确认列表加载")
                     except Exception as e:
                         self.status_update.emit(f"页面刷新失败: {str(e)}")
@@ -83,25 +91,22 @@ class MessageDetectionThread(QThread):
                     if not self.douyin_msg.wait_for_user_list(timeout=10):
                         self.status_update.emit("用户列表加载超时，重试中...")
                         time.sleep(3)
-                    user_list = self.douyin_msg._get_user_list()
-                    if not user_list:
+                    entries = self.douyin_msg.get_user_entries()
+                    if not entries:
                         self.status_update.emit("未找到用户列表，等待页面加载...")
                         time.sleep(3)
                         continue
                     
-                    # 添加调试信息
-                    user_names = []
-                    for user in user_list:
-                        try:
-                            user_name = user.child().child().child().text
-                            if user_name:
-                                user_names.append(user_name)
-                        except:
-                            continue
-                    
+                    user_names = [entry.name for entry in entries]
                     self.status_update.emit(f"当前用户列表: {', '.join(user_names[:8])}{'...' if len(user_names) > 8 else ''}")
-                    # 本次只处理前 BATCH_SIZE 个用户，通过频繁刷新获取更多
-                    user_batch = user_list[:BATCH_SIZE]
+                    # 有未读或预览变化的用户优先，其余到期才检查
+                    user_batch, news = self.scheduler.due(entries, BATCH_SIZE)
+                    if not user_batch:
+                        # 可见的用户都没有新内容：滚动列表，让下面的用户也能被检查到
+                        self.douyin_msg.scroll_user_list()
+                        time.sleep(IDLE_WAIT)
+                        continue
+                    self.status_update.emit(f"本批检查 {len(user_batch)} 个用户，其中 {news} 个有新内容")
                     
                 except Exception as e:
                     self.status_update.emit(f"获取用户列表失败: {str(e)}")
@@ -109,26 +114,25 @@ class MessageDetectionThread(QThread):
                     continue
                 
                 # 遍历本批用户
-                for user in user_batch:
+                for entry in user_batch:
                     if not self.running:
                         break
                     
                     try:
-                        # 获取用户名
-                        user_name = user.child().child().child().text
-                        if not user_name:
-                            continue
-                        
-                        self.status_update.emit(f"检查用户: {user_name}")
+                        user = entry.element
+                        user_name = entry.name
+                        self.status_update.emit(f"检查用户: {user_name}" + (f"（{entry.unread} 条未读）" if entry.unread else ""))
                         
                         # 点击用户获取消息
+                        user_state = self.douyin_msg.get_user_state(user_name)
                         try:
                             user.click()
                             time.sleep(PER_USER_DWELL)  # 每个用户停留固定时长
                             
-                            # 获取抖音ID（点击后从剪贴板读取）
-                            douyin_id = self.get_douyin_id()
+                            # 获取抖音ID（点击后从剪贴板读取），同一用户只取一次
+                            douyin_id = user_state.douyin_id or self.get_douyin_id()
                             if douyin_id:
+                                user_state.douyin_id = douyin_id
                                 self.status_update.emit(f"获取到抖音ID: {douyin_id}")
                             else:
                                 self.status_update.emit("未获取到抖音ID")
@@ -136,17 +140,27 @@ class MessageDetectionThread(QThread):
                         except Exception as e:
                             self.status_update.emit(f"点击用户失败: {str(e)}")
                             continue
+                        self.scheduler.visited(entry)
                         
+                        # 只取上次之后的新消息；会话没变的用户到这里只比较一次指纹
+                        # 指纹等这批消息保存、检测都成功后才前进，中途出错下一轮重新处理，不会漏掉
+                        conversation_data = self._thr_get_new_messages(user_name)
+                        if not conversation_data:
+                            self.status_update.emit(f"用户 {user_name} 没有新消息")
+                            continue
+
                         start_ts = time.time()
-                        # 获取完整对话内容
                         try:
-                            conversation_data = self._thr_get_conversation_data(user_name)
                             if conversation_data:
                                 # 使用批量保存器保存对话到数据库（包含抖音ID）
-                                self._thr_save_conversation_to_batch(user_name, conversation_data, douyin_id)
+                                saved = self._thr_save_conversation_to_batch(user_name, conversation_data, douyin_id)
                                 
                                 # 检测违规内容
-                                self._thr_detect_violations_in_conversation(user_name, conversation_data)
+                                detected = saved and self._thr_detect_violations_in_conversation(user_name, conversation_data)
+                                if detected:
+                                    self.douyin_msg.commit_messages(user_name)
+                                else:
+                                    self.status_update.emit(f"⚠ 用户 {user_name} 的新消息处理失败，下一轮重新处理")
                                 
                                 # 抖音ID已通过批量保存器一起保存，无需单独处理
                                 if douyin_id:
@@ -176,21 +190,17 @@ class MessageDetectionThread(QThread):
                         self.status_update.emit(f"处理用户时出错: {str(e)}")
                         continue
                 
-                # 一批处理完成后，立即刷新浏览器以获取更多用户
+                # 一批处理完成后强制保存所有缓存的数据；列表靠定时刷新和滚动更新，不再每批刷新整页
                 try:
-                    self.status_update.emit("本批处理完成，刷新页面获取更多用户")
-                    
-                    # 批处理完成后强制保存所有缓存的数据
                     if self.batch_saver:
                         flush_stats = self.batch_saver.flush_all()
                         if flush_stats.get('conversations_saved', 0) > 0:
                             self.status_update.emit(f"批量保存完成: {flush_stats.get('conversations_saved', 0)} 个用户对话")
-                    
-                    self.douyin_msg.refresh_page()
-                    time.sleep(5)
-                    self.douyin_msg.wait_for_user_list(timeout=10)
+                    if not news:
+                        # 本批都是到期复查的用户，顺便滚动列表去看下面的用户
+                        self.douyin_msg.scroll_user_list()
                 except Exception as e:
-                    self.status_update.emit(f"批处理后刷新失败: {str(e)}")
+                    self.status_update.emit(f"批处理后保存失败: {str(e)}")
                 
             except Exception as e:
                 self.status_update.emit(f"检测循环错误: {str(e)}")
@@ -260,52 +270,69 @@ class MessageDetectionThread(QThread):
     def _thr_get_conversation_data(self, user_name: str) -> List[Dict]:
         try:
             message_elements = self.douyin_msg.tab.eles("xpath=//*[@class='leadsCsUI-MessageItem']")
-            conversation_data = []
-            for msg_element in message_elements:
-                try:
-                    text_element = msg_element.ele("xpath=.//*[@class='leadsCsUI-Text']")
-                    if not text_element:
-                        continue
-                    message_text = text_element.text
-                    if not message_text:
-                        continue
-                    sender = "A"
-                    msg_classes = msg_element.attr('class') or ''
-                    if 'leadsCsUI-MessageItem_right' in msg_classes:
-                        sender = "B"
-                    elif 'leadsCsUI-MessageItem_left' in msg_classes:
-                        sender = "A"
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    time_element = msg_element.ele('xpath=.//*[contains(@class, "time") or contains(@class, "timestamp")]')
-                    if time_element:
-                        try:
-                            timestamp = time_element.text
-                        except:
-                            pass
-                    conversation_data.append({'sender': sender, 'message': message_text, 'timestamp': timestamp})
-                except Exception as e:
-                    print(f"处理单个消息时出错: {e}")
-                    continue
-            return conversation_data
+            conversation = [msg for msg in map(self._thr_parse_message, message_elements) if msg]
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            for msg in conversation:
+                if msg['timestamp'] is None:
+                    msg['timestamp'] = now
+            return conversation
         except Exception as e:
             print(f"获取对话数据失败: {e}")
             return []
 
-    def _thr_save_conversation_to_batch(self, user_name: str, conversation_data: List[Dict], douyin_id: str = ""):
-        """使用批量保存器保存对话数据"""
+    def _thr_get_new_messages(self, user_name: str) -> List[Dict]:
+        """当前会话中上次检查之后新增的消息（状态保存在 GetDouyinMsg.user_list）"""
+        try:
+            message_elements = self.douyin_msg.tab.eles("xpath=//*[@class='leadsCsUI-MessageItem']")
+            return self.douyin_msg.new_messages(user_name, message_elements, self._thr_parse_message, commit=False)
+        except Exception as e:
+            print(f"获取新消息失败: {e}")
+            return []
+
+    def _thr_parse_message(self, msg_element) -> Optional[Dict]:
+        """消息元素 -> {'sender', 'message', 'timestamp'}，没有文本时返回 None；页面上没有时间时 timestamp 为 None"""
+        try:
+            text_element = msg_element.ele("xpath=.//*[@class='leadsCsUI-Text']")
+            if not text_element:
+                return None
+            message_text = text_element.text
+            if not message_text:
+                return None
+            sender = "A"
+            msg_classes = msg_element.attr('class') or ''
+            if 'leadsCsUI-MessageItem_right' in msg_classes:
+                sender = "B"
+            elif 'leadsCsUI-MessageItem_left' in msg_classes:
+                sender = "A"
+            # 页面显示的时间参与新消息判断（见 GetDouyinMsg.message_fingerprint），没有时由 new_messages 补成抓取时刻
+            timestamp = None
+            time_element = msg_element.ele('xpath=.//*[contains(@class, "time") or contains(@class, "timestamp")]')
+            if time_element:
+                try:
+                    timestamp = time_element.text or None
+                except:
+                    pass
+            return {'sender': sender, 'message': message_text, 'timestamp': timestamp}
+        except Exception as e:
+            print(f"处理单个消息时出错: {e}")
+            return None
+
+    def _thr_save_conversation_to_batch(self, user_name: str, conversation_data: List[Dict], douyin_id: str = "") -> bool:
+        """使用批量保存器保存对话数据，返回是否成功"""
         try:
             if self.batch_saver:
                 self.batch_saver.add_conversation(user_name, conversation_data, douyin_id)
                 self.status_update.emit(f"已缓存 {user_name} 的对话数据 ({len(conversation_data)} 条消息)")
-            else:
-                # 回退到单个保存
-                self._thr_save_conversation_to_db(user_name, conversation_data, douyin_id)
+                return True
+            # 回退到单个保存
+            return self._thr_save_conversation_to_db(user_name, conversation_data, douyin_id)
         except Exception as e:
             print(f"批量保存对话数据失败: {e}")
             self.status_update.emit(f"保存对话数据失败: {str(e)}")
+            return False
 
-    def _thr_save_conversation_to_db(self, user_name: str, conversation_data: List[Dict], douyin_id: str = ""):
-        """单个保存对话数据（备用方法）"""
+    def _thr_save_conversation_to_db(self, user_name: str, conversation_data: List[Dict], douyin_id: str = "") -> bool:
+        """单个保存对话数据（备用方法），返回是否成功"""
         try:
             from database.mysql_pool_db import MySQLKeywordDBPool
             from config.database_config import DatabaseConfig
@@ -317,31 +344,36 @@ class MessageDetectionThread(QThread):
                     self.status_update.emit(f"已保存 {user_name} 的对话数据 ({len(conversation_data)} 条消息)")
                 else:
                     self.status_update.emit(f"保存 {user_name} 的对话数据失败")
-            else:
-                self.status_update.emit("数据库连接失败，无法保存对话数据")
+                return bool(success)
+            self.status_update.emit("数据库连接失败，无法保存对话数据")
+            return False
         except Exception as e:
             print(f"保存对话数据到数据库失败: {e}")
             self.status_update.emit(f"保存对话数据失败: {str(e)}")
+            return False
 
-    def _thr_detect_violations_in_conversation(self, user_name: str, conversation_data: List[Dict]):
+    def _thr_detect_violations_in_conversation(self, user_name: str, conversation_data: List[Dict]) -> bool:
+        """检测一段对话并保存命中记录，返回是否完成"""
         try:
-            for msg_data in conversation_data:
-                message_text = msg_data.get('message', '')
-                if message_text:
-                    matches = list(self.matcher.search(message_text))
-                    if matches:
-                        detection_result = {
-                            'user': user_name,
-                            'message': message_text,
-                            'matches': matches,
-                            'timestamp': msg_data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
-                            'sender': msg_data.get('sender', 'A')
-                        }
-                        self._thr_save_detection_record_to_batch(detection_result)
-                        self.message_detected.emit(detection_result)
-                        self.status_update.emit(f"检测到违规内容: {user_name} ({msg_data.get('sender', 'A')}) - {message_text}")
+            # 整段对话一次批量匹配，避免逐条调用 search 的开销
+            texts = [msg_data.get('message', '') for msg_data in conversation_data]
+            all_matches = self.matcher.search_many(texts)
+            for msg_data, message_text, matches in zip(conversation_data, texts, all_matches):
+                if matches:
+                    detection_result = {
+                        'user': user_name,
+                        'message': message_text,
+                        'matches': matches,
+                        'timestamp': msg_data.get('timestamp', datetime.now().strftime('%Y-%m-%d %H:%M:%S')),
+                        'sender': msg_data.get('sender', 'A')
+                    }
+                    self._thr_save_detection_record_to_batch(detection_result)
+                    self.message_detected.emit(detection_result)
+                    self.status_update.emit(f"检测到违规内容: {user_name} ({msg_data.get('sender', 'A')}) - {message_text}")
+            return True
         except Exception as e:
             print(f"检测对话违规内容失败: {e}")
+            return False
 
     def _thr_save_detection_record_to_batch(self, detection_result: Dict):
         """使用批量保存器保存检测记录"""
@@ -409,39 +441,15 @@ class MessageDetectionWidget(QWidget):
     def load_matcher(self):
         """加载匹配器"""
         try:
+            # 尝试使用MySQL，如果失败则使用SQLite
+            db = open_keyword_db()
             if os.path.exists(Config.MATCHER_SAVE_PATH):
                 self.matcher.load(Config.MATCHER_SAVE_PATH)
             else:
-                # 从数据库加载关键词
-                from database.mysql_pool_db import MySQLKeywordDBPool
-                from database.sqlite_db import KeywordDB
-                from config.database_config import DatabaseConfig
-                
-                # 尝试使用MySQL，如果失败则使用SQLite
-                try:
-                    config = DatabaseConfig.load_config()
-                    if config:
-                        db = MySQLKeywordDBPool(config)
-                        if db.test_connection():
-                            keywords = db.get_all_keywords()
-                            for keyword_data in keywords:
-                                from BaseData.KeyWord import KeyWord
-                                kw_obj = KeyWord(keyword_data[1], keyword_data[2])  # keyword, type
-                                self.matcher.add_keyword(kw_obj)
-                        else:
-                            raise Exception("MySQL连接失败")
-                    else:
-                        raise Exception("MySQL配置不存在")
-                except:
-                    # 回退到SQLite
-                    db = KeywordDB("BaseData/violation_keywords.db")
-                    keywords = db.get_all_keywords()
-                    for keyword in keywords:
-                        from BaseData.KeyWord import KeyWord
-                        kw_obj = KeyWord(keyword)
-                        self.matcher.add_keyword(kw_obj)
-                
-                self.matcher.build()
+                # 从数据库全量加载关键词
+                load_all_keywords(self.matcher, db)
+            # 之后的关键词增删通过变更日志增量同步
+            start_keyword_poller(self.matcher, db)
         except Exception as e:
             QMessageBox.warning(self, "警告", f"加载匹配器失败: {str(e)}")
     
@@ -526,7 +534,7 @@ class MessageDetectionWidget(QWidget):
             return
         
         # 检查匹配器是否已加载
-        if not self.matcher or not self.matcher._keywords:
+        if not self.matcher or not self.matcher.size():
             QMessageBox.warning(self, "警告", "关键词匹配器未加载，请检查关键词配置")
             return
         
@@ -603,8 +611,8 @@ class MessageDetectionWidget(QWidget):
             status_info.append("✗ 浏览器未打开")
         
         # 检查匹配器状态
-        if self.matcher and self.matcher._keywords:
-            status_info.append(f"✓ 匹配器已加载，关键词数量: {len(self.matcher._keywords)}")
+        if self.matcher and self.matcher.size():
+            status_info.append(f"✓ 匹配器已加载，关键词数量: {self.matcher.size()}")
         else:
             status_info.append("✗ 匹配器未加载")
         
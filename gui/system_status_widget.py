@@ -3,7 +3,7 @@ import sys
 import os
 from datetime import datetime
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QGroupBox, QLabel, 
-                            QTextEdit, QPushButton, QHBoxLayout, QLineEdit, QMessageBox)
+                            QTextEdit, QPushButton, QHBoxLayout, QLineEdit, QMessageBox, QFileDialog)
 from PyQt5.QtCore import Qt, QTimer, QThread, pyqtSignal
 
 # 导入项目模块
@@ -14,6 +14,7 @@ from config.database_config import DatabaseConfig
 from config.system_config import Config
 from function.GetDouyinMsg import GetDouyinMsg
 from function.Filter import KeywordMatcher
+from function.keyword_sync import load_all_keywords, open_keyword_db, start_keyword_poller
 
 
 class UserMessageLogThread(QThread):
@@ -113,6 +114,20 @@ class SystemStatusWidget(QWidget):
         info_layout.addWidget(self.system_time_label)
         
         info_group.setLayout(info_layout)
+
+        # 匹配统计：各阶段耗时、命中最多/从未命中的关键词
+        stats_group = QGroupBox("匹配统计")
+        stats_layout = QHBoxLayout()
+        self.match_stats_label = QLabel("匹配统计: 未开启")
+        self.match_stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.export_stats_btn = QPushButton("导出统计")
+        self.export_stats_btn.clicked.connect(self.export_match_stats)
+        self.reset_stats_btn = QPushButton("统计清零")
+        self.reset_stats_btn.clicked.connect(self.reset_match_stats)
+        stats_layout.addWidget(self.match_stats_label, 1)
+        stats_layout.addWidget(self.export_stats_btn)
+        stats_layout.addWidget(self.reset_stats_btn)
+        stats_group.setLayout(stats_layout)
         
         # 消息检测控制区域（红框1位置，占比小）
         detection_group = QGroupBox("消息检测控制")
@@ -160,13 +175,15 @@ class SystemStatusWidget(QWidget):
         log_group.setLayout(log_layout)
         
         layout.addWidget(info_group)
+        layout.addWidget(stats_group)
         layout.addWidget(detection_group)
         layout.addWidget(log_group)
         
         # 设置布局比例：系统信息固定，检测控制小，日志区域大
         layout.setStretch(0, 0)  # 系统信息固定高度
-        layout.setStretch(1, 0)  # 检测控制固定高度
-        layout.setStretch(2, 1)   # 日志区域占据剩余空间
+        layout.setStretch(1, 0)  # 匹配统计固定高度
+        layout.setStretch(2, 0)  # 检测控制固定高度
+        layout.setStretch(3, 1)   # 日志区域占据剩余空间
         
         self.setLayout(layout)
         self.update_status()
@@ -196,37 +213,18 @@ class SystemStatusWidget(QWidget):
     def _ensure_matcher(self):
         if not hasattr(self, 'matcher'):
             self.matcher = KeywordMatcher()
-        if not getattr(self.matcher, '_keywords', None):
+        # 监控期间统计各关键词的命中次数和各阶段耗时，显示在"匹配统计"中
+        if not self.matcher.stats()['enabled']:
+            self.matcher.enable_stats()
+        if not self.matcher.size():
             try:
                 from config.system_config import Config
+                db = open_keyword_db()
                 if os.path.exists(Config.MATCHER_SAVE_PATH):
                     self.matcher.load(Config.MATCHER_SAVE_PATH)
                 else:
-                    from database.mysql_pool_db import MySQLKeywordDBPool
-                    from database.sqlite_db import KeywordDB
-                    from config.database_config import DatabaseConfig
-                    try:
-                        config = DatabaseConfig.load_config()
-                        if config:
-                            db = MySQLKeywordDBPool(config)
-                            if db.test_connection():
-                                keywords = db.get_all_keywords()
-                                for keyword_data in keywords:
-                                    from BaseData.KeyWord import KeyWord
-                                    kw_obj = KeyWord(keyword_data[1], keyword_data[2])
-                                    self.matcher.add_keyword(kw_obj)
-                            else:
-                                raise Exception("MySQL连接失败")
-                        else:
-                            raise Exception("MySQL配置不存在")
-                    except:
-                        db = KeywordDB("BaseData/violation_keywords.db")
-                        keywords = db.get_all_keywords()
-                        for keyword in keywords:
-                            from BaseData.KeyWord import KeyWord
-                            kw_obj = KeyWord(keyword)
-                            self.matcher.add_keyword(kw_obj)
-                    self.matcher.build()
+                    load_all_keywords(self.matcher, db)
+                start_keyword_poller(self.matcher, db)
             except Exception as e:
                 QMessageBox.warning(self, "警告", f"加载匹配器失败: {str(e)}")
 
@@ -241,7 +239,7 @@ class SystemStatusWidget(QWidget):
             self.add_log("检测已经在运行中")
             return
         self._ensure_matcher()
-        if not self.matcher or not self.matcher._keywords:
+        if not self.matcher or not self.matcher.size():
             QMessageBox.warning(self, "警告", "关键词匹配器未加载，请检查关键词配置")
             return
         from gui.message_detection_widget import MessageDetectionThread
@@ -287,8 +285,8 @@ class SystemStatusWidget(QWidget):
                 status_info.append(f"✗ 获取页面URL失败: {e}")
         else:
             status_info.append("✗ 浏览器未打开")
-        if hasattr(self, 'matcher') and self.matcher and getattr(self.matcher, '_keywords', None):
-            status_info.append(f"✓ 匹配器已加载，关键词数量: {len(self.matcher._keywords)}")
+        if hasattr(self, 'matcher') and self.matcher and self.matcher.size():
+            status_info.append(f"✓ 匹配器已加载，关键词数量: {self.matcher.size()}")
         else:
             status_info.append("✗ 匹配器未加载")
         if hasattr(self, 'detection_thread') and self.detection_thread and self.detection_thread.isRunning():
@@ -370,9 +368,49 @@ class SystemStatusWidget(QWidget):
                 self.matcher_status_label.setText("匹配器状态: 已加载")
             else:
                 self.matcher_status_label.setText("匹配器状态: 未保存")
+
+            self.update_match_stats()
                 
         except Exception as e:
             self.db_status_label.setText(f"数据库状态: 错误 - {str(e)}")
+
+    def update_match_stats(self):
+        """刷新匹配统计：消息数、各阶段平均/p99 耗时、命中最多的关键词"""
+        stats = KeywordMatcher().stats(top=5)  # 单例，消息检测页的检测线程也计入
+        if not stats['enabled']:
+            self.match_stats_label.setText("匹配统计: 未开启（开始监控后自动开启）")
+            return
+        lines = [f"自 {stats['since']} 起检测 {stats['messages']} 条消息，"
+                 f"命中过的关键词 {stats['keywords_hit']} 个，从未命中 {stats['unused_keywords']} 个"]
+        stages = []
+        for stage, hist in stats['stages'].items():
+            if hist['calls']:
+                p99 = f"{hist['p99_ms']:g} ms" if hist['p99_ms'] is not None else "超出分桶"
+                stages.append(f"{stage} 平均 {hist['avg_us']:.0f} us / p99 ≤ {p99}")
+        if stages:
+            lines.append("阶段耗时: " + "；".join(stages))
+        if stats['top_keywords']:
+            lines.append("命中最多: " + "，".join(f"{item['keyword']}({item['hits']})" for item in stats['top_keywords']))
+        self.match_stats_label.setText("\n".join(lines))
+
+    def export_match_stats(self):
+        """把匹配统计导出为 JSON"""
+        matcher = KeywordMatcher()
+        if not matcher.stats()['enabled']:
+            QMessageBox.information(self, "提示", "匹配统计未开启，请先开始监控")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出匹配统计", "match_stats.json", "JSON文件 (*.json)")
+        if file_path:
+            try:
+                matcher.dump_stats(file_path, top=100)
+                self.add_log(f"匹配统计已导出: {file_path}")
+            except Exception as e:
+                QMessageBox.critical(self, "导出失败", f"导出失败: {str(e)}")
+
+    def reset_match_stats(self):
+        KeywordMatcher().reset_stats()
+        self.update_match_stats()
+        self.add_log("匹配统计已清零")
     
     
     def add_log(self, message):